@@ -1,10 +1,67 @@
+from threading import Lock
+from typing import Optional
+
 from docqa.config import Settings
 from docqa.pipeline.engine import QAEngine
+from docqa.pipeline.jobs import IngestJobQueue
 
 settings = Settings()
 settings.validate()
 
-_engine = QAEngine(settings)
+# Built on first use or by `warmup()`, so importing the app never loads the index.
+_engine: Optional[QAEngine] = None
+_engine_lock = Lock()
+
+_jobs: Optional[IngestJobQueue] = None
+_jobs_lock = Lock()
 
 def get_engine() -> QAEngine:
+    """
+    Return the shared engine, building it and loading the index on first use.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = QAEngine(settings)
     return _engine
+
+
+def engine_ready() -> bool:
+    return _engine is not None
+
+
+def warmup() -> None:
+    """
+    Build the engine and start the ingestion workers ahead of the first request.
+    """
+    get_engine()
+    get_ingest_jobs()
+
+
+def get_ingest_jobs() -> IngestJobQueue:
+    """
+    Return the background ingestion queue, starting its workers on first use.
+    """
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = IngestJobQueue(
+                get_engine(),
+                db_path=settings.ingest_jobs_db,
+                spool_dir=settings.ingest_spool_dir,
+                workers=settings.ingest_workers,
+                max_queued=settings.ingest_queue_max,
+                max_attempts=settings.ingest_job_max_attempts,
+                stale_after=settings.ingest_job_stale_seconds,
+            )
+            _jobs.start()
+    return _jobs
+
+
+def shutdown_ingest_jobs() -> None:
+    global _jobs
+    with _jobs_lock:
+        if _jobs is not None:
+            _jobs.close()
+            _jobs = None
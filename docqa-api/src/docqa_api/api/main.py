@@ -1,11 +1,27 @@
+from contextlib import asynccontextmanager
+from threading import Thread
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from .deps import settings, shutdown_ingest_jobs, warmup
 from .routes import router
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the index and resume leftover ingest jobs without delaying startup;
+    # /ready reports when the engine can serve.
+    if settings.warmup_on_startup:
+        Thread(target=warmup, name="docqa-warmup", daemon=True).start()
+    yield
+    shutdown_ingest_jobs()
+
+
 app = FastAPI(
     title="Document QA API",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 app.add_middleware(
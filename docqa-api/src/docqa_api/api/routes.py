@@ -1,64 +1,167 @@
 import json
 import os
+import shutil
 import tempfile
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, Optional
 
 from fastapi import (
     APIRouter,
     Body,
     Depends,
     File,
+    Form,
     HTTPException,
+    Response,
     UploadFile,
 )
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
-from docqa.pipeline.engine import QAEngine
-from .deps import get_engine
+from docqa.pipeline.engine import DocumentNotFound, QAEngine
+from docqa.pipeline.jobs import IngestJobQueue, IngestQueueFull
+from .deps import engine_ready, get_engine, get_ingest_jobs
 
 router = APIRouter()
 
+# Prometheus text exposition format.
+_METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Uploads are copied to disk in blocks of this size, never read whole into memory.
+_UPLOAD_BLOCK_SIZE = 1024 * 1024
+
 
 @router.get("/health")
 def health() -> Dict[str, str]:
     return {"status": "ok"}
 
 
-def _save_upload_to_temp(upload: UploadFile) -> str:
-    """Save UploadFile to a temp file and return the file path."""
+@router.get("/ready")
+def ready(response: Response) -> Dict[str, str]:
+    """Readiness: 503 until the engine is built and the index is loaded."""
+    if not engine_ready():
+        response.status_code = 503
+        return {"status": "starting"}
+    return {"status": "ready"}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """Prometheus metrics; never builds the engine, so scraping a starting pod is cheap."""
+    built = engine_ready()
+    body = (
+        "# HELP docqa_engine_ready Whether the engine is built and the index loaded\n"
+        "# TYPE docqa_engine_ready gauge\n"
+        f"docqa_engine_ready {int(built)}\n"
+    )
+    if built:
+        body += get_engine().render_metrics()
+    return PlainTextResponse(body, media_type=_METRICS_CONTENT_TYPE)
+
+
+def _save_upload_to_temp(upload: UploadFile, dir: Optional[str] = None) -> str:
+    """Save UploadFile to a temp file (in `dir` if given) and return the file path."""
     suffix = ""
     if upload.filename and "." in upload.filename:
         suffix = "." + upload.filename.rsplit(".", 1)[-1].lower()
 
-    fd, path = tempfile.mkstemp(prefix="docqa_", suffix=suffix)
+    fd, path = tempfile.mkstemp(prefix="docqa_", suffix=suffix, dir=dir)
     os.close(fd)
 
     with open(path, "wb") as f:
-        f.write(upload.file.read())
+        shutil.copyfileobj(upload.file, f, _UPLOAD_BLOCK_SIZE)
 
     return path
 
 
-@router.post("/ingest")
-def ingest(file: UploadFile = File(...), engine: QAEngine = Depends(get_engine)) -> Dict[str, Any]:
+async def _enqueue(
+    file: UploadFile,
+    jobs: IngestJobQueue,
+    *,
+    document_id: Optional[str],
+    mode: str,
+) -> Dict[str, Any]:
     if not file.filename:
         raise HTTPException(400, "Missing filename")
 
-    tmp = _save_upload_to_temp(file)
+    ext = file.filename.rsplit(".", 1)[-1].lower()
+    if ext not in {"pdf", "json"}:
+        raise HTTPException(400, "Upload a .pdf or .json file")
+
+    document_id = document_id or file.filename
+    path = await run_in_threadpool(_save_upload_to_temp, file, str(jobs.spool_dir))
     try:
-        ext = file.filename.rsplit(".", 1)[-1].lower()
-        fn = {"pdf": engine.ingest_pdf, "json": engine.ingest_json}.get(ext)
-        if not fn:
-            raise HTTPException(400, "Upload a .pdf or .json file")
-        return {"status": "ok", "ingest": fn(tmp), "file_type": ext}
-    finally:
-        try:
-            os.remove(tmp)
-        except OSError:
-            pass
+        job_id = jobs.submit(
+            path, file_type=ext, filename=file.filename, document_id=document_id, mode=mode)
+    except IngestQueueFull as exc:
+        os.remove(path)
+        raise HTTPException(503, str(exc), headers={"Retry-After": "30"})
+
+    return {"status": "queued", "job_id": job_id, "file_type": ext, "document_id": document_id}
+
+
+@router.post("/ingest", status_code=202)
+async def ingest(
+    file: UploadFile = File(...),
+    document_id: Optional[str] = Form(None),
+    jobs: IngestJobQueue = Depends(get_ingest_jobs),
+) -> Dict[str, Any]:
+    """
+    Spool the upload and enqueue it for background ingestion. Poll GET /ingest/{job_id}.
+    Chunks are tagged with `document_id` (default: the filename).
+    """
+    return await _enqueue(file, jobs, document_id=document_id, mode="add")
+
+
+@router.get("/ingest/{job_id}")
+def ingest_status(job_id: str, jobs: IngestJobQueue = Depends(get_ingest_jobs)) -> Dict[str, Any]:
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, f"Unknown job_id={job_id}")
+    return job
+
+
+@router.get("/documents")
+def list_documents(engine: QAEngine = Depends(get_engine)) -> Dict[str, Any]:
+    return {"documents": engine.list_documents()}
+
+
+@router.put("/documents/{document_id}", status_code=202)
+async def upsert_document(
+    document_id: str,
+    file: UploadFile = File(...),
+    jobs: IngestJobQueue = Depends(get_ingest_jobs),
+) -> Dict[str, Any]:
+    """
+    Replace every chunk of document_id with the upload's, in the background; only
+    changed chunks are embedded. Poll GET /ingest/{job_id}.
+    """
+    return await _enqueue(file, jobs, document_id=document_id, mode="upsert")
+
+
+@router.delete("/documents/{document_id}")
+async def delete_document(document_id: str, engine: QAEngine = Depends(get_engine)) -> Dict[str, Any]:
+    try:
+        return await run_in_threadpool(engine.delete_document, document_id)
+    except DocumentNotFound:
+        raise HTTPException(404, f"Unknown document_id={document_id}")
+
+
+def _filters(payload: Dict[str, Any], engine: QAEngine) -> Optional[Dict[str, Any]]:
+    """Validate the optional 'filters' object of a request body (400 if invalid)."""
+    filters = payload.get("filters")
+    if filters is None:
+        return None
+    if not isinstance(filters, dict):
+        raise HTTPException(status_code=400, detail="'filters' must be a JSON object.")
+    try:
+        engine.check_filters(filters)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return filters
 
 
 @router.post("/answer")
-def answer(
+async def answer(
     payload: Dict[str, Any] = Body(...),
     engine: QAEngine = Depends(get_engine),
 ) -> Dict[str, Any]:
@@ -69,22 +172,59 @@ def answer(
             detail="Request body must be JSON with key 'question' as a non-empty string.",
         )
 
-    return engine.answer(question.strip())
+    return await engine.aanswer(question.strip(), filters=_filters(payload, engine))
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post("/answer/stream")
+async def answer_stream(
+    payload: Dict[str, Any] = Body(...),
+    engine: QAEngine = Depends(get_engine),
+) -> StreamingResponse:
+    """
+    Server-sent events: `sources` first, then `token` events as the LLM generates,
+    then `done` with the full answer and timings.
+    """
+    question = payload.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise HTTPException(
+            status_code=400,
+            detail="Request body must be JSON with key 'question' as a non-empty string.",
+        )
+
+    filters = _filters(payload, engine)
+
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event in engine.astream_answer(question.strip(), filters=filters):
+                yield _sse(event["event"], event["data"])
+        except Exception as exc:
+            yield _sse("error", {"detail": f"{type(exc).__name__}: {exc}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @router.post("/answer/batch")
-def answer_batch(
+async def answer_batch(
     file: UploadFile = File(...),
     engine: QAEngine = Depends(get_engine),
 ):
     if not (file.filename or "").endswith(".json"):
         raise HTTPException(400, "Upload a .json file")
 
-    data = json.loads(file.file.read().decode())
+    data = json.loads((await file.read()).decode())
     qs = data if isinstance(data, list) else data["questions"]
+    filters = None if isinstance(data, list) else _filters(data, engine)
+
+    # De-duplicate while keeping input order; failed questions map to {"error": ...}.
+    questions = list(dict.fromkeys(q.strip() for q in qs if isinstance(q, str) and q.strip()))
+    results = await engine.aanswer_many(questions, filters=filters)
 
-    return {
-        q.strip(): engine.answer(q.strip())["answer"]
-        for q in qs
-        if isinstance(q, str) and q.strip()
-    }
+    return {r["question"]: {"error": r["error"]} if r.get("error") else r["answer"] for r in results}
@@ -1,9 +1,15 @@
 import pytest
 import json
 import tempfile
+import time
 from pathlib import Path
 from fastapi.testclient import TestClient
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
 from docqa_api.api.main import app
+from docqa_api.api import deps
+from docqa_api.api.deps import get_engine, get_ingest_jobs
+from docqa.pipeline.jobs import IngestJobQueue
 from docqa.config import Settings
 from docqa.pipeline.engine import QAEngine
 
@@ -61,6 +67,11 @@ def test_settings(temp_dir):
         llm_model="qwen2.5:7b",
         embed_model="nomic-embed-text",
         faiss_index_dir=str(Path(temp_dir) / "faiss_index"),
+        embed_cache_path=str(Path(temp_dir) / "embed_cache.sqlite"),
+        answer_cache_path=str(Path(temp_dir) / "answer_cache.sqlite"),
+        faiss_full_vectors_path=str(Path(temp_dir) / "full_vectors.sqlite"),
+        ingest_jobs_db=str(Path(temp_dir) / "ingest_jobs.sqlite"),
+        ingest_spool_dir=str(Path(temp_dir) / "ingest_spool"),
         chunk_size=500,
         chunk_overlap=50,
     )
@@ -73,9 +84,13 @@ def qa_engine(test_settings):
 
 
 @pytest.fixture
-def client():
-    """FastAPI TestClient fixture for API tests."""
-    return TestClient(app)
+def client(test_settings, monkeypatch):
+    """FastAPI TestClient whose global engine and job queue store under a temporary directory."""
+    monkeypatch.setattr(deps, "settings", test_settings)
+    monkeypatch.setattr(deps, "_engine", None)
+    monkeypatch.setattr(deps, "_jobs", None)
+    yield TestClient(app)
+    deps.shutdown_ingest_jobs()
 
 
 @pytest.fixture
@@ -90,4 +105,63 @@ def post_batch(client):
 def ingested_engine(qa_engine, sample_json_file):
     """Return a QAEngine with `sample_json_file` already ingested."""
     qa_engine.ingest_json(sample_json_file)
-    return qa_engine
\ No newline at end of file
+    return qa_engine
+
+
+@pytest.fixture
+def fake_engine(test_settings, monkeypatch):
+    """Return QAEngine wired to deterministic offline embeddings and LLM."""
+    monkeypatch.setattr(
+        "docqa.pipeline.engine.make_embeddings", lambda s: DeterministicFakeEmbedding(size=32))
+    monkeypatch.setattr(
+        "docqa.pipeline.engine.make_llm", lambda s: FakeListChatModel(responses=["AWS"]))
+    return QAEngine(settings=test_settings)
+
+
+@pytest.fixture
+def fake_jobs(fake_engine, temp_dir):
+    """Background ingestion queue feeding `fake_engine`."""
+    jobs = IngestJobQueue(
+        fake_engine,
+        db_path=Path(temp_dir) / "jobs.sqlite",
+        spool_dir=Path(temp_dir) / "spool",
+        workers=1,
+    )
+    jobs.start()
+    yield jobs
+    jobs.close()
+
+
+@pytest.fixture
+def fake_client(fake_engine, fake_jobs):
+    """TestClient whose routes use `fake_engine` instead of the global engine."""
+    app.dependency_overrides[get_engine] = lambda: fake_engine
+    app.dependency_overrides[get_ingest_jobs] = lambda: fake_jobs
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_engine, None)
+    app.dependency_overrides.pop(get_ingest_jobs, None)
+
+
+@pytest.fixture
+def wait_for_job(fake_client):
+    """Poll a background ingestion job until it finishes and return it."""
+    def _wait(job_id, timeout=10.0):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            job = fake_client.get(f"/ingest/{job_id}").json()
+            if job["status"] in {"succeeded", "failed"}:
+                return job
+            time.sleep(0.02)
+        raise AssertionError(f"ingest job {job_id} did not finish")
+    return _wait
+
+
+@pytest.fixture
+def ingest_file(fake_client, wait_for_job):
+    """Upload a file through /ingest and wait for its background job to finish."""
+    def _ingest(path, filename=None, timeout=10.0):
+        with open(path, "rb") as f:
+            response = fake_client.post("/ingest", files={"file": (filename or Path(path).name, f)})
+        assert response.status_code == 202
+        return wait_for_job(response.json()["job_id"], timeout=timeout)
+    return _ingest
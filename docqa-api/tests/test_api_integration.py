@@ -19,6 +19,7 @@ class TestAPIIntegration:
                 llm_model="qwen2.5:7b",
                 embed_model="nomic-embed-text",
                 faiss_index_dir=str(Path(temp_dir) / "faiss_index"),
+                embed_cache_path=str(Path(temp_dir) / "embed_cache.sqlite"),
                 chunk_size=500,
                 chunk_overlap=50,
             )
@@ -1,4 +1,6 @@
+import json
 import pytest
+from docqa_api.api import deps
 
 
 @pytest.mark.unit
@@ -11,10 +13,42 @@ class TestAPI:
         data = response.json()
         assert data["status"] == "ok"
 
+    def test_ready_reports_engine_state(self, client, fake_engine, monkeypatch):
+        monkeypatch.setattr(deps, "_engine", None)
+        assert client.get("/ready").status_code == 503
+
+        monkeypatch.setattr(deps, "_engine", fake_engine)
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()["status"] == "ready"
+
+    def test_metrics_do_not_build_the_engine(self, client, fake_engine, monkeypatch):
+        monkeypatch.setattr(deps, "_engine", None)
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+        assert "docqa_engine_ready 0" in response.text
+        assert deps._engine is None
+
+        monkeypatch.setattr(deps, "_engine", fake_engine)
+        fake_engine.answer("Which cloud provider is used?")
+        text = client.get("/metrics").text
+        assert "docqa_engine_ready 1" in text
+        assert 'docqa_answers_total{outcome="not_found"} 1.0' in text
+        assert "docqa_index_vectors 0" in text
+
     def test_ingest_missing_file(self, client):
         response = client.post("/ingest")
         assert response.status_code == 422
 
+    def test_ingest_rejects_unsupported_file_type(self, fake_client):
+        response = fake_client.post("/ingest", files={"file": ("notes.txt", "hello")})
+        assert response.status_code == 400
+
+    def test_ingest_status_unknown_job(self, fake_client):
+        response = fake_client.get("/ingest/does-not-exist")
+        assert response.status_code == 404
+
     def test_answer_missing_payload(self, client):
         response = client.post("/answer", json={})
         assert response.status_code == 400
@@ -55,3 +89,78 @@ class TestAPI:
         assert len(data) == 2
         assert "What is the company name?" in data
         assert "Which cloud provider is used?" in data
+
+    def test_answer_batch_reports_failed_questions(self, fake_client, fake_engine, ingest_file, sample_json_file, monkeypatch):
+        ingest_file(sample_json_file)
+        answer_many = fake_engine.aanswer_many
+
+        async def failing_second(questions, **kwargs):
+            results = await answer_many(questions, **kwargs)
+            results[1] = fake_engine._error_result(questions[1], TimeoutError("LLM timed out"))
+            return results
+
+        monkeypatch.setattr(fake_engine, "aanswer_many", failing_second)
+        response = fake_client.post("/answer/batch", files={"file": ("q.json", json.dumps(
+            ["Which cloud provider is used?", "What is the company name?"]))})
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "Which cloud provider is used?": "AWS",
+            "What is the company name?": {"error": "TimeoutError: LLM timed out"},
+        }
+
+    def test_ingest_then_answer(self, fake_client, ingest_file, sample_json_file):
+        job = ingest_file(sample_json_file)
+        assert job["status"] == "succeeded"
+        assert job["result"]["chunks_added"] > 0
+
+        response = fake_client.post("/answer", json={"question": "Which cloud provider is used?"})
+        assert response.status_code == 200
+        assert response.json()["answer"] == "AWS"
+
+    def test_answer_with_filters(self, fake_client, ingest_file, sample_json_file):
+        ingest_file(sample_json_file)
+
+        response = fake_client.post(
+            "/answer",
+            json={"question": "Which cloud provider is used?", "filters": {"source_type": "json"}},
+        )
+        assert response.status_code == 200
+        assert {s["source_type"] for s in response.json()["sources"]} == {"json"}
+
+        response = fake_client.post(
+            "/answer", json={"question": "Which cloud provider is used?", "filters": {"author": "x"}})
+        assert response.status_code == 400
+
+    def test_documents_list_upsert_and_delete(self, fake_client, ingest_file, wait_for_job, sample_json_file):
+        ingest_file(sample_json_file)
+        assert fake_client.get("/documents").json()["documents"][0]["document_id"] == "sample.json"
+
+        with open(sample_json_file, "rb") as f:
+            response = fake_client.put("/documents/sample.json", files={"file": ("sample.json", f)})
+        assert response.status_code == 202
+        job = wait_for_job(response.json()["job_id"])
+        assert job["status"] == "succeeded"
+        assert job["result"]["chunks_reused"] > 0
+
+        response = fake_client.delete("/documents/sample.json")
+        assert response.status_code == 200
+        assert response.json()["chunks_deleted"] > 0
+        assert fake_client.get("/documents").json()["documents"] == []
+        assert fake_client.delete("/documents/missing.json").status_code == 404
+
+    def test_answer_stream_emits_sse_events(self, fake_client, ingest_file, sample_json_file):
+        ingest_file(sample_json_file)
+
+        response = fake_client.post("/answer/stream", json={"question": "Which cloud provider is used?"})
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        events = [line.split(": ", 1)[1] for line in response.text.splitlines() if line.startswith("event: ")]
+        assert events[0] == "sources"
+        assert "token" in events
+        assert events[-1] == "done"
+
+    def test_answer_stream_missing_payload(self, client):
+        response = client.post("/answer/stream", json={})
+        assert response.status_code == 400
@@ -0,0 +1,346 @@
+"""
+Offline performance benchmarks for the DocQA engine.
+
+Uses the fake embedding and LLM providers (no network, deterministic), so numbers
+reflect this code rather than a model server; add latency with --embed-latency-ms and
+--llm-latency-ms to see how the pipeline overlaps provider round trips.
+
+    python benchmarks/run.py --out results.json
+    python benchmarks/run.py --out new.json --compare results.json --tolerance 0.2
+
+Results are JSON: run metadata, detailed results, and a flat "metrics" map used for
+comparison. Metrics ending in "_per_s" are better when higher, all others when lower.
+With --compare, the run exits with status 1 if any metric regressed beyond the tolerance.
+"""
+import argparse
+import json
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Sequence
+
+import faiss
+from langchain_core.documents import Document
+
+from docqa.config import Settings
+from docqa.llm.context import context_budget, pack_context
+from docqa.llm.prompts import build_grounded_prompt
+from docqa.pipeline.engine import QAEngine
+from docqa.retrieval import retrieve
+
+DOCUMENTS = Path(__file__).resolve().parents[2] / "documents"
+RETRIEVAL_TYPES = ["similarity", "mmr", "similarity_score_threshold", "hybrid"]
+
+
+def bench_settings(work_dir: Path, args: argparse.Namespace, **overrides: Any) -> Settings:
+    local = work_dir / ".local"
+    return Settings(
+        llm_provider="fake",
+        embed_provider="fake",
+        fake_embed_latency_ms=args.embed_latency_ms,
+        fake_llm_latency_ms=args.llm_latency_ms,
+        faiss_index_dir=str(local / "faiss_index"),
+        faiss_full_vectors_path=str(local / "full_vectors.sqlite"),
+        embed_cache_enabled=False,
+        embed_cache_path=str(local / "embed_cache.sqlite"),
+        answer_cache_backend="none",
+        query_cache_max_entries=0,
+        faiss_max_segments=0,
+        **overrides,
+    )
+
+
+def percentiles(samples_ms: Sequence[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "p50_ms": round(pick(0.50), 4),
+        "p90_ms": round(pick(0.90), 4),
+        "p99_ms": round(pick(0.99), 4),
+        "mean_ms": round(statistics.fmean(ordered), 4),
+    }
+
+
+def timed(fn: Callable[[], Any]) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000.0
+
+
+def with_peak_memory(fn: Callable[[], Any]):
+    """
+    (result, peak Python heap bytes) of fn. FAISS allocates natively, so index memory
+    shows up in the process peak RSS reported separately, not here. Tracing slows
+    Python code down several times, so never time a traced run.
+    """
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def questions() -> List[str]:
+    rows = json.loads((DOCUMENTS / "sample_json.json").read_text(encoding="utf-8"))
+    return [row["question"] for row in rows if row.get("question")]
+
+
+# -----------------------
+# Ingest
+# -----------------------
+def bench_ingest(args: argparse.Namespace) -> Dict[str, Any]:
+    files = {
+        "pdf": (DOCUMENTS / "soc2-type2.pdf", QAEngine.ingest_pdf),
+        "json": (DOCUMENTS / "sample_json.json", QAEngine.ingest_json),
+    }
+    results: Dict[str, Any] = {}
+    for name, (path, ingest) in files.items():
+        runs = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as tmp:
+                engine = QAEngine(settings=bench_settings(Path(tmp), args))
+                start = time.perf_counter()
+                result = ingest(engine, path)
+                runs.append((time.perf_counter() - start, result))
+        seconds, result = min(runs, key=lambda run: run[0])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = QAEngine(settings=bench_settings(Path(tmp), args))
+            _, peak = with_peak_memory(lambda: ingest(engine, path))
+        results[name] = {
+            "file": path.name,
+            "seconds": round(seconds, 4),
+            "pages": result["ingested_pages"],
+            "chunks": result["chunks_added"],
+            "pages_per_s": round(result["ingested_pages"] / seconds, 2),
+            "chunks_per_s": round(result["chunks_added"] / seconds, 2),
+            "peak_heap_bytes": peak,
+        }
+    return results
+
+
+# -----------------------
+# Retrieval and context packing
+# -----------------------
+def synthetic_corpus(base_texts: Sequence[str], size: int, seed: int = 0) -> List[Document]:
+    """
+    `size` distinct chunk-sized documents built from the real chunks, each with a few
+    words swapped in from the corpus vocabulary so no two embed identically.
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted({word for text in base_texts for word in text.split()})
+    docs = []
+    for i in range(size):
+        words = base_texts[i % len(base_texts)].split()
+        for _ in range(max(1, len(words) // 10)):
+            words[rng.randrange(len(words))] = rng.choice(vocabulary)
+        docs.append(Document(
+            page_content=" ".join(words),
+            metadata={"source": f"synthetic-{i // 100}.txt", "source_type": "text", "page": i % 100},
+        ))
+    return docs
+
+
+def base_chunks(args: argparse.Namespace) -> List[str]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = QAEngine(settings=bench_settings(Path(tmp), args))
+        engine.ingest_pdf(DOCUMENTS / "soc2-type2.pdf")
+        engine.ingest_json(DOCUMENTS / "sample_json.json")
+        store = engine.vector_store
+        return [store.docstore.search(doc_id).page_content for doc_id in store.index_to_docstore_id.values()]
+
+
+def bench_retrieval(args: argparse.Namespace) -> Dict[str, Any]:
+    texts = base_chunks(args)
+    queries = questions()
+    results: Dict[str, Any] = {"sizes": {}, "context": {}}
+
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            settings = bench_settings(Path(tmp), args, dedup_enabled=False, chunk_size=4000)
+            engine = QAEngine(settings=settings)
+            corpus = synthetic_corpus(texts, size)
+            start = time.perf_counter()
+            engine.ingest_documents(corpus)
+            build_s = time.perf_counter() - start
+            snapshot = engine._snapshot
+            per_type: Dict[str, Any] = {
+                "chunks": snapshot.store.index.ntotal,
+                "build_seconds": round(build_s, 4),
+                "index_bytes": int(faiss.serialize_index(snapshot.store.index).size),
+            }
+
+            for retrieval_type in RETRIEVAL_TYPES:
+                mode = settings.model_copy(update={"retrieval_type": retrieval_type})
+                options = {"lexical": snapshot.lexical, "metadata": snapshot.metadata}
+                for q in queries[:3]:
+                    retrieve(snapshot.store, q, mode, **options)  # warm up
+                samples = [
+                    timed(lambda q=q: retrieve(snapshot.store, q, mode, **options))
+                    for q in (queries * (args.queries // len(queries) + 1))[:args.queries]
+                ]
+                per_type[retrieval_type] = percentiles(samples)
+
+            if size == args.sizes[-1]:
+                results["context"] = bench_context(engine, settings, queries)
+            results["sizes"][str(size)] = per_type
+    return results
+
+
+def bench_context(engine: QAEngine, settings: Settings, queries: Sequence[str]) -> Dict[str, Any]:
+    """
+    Cost of turning retrieved chunks into the prompt context (pack_context), which
+    replaced the old `_build_context`.
+    """
+    snapshot = engine._snapshot
+    retrieved = []
+    for q in queries:
+        docs, scores = retrieve(snapshot.store, q, settings, lexical=snapshot.lexical, metadata=snapshot.metadata)
+        retrieved.append((q, list(zip(docs, scores or [0.0] * len(docs)))))
+
+    samples, tokens = [], []
+    for q, docs_and_scores in retrieved:
+        budget = context_budget(
+            num_ctx=settings.llm_num_ctx,
+            answer_tokens=settings.context_answer_tokens,
+            prompt_tokens=engine._count_tokens(build_grounded_prompt(context="", question=q)),
+            max_tokens=settings.context_max_tokens,
+        )
+        start = time.perf_counter()
+        packed = pack_context(docs_and_scores, budget=budget, count_tokens=engine._count_tokens)
+        samples.append((time.perf_counter() - start) * 1000.0)
+        tokens.append(packed.tokens)
+    return {**percentiles(samples), "chunks_in": settings.retrieval_k, "mean_tokens": round(statistics.fmean(tokens), 1)}
+
+
+# -----------------------
+# End-to-end answers
+# -----------------------
+def bench_answers(args: argparse.Namespace) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = QAEngine(settings=bench_settings(Path(tmp), args))
+        engine.ingest_pdf(DOCUMENTS / "soc2-type2.pdf")
+        engine.ingest_json(DOCUMENTS / "sample_json.json")
+        queries = questions()
+
+        single = [timed(lambda q=q: engine.answer(q)) for q in queries]
+        start = time.perf_counter()
+        engine.answer_many(queries)
+        batch_s = time.perf_counter() - start
+    return {
+        "answer": percentiles(single),
+        "answer_many_questions_per_s": round(len(queries) / batch_s, 2),
+    }
+
+
+# -----------------------
+# Output and comparison
+# -----------------------
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    metrics: Dict[str, float] = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool) and (
+                key.endswith(("_ms", "_per_s", "_bytes", "seconds"))):
+            metrics[name] = value
+    return metrics
+
+
+def compare(
+    metrics: Dict[str, float],
+    baseline: Dict[str, float],
+    tolerance: float,
+    min_delta_ms: float = 0.0,
+) -> List[str]:
+    """
+    Descriptions of the metrics that got worse than baseline by more than tolerance.
+    Latencies that moved by less than min_delta_ms are timer noise, not regressions.
+    """
+    regressions = []
+    for name, value in sorted(metrics.items()):
+        old = baseline.get(name)
+        if not old:
+            continue
+        if name.endswith("_ms") and abs(value - old) < min_delta_ms:
+            continue
+        change = (value - old) / old
+        worse = -change if name.endswith("_per_s") else change
+        if worse > tolerance:
+            regressions.append(f"{name}: {old} -> {value} ({change:+.1%})")
+    return regressions
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv: Sequence[str] = ()) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000],
+                        help="Index sizes (chunks) for the retrieval benchmark")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries per retrieval type and size")
+    parser.add_argument("--repeat", type=int, default=3, help="Ingest runs per file; the fastest is kept")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--out", type=Path, help="Write results JSON here (default: stdout)")
+    parser.add_argument("--compare", type=Path, help="Baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed relative slowdown before a metric counts as regressed")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Ignore latency changes smaller than this when comparing")
+    args = parser.parse_args(list(argv))
+
+    results = {
+        "ingest": bench_ingest(args),
+        "retrieval": bench_retrieval(args),
+        "answers": bench_answers(args),
+        "memory": {"peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024},
+    }
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+        },
+        "results": results,
+        "metrics": flatten(results),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        args.out.write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))["metrics"]
+        regressions = compare(report["metrics"], baseline, args.tolerance, args.min_delta_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,23 @@
+from .embeddings import CachedEmbeddings, EmbeddingStore
+from .query import QueryEmbeddingCache, normalize_query
+from .answers import (
+    AnswerCache,
+    MemoryAnswerCache,
+    SQLiteAnswerCache,
+    answer_cache_key,
+    make_answer_cache,
+)
+from .singleflight import SingleFlight
+
+__all__ = [
+    CachedEmbeddings,
+    EmbeddingStore,
+    QueryEmbeddingCache,
+    normalize_query,
+    AnswerCache,
+    MemoryAnswerCache,
+    SQLiteAnswerCache,
+    answer_cache_key,
+    make_answer_cache,
+    SingleFlight,
+]
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple, Union
+
+from docqa.config import Settings
+from docqa.cache.query import normalize_query
+
+# Puts between exact row counts, which pick up entries written by other processes.
+_RECOUNT_PUTS = 1000
+
+
+def answer_cache_key(
+    question: str,
+    *,
+    index_version: Optional[str],
+    settings: Settings,
+    filters: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Key an answer by everything that can change it: the question, the index contents,
+    the models, the retrieval and index layout settings, how the context is packed and
+    any metadata filters.
+    """
+    parts = {
+        "question": normalize_query(question),
+        "index_version": index_version,
+        "llm": [settings.llm_provider, settings.llm_model, settings.llm_temperature],
+        "embed": [settings.embed_provider, settings.embed_model],
+        "retrieval": [
+            settings.retrieval_type,
+            settings.retrieval_k,
+            settings.retrieval_fetch_k,
+            settings.retrieval_lambda_mult,
+            settings.score_threshold,
+            settings.faiss_rerank,
+            settings.faiss_rerank_factor,
+            settings.hybrid_rrf_k,
+        ],
+        "index": [
+            settings.faiss_index_type,
+            settings.faiss_compression,
+            settings.faiss_pq_m,
+            settings.faiss_hnsw_ef_search,
+            settings.faiss_ivf_nprobe,
+        ],
+        "context": [
+            settings.llm_num_ctx,
+            settings.context_max_tokens,
+            settings.context_answer_tokens,
+            settings.context_tokenizer,
+            settings.context_merge_overlaps,
+        ],
+    }
+    if filters:
+        parts["filters"] = filters
+    raw = json.dumps(parts, sort_keys=True, default=sorted)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+    """
+    Base class for answer caches. Entries expire after `ttl_s` seconds (0 = never) and
+    the least recently used entries are evicted beyond `max_entries`.
+    """
+
+    def __init__(self, *, ttl_s: float = 0.0, max_entries: int = 10_000):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get(key)
+        with self._counter_lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        self._put(key, value)
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_s > 0 and now - created_at > self.ttl_s
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def _put(self, key: str, value: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._counter_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / total) if total else None,
+            "entries": len(self),
+        }
+
+
+class MemoryAnswerCache(AnswerCache):
+    """
+    Process-local answer cache.
+    """
+
+    def __init__(self, *, ttl_s: float = 0.0, max_entries: int = 10_000):
+        super().__init__(ttl_s=ttl_s, max_entries=max_entries)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = Lock()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            created_at, value = entry
+            if self._expired(created_at, now):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class SQLiteAnswerCache(AnswerCache):
+    """
+    Disk-backed answer cache. WAL mode lets several worker processes share one file.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        *,
+        ttl_s: float = 0.0,
+        max_entries: int = 10_000,
+    ):
+        super().__init__(ttl_s=ttl_s, max_entries=max_entries)
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS answers_last_used ON answers(last_used)")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS answers_created_at ON answers(created_at)")
+        self._conn.commit()
+        # Rows in the table as of this connection's last write, so a put needn't count them.
+        self._count = self._recount()
+        self._puts = 0
+
+    def _recount(self) -> int:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()
+        return count
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM answers WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self._expired(created_at, now):
+                self._count -= self._conn.execute(
+                    "DELETE FROM answers WHERE key = ?", (key,)).rowcount
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return json.loads(value)
+
+    def _put(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        row = (json.dumps(value), now, now, key)
+        with self._lock:
+            updated = self._conn.execute(
+                "UPDATE answers SET value = ?, created_at = ?, last_used = ? WHERE key = ?", row
+            ).rowcount
+            if not updated:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO answers (value, created_at, last_used, key)"
+                    " VALUES (?, ?, ?, ?)",
+                    row,
+                )
+                self._count += 1
+            if self.ttl_s > 0:
+                self._count -= self._conn.execute(
+                    "DELETE FROM answers WHERE created_at < ?", (now - self.ttl_s,)).rowcount
+            self._puts += 1
+            if self._puts % _RECOUNT_PUTS == 0:
+                self._count = self._recount()
+            excess = self._count - self.max_entries
+            if excess > 0:
+                self._count -= self._conn.execute(
+                    "DELETE FROM answers WHERE key IN ("
+                    " SELECT key FROM answers ORDER BY last_used ASC LIMIT ?)",
+                    (excess,),
+                ).rowcount
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._recount()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def make_answer_cache(settings: Settings) -> Optional[AnswerCache]:
+    """
+    Returns an answer cache based on Settings, or None when disabled.
+    Supported: none, memory, sqlite
+    """
+    backend = settings.answer_cache_backend.lower()
+
+    if backend == "none":
+        return None
+
+    if backend == "memory":
+        return MemoryAnswerCache(
+            ttl_s=settings.answer_cache_ttl_s,
+            max_entries=settings.answer_cache_max_entries,
+        )
+
+    if backend == "sqlite":
+        return SQLiteAnswerCache(
+            settings.answer_cache_path,
+            ttl_s=settings.answer_cache_ttl_s,
+            max_entries=settings.answer_cache_max_entries,
+        )
+
+    raise ValueError(f"Unsupported answer_cache_backend={backend}")
@@ -0,0 +1,246 @@
+import asyncio
+import hashlib
+import sqlite3
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# SQLite limits the number of bound parameters per statement.
+_SQL_BATCH = 500
+
+# Writes between full row counts; other processes sharing the file are seen at these.
+_RECOUNT_PUTS = 1000
+
+
+def _text_key(namespace: str, text: str) -> str:
+    return hashlib.sha256(f"{namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent key -> vector table backed by SQLite.
+    Entries beyond `max_entries` are evicted least-recently-used first.
+    """
+
+    def __init__(self, path: Union[str, Path], *, max_entries: int = 500_000):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        # Kept up to date by put_many and _evict instead of counting rows on every write.
+        self._count = self._recount()
+        self._puts = 0
+
+    def _recount(self) -> int:
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        return count
+
+    def _stored(self, keys: List[str]) -> int:
+        stored = 0
+        for start in range(0, len(keys), _SQL_BATCH):
+            batch = keys[start:start + _SQL_BATCH]
+            marks = ",".join("?" * len(batch))
+            (count,) = self._conn.execute(
+                f"SELECT COUNT(*) FROM embeddings WHERE key IN ({marks})", batch
+            ).fetchone()
+            stored += count
+        return stored
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        if not keys:
+            return found
+
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), _SQL_BATCH):
+                batch = list(keys[start:start + _SQL_BATCH])
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+                if rows:
+                    self._conn.execute(
+                        f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})",
+                        [now, *batch],
+                    )
+            self._conn.commit()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+
+        now = time.time()
+        rows = [
+            (key, np.asarray(vec, dtype=np.float32).tobytes(), now)
+            for key, vec in items.items()
+        ]
+        with self._lock:
+            stored = self._stored(list(items))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._count += len(rows) - stored
+            self._puts += 1
+            if self._puts % _RECOUNT_PUTS == 0:
+                self._count = self._recount()
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        excess = self._count - self.max_entries
+        if excess > 0:
+            self._count -= self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN ("
+                " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            ).rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._recount()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def embed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embed several queries in one provider request. `Embeddings` has no batched query
+    method; the supported providers (Ollama, OpenAI) embed a query exactly like a
+    document, so `embed_documents` is used unless the model defines `embed_queries`.
+    """
+    batched = getattr(embeddings, "embed_queries", None)
+    if batched is not None:
+        return batched(texts)
+    return embeddings.embed_documents(texts)
+
+
+async def aembed_queries(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    batched = getattr(embeddings, "aembed_queries", None)
+    if batched is not None:
+        return await batched(texts)
+    return await embeddings.aembed_documents(texts)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that reuses document vectors across ingests.
+
+    Vectors are keyed by (namespace, sha256(text)); the namespace should identify the
+    embedding provider and model so switching models never serves stale vectors.
+    Query embeddings are passed straight through to the wrapped model.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        store: EmbeddingStore,
+        *,
+        namespace: str,
+    ):
+        self.underlying = underlying
+        self.store = store
+        self.namespace = namespace
+
+        self.hits = 0
+        self.misses = 0
+        self._counter_lock = Lock()
+
+    @staticmethod
+    def _missing(keys: List[str], texts: List[str], found: Dict[str, List[float]]) -> Dict[str, str]:
+        # Embed each distinct missing text once, even if repeated within the batch.
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return missing
+
+    def _record(self, total: int, missed: int) -> None:
+        with self._counter_lock:
+            self.misses += missed
+            self.hits += total - missed
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [_text_key(self.namespace, t) for t in texts]
+        found = self.store.get_many(keys)
+        missing = self._missing(keys, texts, found)
+
+        if missing:
+            vectors = self.underlying.embed_documents(list(missing.values()))
+            # Round through float32 (what FAISS stores) so hits and misses agree exactly.
+            vectors = np.asarray(vectors, dtype=np.float32).tolist()
+            fresh = dict(zip(missing.keys(), vectors))
+            self.store.put_many(fresh)
+            found.update(fresh)
+
+        self._record(len(texts), len(missing))
+        return [found[key] for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [_text_key(self.namespace, t) for t in texts]
+        found = await asyncio.to_thread(self.store.get_many, keys)
+        missing = self._missing(keys, texts, found)
+
+        if missing:
+            vectors = await self.underlying.aembed_documents(list(missing.values()))
+            vectors = np.asarray(vectors, dtype=np.float32).tolist()
+            fresh = dict(zip(missing.keys(), vectors))
+            await asyncio.to_thread(self.store.put_many, fresh)
+            found.update(fresh)
+
+        self._record(len(texts), len(missing))
+        return [found[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.underlying.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.underlying.aembed_query(text)
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Several queries in one request, passed through like `embed_query`.
+        """
+        return embed_queries(self.underlying, texts)
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await aembed_queries(self.underlying, texts)
+
+    def stats(self, since: Optional[Dict[str, Optional[float]]] = None) -> Dict[str, Optional[float]]:
+        """
+        Hits and misses since the wrapper was created, or since `since`, an earlier
+        result of stats() (e.g. taken when an ingest started).
+        """
+        with self._counter_lock:
+            hits, misses = self.hits, self.misses
+        if since is not None:
+            hits, misses = hits - since["hits"], misses - since["misses"]
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / total) if total else None,
+            "entries": len(self.store),
+        }
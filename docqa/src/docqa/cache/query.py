@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from docqa.cache.embeddings import aembed_queries, embed_queries
+
+
+def normalize_query(text: str) -> str:
+    """
+    Collapse whitespace so trivially different spellings of a question share cache entries.
+    """
+    return " ".join(text.split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded in-memory LRU of query vectors keyed by (namespace, normalized query).
+    The namespace should identify the embedding provider and model.
+    """
+
+    def __init__(self, embeddings: Embeddings, *, namespace: str, max_entries: int = 1024):
+        self.embeddings = embeddings
+        self.namespace = namespace
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+        self._lock = Lock()
+
+    def _lookup(self, key: Tuple[str, str]) -> Optional[List[float]]:
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return vector
+
+    def _store(self, key: Tuple[str, str], vector: List[float]) -> None:
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def embed_query(self, text: str) -> List[float]:
+        query = normalize_query(text)
+        key = (self.namespace, query)
+
+        vector = self._lookup(key)
+        if vector is None:
+            # Embed outside the lock so concurrent misses don't serialize on the provider.
+            vector = self.embeddings.embed_query(query)
+            self._store(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        query = normalize_query(text)
+        key = (self.namespace, query)
+
+        vector = self._lookup(key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(query)
+            self._store(key, vector)
+        return vector
+
+    def _lookup_many(self, texts: Sequence[str]) -> Tuple[List[Tuple[str, str]], Dict[Tuple[str, str], List[float]], List[str]]:
+        """
+        Cache keys of texts, the vectors found, and the distinct queries still to embed.
+        """
+        keys = [(self.namespace, normalize_query(t)) for t in texts]
+        found: Dict[Tuple[str, str], List[float]] = {}
+        missing: Dict[Tuple[str, str], str] = {}
+        for key in keys:
+            if key in found or key in missing:
+                continue
+            vector = self._lookup(key)
+            if vector is None:
+                missing[key] = key[1]
+            else:
+                found[key] = vector
+        return keys, found, list(missing.values())
+
+    def _store_many(
+        self,
+        keys: List[Tuple[str, str]],
+        found: Dict[Tuple[str, str], List[float]],
+        queries: List[str],
+        vectors: List[List[float]],
+    ) -> List[List[float]]:
+        for query, vector in zip(queries, vectors):
+            key = (self.namespace, query)
+            self._store(key, vector)
+            found[key] = vector
+        return [found[key] for key in keys]
+
+    def embed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        """
+        `embed_query` for several texts: all misses are embedded in one request.
+        """
+        keys, found, missing = self._lookup_many(texts)
+        vectors = embed_queries(self.embeddings, missing) if missing else []
+        return self._store_many(keys, found, missing, vectors)
+
+    async def aembed_queries(self, texts: Sequence[str]) -> List[List[float]]:
+        keys, found, missing = self._lookup_many(texts)
+        vectors = await aembed_queries(self.embeddings, missing) if missing else []
+        return self._store_many(keys, found, missing, vectors)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            hits, misses, entries = self.hits, self.misses, len(self._entries)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": (hits / total) if total else None,
+            "entries": entries,
+        }
@@ -0,0 +1,91 @@
+import asyncio
+from threading import Event, Lock
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    def __init__(self):
+        self.done = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs the work and
+    callers arriving while it runs wait for it and share its result (or exception).
+    Nothing is kept once the work finishes; remembering results is the answer cache's job.
+
+    `do` coalesces threads, `ado` coroutines running on the same event loop.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self._tasks: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], "asyncio.Task"] = {}
+
+        self.leaders = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        loop_key = (asyncio.get_running_loop(), key)
+        with self._lock:
+            task = self._tasks.get(loop_key)
+            if task is None:
+                task = asyncio.ensure_future(fn())
+                self._tasks[loop_key] = task
+                task.add_done_callback(lambda t: self._finished(loop_key, t))
+                self.leaders += 1
+            else:
+                self.shared += 1
+        # A waiter being cancelled (e.g. its client disconnected) must not cancel the
+        # work the other waiters are sharing.
+        return await asyncio.shield(task)
+
+    def _finished(self, loop_key: Tuple[asyncio.AbstractEventLoop, Hashable], task: "asyncio.Task") -> None:
+        with self._lock:
+            self._tasks.pop(loop_key, None)
+        if not task.cancelled():
+            # Retrieve the exception so it isn't reported as unhandled when no waiter is left.
+            task.exception()
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._lock:
+            leaders, shared = self.leaders, self.shared
+            in_flight = len(self._calls) + len(self._tasks)
+        total = leaders + shared
+        return {
+            "leaders": leaders,
+            "shared": shared,
+            "shared_rate": (shared / total) if total else None,
+            "in_flight": in_flight,
+        }
@@ -1,2 +1,2 @@
-from .splitter import split_documents
-__all__ = [split_documents]
\ No newline at end of file
+from .splitter import split_documents, iter_split_documents
+__all__ = [split_documents, iter_split_documents]
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterable, Iterator, List
 from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
@@ -16,3 +16,22 @@ def split_documents(
         add_start_index=add_start_index,
     )
     return splitter.split_documents(docs)
+
+
+def iter_split_documents(
+    docs: Iterable[Document],
+    *,
+    chunk_size: int = 1000,
+    overlap: int = 200,
+    add_start_index: bool = True,
+) -> Iterator[Document]:
+    """
+    Lazily split docs one at a time, so only the current doc's chunks are in memory.
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=overlap,
+        add_start_index=add_start_index,
+    )
+    for doc in docs:
+        yield from splitter.split_documents([doc])
\ No newline at end of file
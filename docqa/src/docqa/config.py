@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from typing import List
+
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -15,9 +17,9 @@ class Settings(BaseSettings):
     # -----------------------
     # Providers
     # -----------------------
-    llm_provider: str = Field(default="ollama", description="ollama | openai")
+    llm_provider: str = Field(default="ollama", description="ollama | openai | fake (offline)")
     embed_provider: str = Field(
-        default="ollama", description="ollama | openai")
+        default="ollama", description="ollama | openai | fake (offline)")
 
     # -----------------------
     # Models
@@ -27,35 +29,191 @@ class Settings(BaseSettings):
     llm_temperature: float = Field(
         default=0.0, description="0.0 for deterministic QA")
     llm_num_ctx: int = Field(
-        default=4096, description="Ollama context window tokens (if supported)")
+        default=4096, description="Model context window in tokens (passed to Ollama as num_ctx)")
 
     embed_model: str = Field(default="nomic-embed-text",
                              description="e.g. nomic-embed-text or text-embedding-3-small")
 
+    # -----------------------
+    # Provider HTTP connections
+    # -----------------------
+    http_max_connections: int = Field(
+        default=64, description="Connections to the LLM/embeddings server, shared by all clients")
+    http_max_keepalive: int = Field(
+        default=32, description="Idle connections kept open for reuse")
+    http_keepalive_expiry_s: float = Field(
+        default=60.0, description="Seconds an idle connection is kept open")
+    http_connect_timeout_s: float = Field(default=10.0)
+    http_timeout_s: float = Field(
+        default=300.0, description="Read/write timeout; generation on a busy server can be slow")
+
+    # -----------------------
+    # Embedding requests
+    # -----------------------
+    embed_batch_size: int = Field(
+        default=16, description="Texts sent to the embeddings provider per request")
+    embed_max_concurrency: int = Field(
+        default=4, description="Embedding requests in flight at once")
+    embed_max_retries: int = Field(
+        default=5, description="Retries of a request failing with a transient error (timeout, 429, 5xx)")
+    embed_retry_backoff_s: float = Field(
+        default=0.5, description="First retry delay; doubles on every further retry")
+    embed_requests_per_minute: float = Field(
+        default=0, description="Rate limit on embedding requests, e.g. your OpenAI tier; 0 = none")
+    embed_tokens_per_minute: float = Field(
+        default=0, description="Rate limit on embedded tokens (estimated), e.g. your OpenAI tier; 0 = none")
+
+    # -----------------------
+    # Prompt context
+    # -----------------------
+    context_max_tokens: int = Field(
+        default=0, description="Token budget for retrieved chunks; 0 = whatever llm_num_ctx leaves")
+    context_answer_tokens: int = Field(
+        default=512, description="Tokens of llm_num_ctx reserved for the answer")
+    context_tokenizer: str = Field(
+        default="estimate", description="estimate (from characters) | tiktoken")
+    context_merge_overlaps: bool = Field(
+        default=True, description="Merge overlapping chunks of the same page into one passage")
+
     # -----------------------
     # Chunking
     # -----------------------
     chunk_size: int = Field(default=1000)
     chunk_overlap: int = Field(default=200)
+    dedup_enabled: bool = Field(
+        default=True, description="Skip chunks whose text is already indexed (exact or near-duplicate)")
+    dedup_simhash_distance: int = Field(
+        default=3, description="Max differing bits of 64-bit SimHashes for near-duplicates; -1 = exact only")
+
+    # -----------------------
+    # PDF parsing
+    # -----------------------
+    pdf_parse_workers: int = Field(
+        default=1, description="Processes extracting PDF pages in parallel; 1 parses in-process")
+    pdf_pages_per_task: int = Field(
+        default=16, description="Pages handed to a parse worker at a time")
 
     # -----------------------
     # Retrieval
     # -----------------------
     retrieval_type: str = Field(
-        default="similarity", description="similarity | mmr | similarity_score_threshold")
+        default="similarity", description="similarity | mmr | similarity_score_threshold | hybrid")
     retrieval_k: int = Field(
         default=100, description="How many chunks to return")
     retrieval_fetch_k: int = Field(
-        default=50, description="MMR only: candidates to fetch before reranking")
+        default=300, description="MMR / hybrid: candidates to fetch before reranking or fusion (at least retrieval_k)")
     retrieval_lambda_mult: float = Field(
         default=0.5, description="MMR only: 0=more diverse, 1=more relevant")
     score_threshold: float = Field(
         default=0.0, description="Only for similarity_score_threshold")
+    bm25_enabled: bool = Field(
+        default=True, description="Maintain a BM25 lexical index next to the vectors (needed by hybrid)")
+    hybrid_rrf_k: int = Field(
+        default=60, description="Hybrid: reciprocal rank fusion constant; higher flattens rank weights")
+    filter_fields: List[str] = Field(
+        default=["source", "source_type", "page", "row_index"],
+        description="Chunk metadata fields indexed for filtered retrieval")
+    batch_max_concurrency: int = Field(
+        default=8, description="Questions retrieved/generated in parallel by answer_many")
+    query_cache_max_entries: int = Field(
+        default=1024, description="In-memory LRU of query vectors; 0 disables")
+
+    # -----------------------
+    # Answering
+    # -----------------------
+    not_found_token: str = Field(
+        default="Answer not found in the document.",
+        description="Returned when nothing relevant is retrieved or the LLM answers empty")
+    coalesce_answers: bool = Field(
+        default=True, description="Concurrent identical questions share one retrieval and LLM call")
+    answer_timings: bool = Field(
+        default=True, description="Add per-stage timings (ms) to answers")
 
     # -----------------------
     # Vector store persistence
     # -----------------------
     faiss_index_dir: str = Field(default="./.local/faiss_index")
+    faiss_index_type: str = Field(
+        default="flat", description="flat (exact) | hnsw | ivf; convert existing indexes with rebuild")
+    faiss_hnsw_m: int = Field(default=32, description="HNSW: graph neighbours per node")
+    faiss_hnsw_ef_construction: int = Field(default=40, description="HNSW: build-time beam width")
+    faiss_hnsw_ef_search: int = Field(
+        default=64, description="HNSW: query-time beam width; higher = better recall, slower")
+    faiss_ivf_nlist: int = Field(default=1024, description="IVF: number of clusters")
+    faiss_ivf_nprobe: int = Field(
+        default=16, description="IVF: clusters scanned per query; higher = better recall, slower")
+    faiss_compression: str = Field(
+        default="none", description="none | fp16 | sq8 | pq: how vectors are stored in the index")
+    faiss_pq_m: int = Field(
+        default=128, description="PQ: bytes per vector; must divide the embedding dimension")
+    faiss_min_points_per_centroid: int = Field(
+        default=39,
+        description="IVF / PQ: vectors per centroid needed to train; smaller indexes stay flat / uncompressed")
+    faiss_rerank: bool = Field(
+        default=False, description="Re-rank candidates exactly against full vectors kept on disk")
+    faiss_rerank_factor: int = Field(
+        default=4, description="Re-rank: candidates fetched per requested chunk")
+    faiss_full_vectors_path: str = Field(default="./.local/full_vectors.sqlite")
+    faiss_mmap: bool = Field(
+        default=False, description="Memory-map index segments read-only instead of loading them")
+    faiss_max_segments: int = Field(
+        default=8, description="Index segments before a background compaction; 0 disables it")
+    faiss_max_deleted_fraction: float = Field(
+        default=0.2, description="Share of deleted (tombstoned) chunks before a background compaction")
+
+    # -----------------------
+    # Background ingestion
+    # -----------------------
+    ingest_workers: int = Field(
+        default=2, description="Background threads processing queued ingest jobs")
+    ingest_queue_max: int = Field(
+        default=100, description="Queued jobs before new uploads are rejected")
+    ingest_job_max_attempts: int = Field(
+        default=3, description="Runs of a job whose worker died before it is marked failed")
+    ingest_job_stale_seconds: float = Field(
+        default=300.0, description="Heartbeat age after which a running job counts as abandoned")
+    ingest_jobs_db: str = Field(default="./.local/ingest_jobs.sqlite")
+    ingest_spool_dir: str = Field(
+        default="./.local/ingest_spool", description="Uploaded files waiting to be ingested")
+    ingest_batch_size: int = Field(
+        default=64, description="Chunks embedded and indexed per batch while streaming a file")
+    ingest_spill_chunks: int = Field(
+        default=20000,
+        description="Chunks an ingest holds in memory before writing them to an unpublished segment on disk")
+
+    # -----------------------
+    # Embedding cache
+    # -----------------------
+    embed_cache_enabled: bool = Field(
+        default=True, description="Reuse chunk embeddings across ingests")
+    embed_cache_path: str = Field(default="./.local/embed_cache.sqlite")
+    embed_cache_max_entries: int = Field(
+        default=500_000, description="Least recently used vectors are evicted beyond this")
+
+    # -----------------------
+    # Answer cache
+    # -----------------------
+    answer_cache_backend: str = Field(
+        default="memory", description="none | memory | sqlite (shared across workers)")
+    answer_cache_path: str = Field(default="./.local/answer_cache.sqlite")
+    answer_cache_ttl_s: float = Field(
+        default=86_400.0, description="Seconds before a cached answer expires; 0 = never")
+    answer_cache_max_entries: int = Field(default=10_000)
+
+    # -----------------------
+    # API server
+    # -----------------------
+    warmup_on_startup: bool = Field(
+        default=True, description="Build the engine in the background at startup, not on first request")
+
+    # -----------------------
+    # Fake providers (offline tests and benchmarks)
+    # -----------------------
+    fake_embed_dim: int = Field(default=384)
+    fake_embed_latency_ms: float = Field(
+        default=0.0, description="Simulated round trip per embedding request")
+    fake_llm_latency_ms: float = Field(
+        default=0.0, description="Simulated generation time per LLM call")
 
     # -----------------------
     # OpenAI
@@ -63,18 +221,93 @@ class Settings(BaseSettings):
     openai_api_key: str | None = Field(default=None)
 
     def validate(self) -> None:
-        allowed = {"ollama", "openai"}
+        allowed = {"ollama", "openai", "fake"}
         if self.llm_provider not in allowed:
             raise ValueError(
                 f"Invalid llm_provider={self.llm_provider}. Allowed: {allowed}")
         if self.embed_provider not in allowed:
             raise ValueError(
                 f"Invalid embed_provider={self.embed_provider}. Allowed: {allowed}")
-        if self.retrieval_type not in {"similarity", "mmr", "similarity_score_threshold"}:
+        if self.fake_embed_dim <= 0:
+            raise ValueError("fake_embed_dim must be > 0")
+        if self.fake_embed_latency_ms < 0 or self.fake_llm_latency_ms < 0:
+            raise ValueError("fake_embed_latency_ms and fake_llm_latency_ms must be >= 0")
+        if self.http_max_connections <= 0 or self.http_max_keepalive < 0:
+            raise ValueError("http_max_connections must be > 0 and http_max_keepalive >= 0")
+        if self.http_connect_timeout_s <= 0 or self.http_timeout_s <= 0:
+            raise ValueError("http_connect_timeout_s and http_timeout_s must be > 0")
+        if self.embed_batch_size <= 0 or self.embed_max_concurrency <= 0:
+            raise ValueError("embed_batch_size and embed_max_concurrency must be > 0")
+        if self.embed_max_retries < 0 or self.embed_retry_backoff_s < 0:
+            raise ValueError("embed_max_retries and embed_retry_backoff_s must be >= 0")
+        if self.embed_requests_per_minute < 0 or self.embed_tokens_per_minute < 0:
+            raise ValueError("embed_requests_per_minute and embed_tokens_per_minute must be >= 0")
+        if self.retrieval_type not in {"similarity", "mmr", "similarity_score_threshold", "hybrid"}:
             raise ValueError(
-                "Invalid retrieval_type. Allowed: similarity | mmr | similarity_score_threshold"
+                "Invalid retrieval_type. Allowed: similarity | mmr | similarity_score_threshold | hybrid"
             )
+        if self.retrieval_type == "hybrid" and not self.bm25_enabled:
+            raise ValueError("retrieval_type=hybrid requires bm25_enabled")
+        if self.hybrid_rrf_k <= 0:
+            raise ValueError("hybrid_rrf_k must be > 0")
         if self.retrieval_k <= 0:
             raise ValueError("retrieval_k must be > 0")
+        if self.retrieval_fetch_k < self.retrieval_k:
+            raise ValueError("retrieval_fetch_k must be >= retrieval_k")
         if self.chunk_size <= 0:
             raise ValueError("chunk_size must be > 0")
+        if not -1 <= self.dedup_simhash_distance <= 16:
+            raise ValueError("dedup_simhash_distance must be between -1 and 16")
+        if self.pdf_parse_workers <= 0:
+            raise ValueError("pdf_parse_workers must be > 0")
+        if self.pdf_pages_per_task <= 0:
+            raise ValueError("pdf_pages_per_task must be > 0")
+        if self.batch_max_concurrency <= 0:
+            raise ValueError("batch_max_concurrency must be > 0")
+        if self.query_cache_max_entries < 0:
+            raise ValueError("query_cache_max_entries must be >= 0")
+        if self.faiss_index_type not in {"flat", "hnsw", "ivf"}:
+            raise ValueError("Invalid faiss_index_type. Allowed: flat | hnsw | ivf")
+        if self.faiss_compression not in {"none", "fp16", "sq8", "pq"}:
+            raise ValueError("Invalid faiss_compression. Allowed: none | fp16 | sq8 | pq")
+        for name in (
+            "faiss_hnsw_m",
+            "faiss_hnsw_ef_construction",
+            "faiss_hnsw_ef_search",
+            "faiss_ivf_nlist",
+            "faiss_ivf_nprobe",
+            "faiss_pq_m",
+            "faiss_min_points_per_centroid",
+            "faiss_rerank_factor",
+        ):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name} must be > 0")
+        if self.llm_num_ctx <= 0:
+            raise ValueError("llm_num_ctx must be > 0")
+        if self.context_max_tokens < 0 or self.context_answer_tokens < 0:
+            raise ValueError("context_max_tokens and context_answer_tokens must be >= 0")
+        if self.context_tokenizer not in {"estimate", "tiktoken"}:
+            raise ValueError("Invalid context_tokenizer. Allowed: estimate | tiktoken")
+        if self.faiss_max_segments < 0:
+            raise ValueError("faiss_max_segments must be >= 0")
+        if not 0.0 <= self.faiss_max_deleted_fraction <= 1.0:
+            raise ValueError("faiss_max_deleted_fraction must be between 0 and 1")
+        if self.ingest_workers <= 0:
+            raise ValueError("ingest_workers must be > 0")
+        if self.ingest_queue_max <= 0:
+            raise ValueError("ingest_queue_max must be > 0")
+        if self.ingest_job_max_attempts <= 0:
+            raise ValueError("ingest_job_max_attempts must be > 0")
+        if self.ingest_job_stale_seconds <= 0:
+            raise ValueError("ingest_job_stale_seconds must be > 0")
+        if self.ingest_batch_size <= 0:
+            raise ValueError("ingest_batch_size must be > 0")
+        if self.ingest_spill_chunks <= 0:
+            raise ValueError("ingest_spill_chunks must be > 0")
+        if self.embed_cache_max_entries <= 0:
+            raise ValueError("embed_cache_max_entries must be > 0")
+        if self.answer_cache_backend not in {"none", "memory", "sqlite"}:
+            raise ValueError(
+                "Invalid answer_cache_backend. Allowed: none | memory | sqlite")
+        if self.answer_cache_max_entries <= 0:
+            raise ValueError("answer_cache_max_entries must be > 0")
@@ -1,11 +1,62 @@
+from .ann import (
+    build_index,
+    bytes_per_vector,
+    configure_search,
+    SegmentedIndex,
+    index_compression_of,
+    index_type_of,
+    rebuild_faiss,
+    trained_layout,
+)
+from .bm25 import BM25Index, tokenize
+from .dedup import DedupIndex
+from .metadata import MetadataIndex
+from .vectors import FullVectorStore
 from .faiss_store import (
     load_faiss,
     save_faiss,
+    embed_documents,
     add_documents_to_faiss,
+    extend_faiss,
+    merge_segments,
+    read_manifest,
+    write_segment,
+    load_segment,
+    discard_segments,
+    append_segment,
+    compact_segments,
+    load_lexical,
+    read_index_version,
+    bump_index_version,
 )
 
 __all__ = [
+    build_index,
+    bytes_per_vector,
+    configure_search,
+    SegmentedIndex,
+    index_compression_of,
+    index_type_of,
+    rebuild_faiss,
+    trained_layout,
+    BM25Index,
+    tokenize,
+    DedupIndex,
+    MetadataIndex,
+    FullVectorStore,
     load_faiss,
     save_faiss,
+    embed_documents,
     add_documents_to_faiss,
+    extend_faiss,
+    merge_segments,
+    read_manifest,
+    write_segment,
+    load_segment,
+    discard_segments,
+    append_segment,
+    compact_segments,
+    load_lexical,
+    read_index_version,
+    bump_index_version,
 ]
\ No newline at end of file
@@ -0,0 +1,323 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+
+INDEX_TYPES = {"flat", "hnsw", "ivf"}
+COMPRESSIONS = {"none", "fp16", "sq8", "pq"}
+
+# FAISS k-means (IVF lists, PQ codebooks) wants this many training vectors per centroid
+# and places centroids badly below it.
+MIN_POINTS_PER_CENTROID = 39
+# 8-bit PQ codes: 256 centroids per sub-quantizer.
+_PQ_CENTROIDS = 256
+
+
+class SegmentedIndex:
+    """
+    Several FAISS indexes searched as one, positions numbered across them in order (like
+    faiss.IndexShards with successive ids, which takes no search parameters and cannot
+    reconstruct). Segments are never modified: `segmented` returns a new index sharing
+    them, so adding a segment costs nothing per indexed vector and readers keep
+    searching the old index meanwhile.
+    """
+
+    def __init__(self, segments: Sequence):
+        self.segments = tuple(segments)
+        self.offsets = np.cumsum([0] + [s.ntotal for s in self.segments]).astype(np.int64)
+        self.ntotal = int(self.offsets[-1])
+        self.d = self.segments[0].d
+        self.metric_type = self.segments[0].metric_type
+        self.is_trained = True
+
+    def _parts(self, ids: np.ndarray) -> np.ndarray:
+        return np.searchsorted(self.offsets, ids, side="right") - 1
+
+    def search(self, x: np.ndarray, k: int, params=None) -> Tuple[np.ndarray, np.ndarray]:
+        if params is not None:
+            raise ValueError("restrict searches of a SegmentedIndex with metadata.search_ids_many")
+        hits = []
+        for segment, offset in zip(self.segments, self.offsets):
+            scores, ids = segment.search(x, min(k, segment.ntotal))
+            hits.append((scores, np.where(ids >= 0, ids + offset, -1)))
+        import faiss
+
+        return merge_hits(hits, k, inner=self.metric_type == faiss.METRIC_INNER_PRODUCT)
+
+    def reconstruct_batch(self, ids) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.empty((len(ids), self.d), dtype=np.float32)
+        parts = self._parts(ids)
+        for part in np.unique(parts):
+            found = parts == part
+            vectors[found] = index_vectors(self.segments[part], ids[found] - self.offsets[part])
+        return vectors
+
+    def reconstruct_n(self, i0: int, n: int) -> np.ndarray:
+        return self.reconstruct_batch(np.arange(i0, i0 + n, dtype=np.int64))
+
+    def reconstruct(self, i: int) -> np.ndarray:
+        return self.reconstruct_batch([i])[0]
+
+
+def segmented(index, extra) -> SegmentedIndex:
+    """
+    index followed by extra, searched as one; neither is copied or modified.
+    """
+    segments: List = []
+    for part in (index, extra):
+        segments.extend(part.segments if isinstance(part, SegmentedIndex) else [part])
+    return SegmentedIndex(segments)
+
+
+def merge_hits(hits: Sequence[Tuple[np.ndarray, np.ndarray]], k: int, *, inner: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The best k of several (scores, ids) search results over the same queries, in FAISS
+    units (higher is better for inner product, lower for L2). Missing hits keep id -1.
+    """
+    scores = np.concatenate([s for s, _ in hits], axis=1)
+    ids = np.concatenate([i for _, i in hits], axis=1)
+    scores = np.where(ids >= 0, scores, -np.inf if inner else np.inf)
+    order = np.argsort(-scores if inner else scores, axis=1, kind="stable")[:, :k]
+    top_scores = np.take_along_axis(scores, order, axis=1)
+    top_ids = np.take_along_axis(ids, order, axis=1)
+    if top_ids.shape[1] < k:
+        pad = k - top_ids.shape[1]
+        top_scores = np.pad(top_scores, ((0, 0), (0, pad)), constant_values=-np.inf if inner else np.inf)
+        top_ids = np.pad(top_ids, ((0, 0), (0, pad)), constant_values=-1)
+    return top_scores.astype(np.float32), top_ids
+
+
+def index_type_of(index) -> str:
+    """
+    Return "flat", "hnsw" or "ivf" for a FAISS index; the first segment's for a
+    SegmentedIndex.
+    """
+    import faiss
+
+    if isinstance(index, SegmentedIndex):
+        return index_type_of(index.segments[0])
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if faiss.try_extract_index_ivf(index) is not None:
+        return "ivf"
+    return "flat"
+
+
+def _codes_holder(index):
+    import faiss
+
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.downcast_index(index.storage)
+    ivf = faiss.try_extract_index_ivf(index)
+    return faiss.downcast_index(ivf) if ivf is not None else index
+
+
+def index_compression_of(index) -> str:
+    """
+    Return "none", "fp16", "sq8" or "pq" for how a FAISS index stores its vectors; the
+    first segment's for a SegmentedIndex.
+    """
+    import faiss
+
+    if isinstance(index, SegmentedIndex):
+        return index_compression_of(index.segments[0])
+    holder = _codes_holder(index)
+    if isinstance(holder, (faiss.IndexPQ, faiss.IndexIVFPQ)):
+        return "pq"
+    if isinstance(holder, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if holder.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "none"
+
+
+def bytes_per_vector(index) -> int:
+    """
+    Approximate resident bytes per vector: the stored code, plus graph links for HNSW
+    and the stored id for IVF. Averaged over the segments of a SegmentedIndex.
+    """
+    import faiss
+
+    if isinstance(index, SegmentedIndex):
+        total = sum(bytes_per_vector(s) * s.ntotal for s in index.segments)
+        return round(total / index.ntotal) if index.ntotal else bytes_per_vector(index.segments[0])
+    index = faiss.downcast_index(index)
+    holder = _codes_holder(index)
+    size = int(holder.code_size)
+    if isinstance(index, faiss.IndexHNSW):
+        size += 4 * index.hnsw.nb_neighbors(0)
+    elif faiss.try_extract_index_ivf(index) is not None:
+        size += 8
+    return size
+
+
+def trained_layout(
+    index_type: str,
+    compression: str,
+    n: int,
+    *,
+    ivf_nlist: int = 1024,
+    min_points_per_centroid: int = MIN_POINTS_PER_CENTROID,
+) -> Tuple[str, str]:
+    """
+    The (index_type, compression) `build_index` uses for n vectors. IVF and PQ are only
+    trained once there are min_points_per_centroid vectors per centroid; until then the
+    index is flat and the vectors uncompressed, and a later build with more vectors trains them.
+    """
+    if index_type == "ivf" and n < min_points_per_centroid * ivf_nlist:
+        index_type = "flat"
+    if compression == "pq" and n < min_points_per_centroid * _PQ_CENTROIDS:
+        compression = "none"
+    return index_type, compression
+
+
+def _storage_spec(compression: str, d: int, pq_m: int) -> str:
+    if compression == "fp16":
+        return "SQfp16"
+    if compression == "sq8":
+        return "SQ8"
+    if compression == "pq":
+        # "np": skip polysemous training, which only serves Hamming-filtered search
+        # (unused here) and costs seconds per sub-quantizer.
+        return f"PQ{pq_m}x8np"
+    return "Flat"
+
+
+def index_vectors(index, positions: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Return all vectors of an index in insertion order, or those at `positions`.
+    """
+    import faiss
+
+    if isinstance(index, SegmentedIndex):
+        if positions is None:
+            return np.concatenate([index_vectors(s) for s in index.segments])
+        return index.reconstruct_batch(positions)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and ivf.direct_map.type == faiss.DirectMap.NoMap:
+        ivf.make_direct_map()
+    if positions is not None:
+        return index.reconstruct_batch(np.asarray(positions, dtype=np.int64))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str = "flat",
+    *,
+    compression: str = "none",
+    inner_product: bool = False,
+    hnsw_m: int = 32,
+    hnsw_ef_construction: int = 40,
+    ivf_nlist: int = 1024,
+    pq_m: int = 128,
+    min_points_per_centroid: int = MIN_POINTS_PER_CENTROID,
+):
+    """
+    Build a FAISS index of the given type holding vectors, optionally compressed
+    (fp16 / sq8 scalar quantization, or product quantization with pq_m bytes per vector).
+    Trainable parts are trained on the vectors themselves, and only with enough of them
+    (see `trained_layout`).
+    """
+    import faiss
+
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unsupported index_type={index_type}")
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unsupported compression={compression}")
+
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    n, d = vectors.shape
+    if compression == "pq" and d % pq_m:
+        raise ValueError(f"faiss_pq_m={pq_m} must divide the embedding dimension {d}")
+    index_type, compression = trained_layout(
+        index_type, compression, n, ivf_nlist=ivf_nlist, min_points_per_centroid=min_points_per_centroid)
+    metric = faiss.METRIC_INNER_PRODUCT if inner_product else faiss.METRIC_L2
+    storage = _storage_spec(compression, d, pq_m)
+
+    if index_type == "hnsw":
+        index = faiss.index_factory(d, f"HNSW{hnsw_m},{storage}", metric)
+        faiss.downcast_index(index).hnsw.efConstruction = hnsw_ef_construction
+    elif index_type == "ivf":
+        index = faiss.index_factory(d, f"IVF{ivf_nlist},{storage}", metric)
+    elif compression != "none":
+        index = faiss.index_factory(d, storage, metric)
+    else:
+        # Same classes FAISS.from_embeddings creates, so flat stores stay mergeable.
+        index = faiss.IndexFlatIP(d) if inner_product else faiss.IndexFlatL2(d)
+
+    if not index.is_trained:
+        index.train(vectors)
+
+    index.add(vectors)
+    return index
+
+
+def configure_search(
+    index,
+    *,
+    hnsw_ef_search: Optional[int] = None,
+    ivf_nprobe: Optional[int] = None,
+) -> None:
+    """
+    Apply query-time parameters. They are not all persisted by FAISS, so set them after
+    every load or copy.
+    """
+    import faiss
+
+    if isinstance(index, SegmentedIndex):
+        for segment in index.segments:
+            configure_search(segment, hnsw_ef_search=hnsw_ef_search, ivf_nprobe=ivf_nprobe)
+        return
+    kind = index_type_of(index)
+    if kind == "hnsw" and hnsw_ef_search is not None:
+        faiss.downcast_index(index).hnsw.efSearch = hnsw_ef_search
+    elif kind == "ivf":
+        ivf = faiss.extract_index_ivf(index)
+        if ivf_nprobe is not None:
+            ivf.nprobe = min(ivf_nprobe, ivf.nlist)
+        # MMR reconstructs candidate vectors by id.
+        if ivf.direct_map.type == faiss.DirectMap.NoMap:
+            ivf.make_direct_map()
+
+
+def rebuild_faiss(
+    store: FAISS,
+    index_type: str,
+    *,
+    compression: str = "none",
+    vectors: Optional[np.ndarray] = None,
+    hnsw_m: int = 32,
+    hnsw_ef_construction: int = 40,
+    ivf_nlist: int = 1024,
+    pq_m: int = 128,
+    min_points_per_centroid: int = MIN_POINTS_PER_CENTROID,
+) -> FAISS:
+    """
+    Return a copy of store whose vectors live in a freshly built index of index_type.
+    Positions, documents and ids are unchanged; store itself is untouched.
+    Pass full-precision vectors (in position order) to avoid re-encoding lossy ones
+    reconstructed from a compressed index.
+    """
+    index = build_index(
+        index_vectors(store.index) if vectors is None else vectors,
+        index_type,
+        compression=compression,
+        inner_product=store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT,
+        hnsw_m=hnsw_m,
+        hnsw_ef_construction=hnsw_ef_construction,
+        ivf_nlist=ivf_nlist,
+        pq_m=pq_m,
+        min_points_per_centroid=min_points_per_centroid,
+    )
+    return FAISS(
+        store.embedding_function,
+        index,
+        InMemoryDocstore(dict(store.docstore._dict)),
+        dict(store.index_to_docstore_id),
+        normalize_L2=store._normalize_L2,
+        distance_strategy=store.distance_strategy,
+    )
@@ -0,0 +1,174 @@
+import heapq
+import json
+import math
+import re
+from collections import Counter
+from pathlib import Path
+from typing import AbstractSet, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from langchain_community.vectorstores import FAISS
+
+_BM25_FILE = "bm25.json"
+
+_TOKEN = re.compile(r"[a-z0-9]+(?:[.\-_/][a-z0-9]+)*")
+_JOINER = re.compile(r"[.\-_/]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase word tokens. Compound terms such as "aes-256" or "cc6.1" are kept whole
+    and also split into their parts, so both exact and partial mentions match.
+    """
+    tokens: List[str] = []
+    for match in _TOKEN.finditer(text.lower()):
+        token = match.group()
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in _JOINER.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory inverted index scoring documents (by docstore id) with Okapi BM25.
+
+    Instances are treated as immutable once published: `merged` returns a new index and
+    copies only the posting lists it touches, so readers can keep searching the old one.
+    """
+
+    def __init__(self, *, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.doc_lens: List[int] = []
+        self.total_len = 0
+        self.postings: Dict[str, Dict[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    # -----------------------
+    # Building
+    # -----------------------
+    def _add_counts(self, doc_id: str, counts: Dict[str, int]) -> None:
+        position = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        length = sum(counts.values())
+        self.doc_lens.append(length)
+        self.total_len += length
+        for term, tf in counts.items():
+            self.postings.setdefault(term, {})[position] = tf
+
+    @classmethod
+    def from_texts(cls, ids: Sequence[str], texts: Iterable[str]) -> "BM25Index":
+        index = cls()
+        for doc_id, text in zip(ids, texts):
+            index._add_counts(doc_id, Counter(tokenize(text)))
+        return index
+
+    @classmethod
+    def from_store(cls, store: FAISS) -> "BM25Index":
+        """
+        Index every document of a FAISS store, in index position order.
+        """
+        ids = [store.index_to_docstore_id[i] for i in range(store.index.ntotal)]
+        texts = (store.docstore.search(doc_id).page_content for doc_id in ids)
+        return cls.from_texts(ids, texts)
+
+    def _forward(self) -> List[Dict[str, int]]:
+        forward: List[Dict[str, int]] = [{} for _ in self.doc_ids]
+        for term, posting in self.postings.items():
+            for position, tf in posting.items():
+                forward[position][term] = tf
+        return forward
+
+    def merged(self, other: "BM25Index") -> "BM25Index":
+        """
+        Return a new index holding the documents of self followed by those of other.
+        """
+        merged = BM25Index(k1=self.k1, b=self.b)
+        merged.doc_ids = self.doc_ids + other.doc_ids
+        merged.doc_lens = self.doc_lens + other.doc_lens
+        merged.total_len = self.total_len + other.total_len
+        merged.postings = dict(self.postings)
+
+        offset = len(self.doc_ids)
+        for term, posting in other.postings.items():
+            shifted = {offset + position: tf for position, tf in posting.items()}
+            existing = merged.postings.get(term)
+            merged.postings[term] = {**existing, **shifted} if existing else shifted
+        return merged
+
+    def subset(self, positions: Sequence[int]) -> "BM25Index":
+        """
+        Return a new index holding only the documents at positions, in that order,
+        without re-tokenizing them.
+        """
+        forward = self._forward()
+        subset = BM25Index(k1=self.k1, b=self.b)
+        for position in positions:
+            subset._add_counts(self.doc_ids[position], forward[position])
+        return subset
+
+    # -----------------------
+    # Search
+    # -----------------------
+    def search(
+        self,
+        query: str,
+        k: int,
+        *,
+        ids: Optional[AbstractSet[str]] = None,
+        exclude: AbstractSet[str] = frozenset(),
+    ) -> List[Tuple[str, float]]:
+        """
+        Return up to k (docstore id, BM25 score) pairs, best first.
+        With `ids`, only those documents are scored, and never those in `exclude`;
+        collection statistics stay global.
+        """
+        n = len(self.doc_ids)
+        if n == 0:
+            return []
+        avg_len = self.total_len / n
+
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            df = len(posting)
+            idf = math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+            for position, tf in posting.items():
+                doc_id = self.doc_ids[position]
+                if (ids is not None and doc_id not in ids) or doc_id in exclude:
+                    continue
+                norm = self.k1 * (1.0 - self.b + self.b * self.doc_lens[position] / avg_len)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (self.k1 + 1.0) / (tf + norm)
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.doc_ids[position], score) for position, score in best]
+
+    # -----------------------
+    # Persistence
+    # -----------------------
+    def save(self, directory: Union[str, Path]) -> None:
+        """
+        Write the forward index (per-document term counts) next to a segment.
+        """
+        data = {"ids": self.doc_ids, "terms": self._forward()}
+        (Path(directory) / _BM25_FILE).write_text(json.dumps(data), encoding="utf-8")
+
+    @classmethod
+    def load(cls, directory: Union[str, Path]) -> Optional["BM25Index"]:
+        """
+        Load an index written by `save`, or None if the directory has none.
+        """
+        path = Path(directory) / _BM25_FILE
+        if not path.exists():
+            return None
+
+        data = json.loads(path.read_text(encoding="utf-8"))
+        index = cls()
+        for doc_id, counts in zip(data["ids"], data["terms"]):
+            index._add_counts(doc_id, counts)
+        return index
@@ -0,0 +1,160 @@
+import hashlib
+import re
+from collections import Counter
+from typing import AbstractSet, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+# Chunk metadata keys holding the fingerprints, so a restarted engine needn't rehash.
+HASH_KEY = "content_hash"
+SIMHASH_KEY = "simhash"
+
+_WORD = re.compile(r"\w+")
+_SHINGLE_WORDS = 3
+_BITS = 64
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(_WORD.findall(text.lower()))
+
+
+def content_hash(text: str) -> str:
+    """
+    Hash of the normalized text: equal for chunks differing only in case, whitespace
+    or punctuation.
+    """
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over word 3-gram shingles. Texts sharing most shingles get
+    fingerprints that differ in few bits.
+    """
+    words = _WORD.findall(text.lower())
+    shingles = [
+        " ".join(words[i:i + _SHINGLE_WORDS])
+        for i in range(max(1, len(words) - _SHINGLE_WORDS + 1))
+    ]
+    digests = b"".join(
+        hashlib.blake2b(s.encode("utf-8"), digest_size=_BITS // 8).digest() for s in shingles)
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(shingles), -1), axis=1)
+    votes = 2 * bits.sum(axis=0, dtype=np.int64) - len(shingles)
+    return int.from_bytes(np.packbits(votes > 0).tobytes(), "big")
+
+
+class DedupIndex:
+    """
+    Fingerprints of every indexed chunk: exact content hashes plus SimHashes bucketed
+    for near-duplicate lookup.
+
+    Two 64-bit fingerprints within `max_distance` bits agree exactly on at least one of
+    `max_distance + 1` bands (pigeonhole), so only chunks sharing a band are compared.
+    A negative `max_distance` disables near-duplicate detection.
+    """
+
+    def __init__(self, *, max_distance: int = 3):
+        self.max_distance = max_distance
+        self.hashes: Counter = Counter()
+        self.simhashes: Counter = Counter()
+        self.buckets: Dict[Tuple[int, int], List[int]] = {}
+
+        self._bands: List[Tuple[int, int]] = []
+        if max_distance >= 0:
+            edges = np.linspace(0, _BITS, max_distance + 2).astype(int)
+            self._bands = [(int(lo), (1 << int(hi - lo)) - 1) for lo, hi in zip(edges, edges[1:])]
+
+    def __len__(self) -> int:
+        return sum(self.hashes.values())
+
+    def _keys(self, fingerprint: int):
+        for band, (shift, mask) in enumerate(self._bands):
+            yield band, (fingerprint >> shift) & mask
+
+    def duplicate_of(
+        self,
+        digest: str,
+        fingerprint: int,
+        *,
+        ignore: Optional["DedupIndex"] = None,
+    ) -> Optional[str]:
+        """
+        "exact" or "near" if an indexed chunk matches, else None. Chunks also in `ignore`
+        (e.g. the old version of a document being replaced) don't count.
+        """
+        if self.hashes[digest] > (ignore.hashes[digest] if ignore is not None else 0):
+            return "exact"
+        ignored = ignore.simhashes if ignore is not None else {}
+        for key in self._keys(fingerprint):
+            for other in self.buckets.get(key, ()):
+                if other not in ignored and (fingerprint ^ other).bit_count() <= self.max_distance:
+                    return "near"
+        return None
+
+    def add(self, digest: str, fingerprint: int) -> None:
+        self.hashes[digest] += 1
+        self.simhashes[fingerprint] += 1
+        for key in self._keys(fingerprint):
+            self.buckets.setdefault(key, []).append(fingerprint)
+
+    def remove(self, digest: str, fingerprint: int) -> None:
+        """
+        Forget one chunk added with these fingerprints, e.g. when it is deleted.
+        """
+        self.hashes[digest] -= 1
+        if self.hashes[digest] <= 0:
+            del self.hashes[digest]
+        self.simhashes[fingerprint] -= 1
+        if self.simhashes[fingerprint] <= 0:
+            del self.simhashes[fingerprint]
+        for key in self._keys(fingerprint):
+            bucket = self.buckets.get(key)
+            if bucket and fingerprint in bucket:
+                bucket.remove(fingerprint)
+
+    def update(self, other: "DedupIndex") -> None:
+        self.hashes.update(other.hashes)
+        self.simhashes.update(other.simhashes)
+        for key, fingerprints in other.buckets.items():
+            self.buckets.setdefault(key, []).extend(fingerprints)
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Document], *, max_distance: int = 3) -> "DedupIndex":
+        """
+        Index the fingerprints of docs, computing any that are missing from the metadata
+        (chunks ingested before deduplication existed).
+        """
+        index = cls(max_distance=max_distance)
+        for doc in docs:
+            index.add(*fingerprints_of(doc))
+        return index
+
+    @classmethod
+    def from_store(
+        cls,
+        store: FAISS,
+        *,
+        max_distance: int = 3,
+        exclude: AbstractSet[str] = frozenset(),
+    ) -> "DedupIndex":
+        """
+        Index every document of a FAISS store except the docstore ids in `exclude`.
+        """
+        docs = (
+            store.docstore.search(doc_id)
+            for doc_id in store.index_to_docstore_id.values()
+            if doc_id not in exclude
+        )
+        return cls.from_documents(docs, max_distance=max_distance)
+
+
+def fingerprints_of(doc: Document) -> Tuple[str, int]:
+    """
+    (content hash, SimHash) of a chunk, read from its metadata when present.
+    """
+    md = doc.metadata or {}
+    digest = md.get(HASH_KEY) or content_hash(doc.page_content)
+    fingerprint = md.get(SIMHASH_KEY)
+    return digest, simhash(doc.page_content) if fingerprint is None else fingerprint
@@ -1,26 +1,266 @@
+import json
+import os
+import shutil
+import uuid
 from pathlib import Path
-from typing import Iterable, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 
+import numpy as np
 from langchain_core.documents import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 
+from docqa.indexing.ann import SegmentedIndex, index_vectors, segmented
+from docqa.indexing.bm25 import BM25Index
+
+
+_VERSION_FILE = "index_version"
+_MANIFEST_FILE = "manifest.json"
+_SEGMENTS_DIR = "segments"
+# An index saved by save_faiss directly into index_dir, before segments existed.
+_LEGACY_SEGMENT = "."
 
-def load_faiss(index_dir: str, embeddings) -> Optional[FAISS]:
-    if not Path(index_dir).exists():
-        return None
 
+def _load_local(path: Path, embeddings, *, mmap: bool = False) -> FAISS:
+    import faiss
+
+    io_flags = faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY if mmap else 0
     return FAISS.load_local(
-        index_dir,
+        str(path),
         embeddings,
         allow_dangerous_deserialization=True,
+        io_flags=io_flags,
     )
 
 
+def load_faiss(index_dir: str, embeddings, *, mmap: bool = False) -> Optional[FAISS]:
+    """
+    Load the index from disk, searching all live segments listed in the manifest as one
+    (see `extend_faiss`). Returns None if there is no index yet.
+
+    With mmap=True the segments are memory-mapped read-only instead of read into RAM,
+    so processes on one host share the page cache.
+    """
+    path = Path(index_dir)
+    if not path.exists():
+        return None
+
+    manifest = read_manifest(index_dir)
+    if manifest is None:
+        if not (path / "index.faiss").exists():
+            return None
+        return _load_local(path, embeddings, mmap=mmap)
+
+    store: Optional[FAISS] = None
+    for name in manifest["segments"]:
+        segment = _load_local(_segment_path(path, name), embeddings, mmap=mmap)
+        store = segment if store is None else extend_faiss(store, segment)
+    return store
+
+
 def save_faiss(store: FAISS, index_dir: str) -> None:
     Path(index_dir).mkdir(parents=True, exist_ok=True)
     store.save_local(index_dir)
 
 
+def _segment_path(index_dir: Path, name: str) -> Path:
+    return index_dir if name == _LEGACY_SEGMENT else index_dir / _SEGMENTS_DIR / name
+
+
+def read_manifest(index_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the segment manifest ({"version": ..., "segments": [...]}, plus "deleted":
+    docstore ids tombstoned since the last compaction), or None if the index has none
+    (no index yet, or a legacy single-file index).
+    """
+    manifest_file = Path(index_dir) / _MANIFEST_FILE
+    if not manifest_file.exists():
+        return None
+    return json.loads(manifest_file.read_text(encoding="utf-8"))
+
+
+def _write_manifest(index_dir: str, manifest: Dict[str, Any]) -> None:
+    path = Path(index_dir)
+    tmp = path / f"{_MANIFEST_FILE}.{uuid.uuid4().hex}.tmp"
+    tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp, path / _MANIFEST_FILE)
+
+
+def _live_segments(index_dir: str) -> List[str]:
+    manifest = read_manifest(index_dir)
+    if manifest is not None:
+        return list(manifest["segments"])
+    if (Path(index_dir) / "index.faiss").exists():
+        return [_LEGACY_SEGMENT]
+    return []
+
+
+def write_segment(store: FAISS, index_dir: str, *, lexical: Optional[BM25Index] = None) -> str:
+    """
+    Save store (and its lexical index, if given) as a new immutable segment and return
+    its name. The segment is written under a temporary name and renamed into place, so it
+    is either complete or absent. It only becomes live once a manifest lists it.
+    """
+    segments_dir = Path(index_dir) / _SEGMENTS_DIR
+    segments_dir.mkdir(parents=True, exist_ok=True)
+
+    name = f"seg-{uuid.uuid4().hex}"
+    tmp = segments_dir / f".{name}.tmp"
+    store.save_local(str(tmp))
+    if lexical is not None:
+        lexical.save(tmp)
+    os.rename(tmp, segments_dir / name)
+    return name
+
+
+def load_segment(
+    index_dir: str, name: str, embeddings, *, mmap: bool = False
+) -> Tuple[FAISS, Optional[BM25Index]]:
+    """
+    Load one segment written by `write_segment`, live or not, with its lexical index
+    if it was saved with one.
+    """
+    path = _segment_path(Path(index_dir), name)
+    return _load_local(path, embeddings, mmap=mmap), BM25Index.load(path)
+
+
+def discard_segments(index_dir: str, names: Iterable[str]) -> None:
+    """
+    Remove segments that were written but never published.
+    """
+    for name in names:
+        shutil.rmtree(Path(index_dir) / _SEGMENTS_DIR / name, ignore_errors=True)
+
+
+def load_lexical(index_dir: str, store: FAISS) -> BM25Index:
+    """
+    Load the lexical index of all live segments. Segments written without one (e.g.
+    before lexical indexing existed) are re-indexed from the store's documents.
+    """
+    path = Path(index_dir)
+    lexical: Optional[BM25Index] = None
+    for name in _live_segments(index_dir):
+        part = BM25Index.load(_segment_path(path, name))
+        if part is None:
+            return BM25Index.from_store(store)
+        lexical = part if lexical is None else lexical.merged(part)
+    return lexical if lexical is not None else BM25Index.from_store(store)
+
+
+def read_deleted(index_dir: str) -> List[str]:
+    """
+    Docstore ids deleted since the last compaction. Their vectors are still in the
+    segments and must be skipped when searching.
+    """
+    manifest = read_manifest(index_dir)
+    return list(manifest.get("deleted", [])) if manifest else []
+
+
+def append_segment(
+    delta: Optional[FAISS],
+    index_dir: str,
+    *,
+    lexical: Optional[BM25Index] = None,
+    deleted: Sequence[str] = (),
+    written: Sequence[str] = (),
+) -> str:
+    """
+    Persist delta as a new segment and publish it in the manifest, together with
+    tombstones for the docstore ids in `deleted` (e.g. the chunks delta replaces), in
+    one atomic manifest write. Segments already saved with `write_segment` (`written`)
+    are published in the same write, before delta. delta may be None to only delete.
+    Cost depends on the size of delta only. Returns the new index version.
+    """
+    segments = _live_segments(index_dir) + list(written)
+    if delta is not None:
+        segments.append(write_segment(delta, index_dir, lexical=lexical))
+
+    manifest: Dict[str, Any] = {"version": uuid.uuid4().hex, "segments": segments}
+    tombstones = [*read_deleted(index_dir), *deleted]
+    if tombstones:
+        manifest["deleted"] = tombstones
+    _write_manifest(index_dir, manifest)
+    return manifest["version"]
+
+
+def compact_segments(
+    store: FAISS,
+    index_dir: str,
+    *,
+    force: bool = False,
+    lexical: Optional[BM25Index] = None,
+) -> int:
+    """
+    Replace all live segments with a single segment holding store, which must contain
+    exactly the data of the live segments minus deleted chunks (see `subset_faiss`);
+    the tombstones are dropped. The index version is kept, since the searchable contents
+    don't change. Returns how many segments were merged.
+    With force=True a single segment is rewritten too, e.g. after a rebuild.
+    Segments not yet published (e.g. spilled by an ingest in progress) are left alone.
+    """
+    path = Path(index_dir)
+    segments = _live_segments(index_dir)
+    if not force and len(segments) <= 1 and _LEGACY_SEGMENT not in segments:
+        return 0
+
+    manifest = read_manifest(index_dir)
+    version = manifest["version"] if manifest else read_index_version(index_dir)
+
+    name = write_segment(store, index_dir, lexical=lexical)
+    _write_manifest(index_dir, {"version": version, "segments": [name]})
+
+    # Old files are only removed once the new manifest is in place.
+    if _LEGACY_SEGMENT in segments:
+        for leftover in ("index.faiss", "index.pkl", "bm25.json"):
+            (path / leftover).unlink(missing_ok=True)
+    discard_segments(index_dir, [s for s in segments if s != _LEGACY_SEGMENT])
+
+    return len(segments)
+
+
+def read_index_version(index_dir: str) -> Optional[str]:
+    """
+    Return the version token of the persisted index, or None if there is no index yet.
+    An index saved before versioning existed is assigned a version on first read.
+    """
+    path = Path(index_dir)
+    if not path.exists():
+        return None
+
+    manifest = read_manifest(index_dir)
+    if manifest is not None:
+        return manifest["version"]
+
+    version_file = path / _VERSION_FILE
+    if version_file.exists():
+        return version_file.read_text(encoding="utf-8").strip()
+    return bump_index_version(index_dir)
+
+
+def bump_index_version(index_dir: str) -> str:
+    """
+    Assign the index a fresh version token. Tokens are random rather than counters so
+    independent processes can never produce the same version for different contents.
+    """
+    path = Path(index_dir)
+    path.mkdir(parents=True, exist_ok=True)
+
+    version = uuid.uuid4().hex
+    manifest = read_manifest(index_dir)
+    if manifest is not None:
+        _write_manifest(index_dir, {**manifest, "version": version})
+        return version
+
+    tmp = path / f"{_VERSION_FILE}.{version}.tmp"
+    tmp.write_text(version, encoding="utf-8")
+    os.replace(tmp, path / _VERSION_FILE)
+    return version
+
+
+def embed_documents(docs: Sequence[Document], embeddings) -> List[List[float]]:
+    return embeddings.embed_documents([d.page_content for d in docs])
+
 
 def add_documents_to_faiss(
     store: Optional[FAISS],
@@ -28,10 +268,12 @@ def add_documents_to_faiss(
     embeddings,
     *,
     index_dir: Optional[str] = None,
+    vectors: Optional[Sequence[Sequence[float]]] = None,
 ) -> FAISS:
     """
     Incrementally add documents to an existing store.
     If store is None, create a new one from docs.
+    If vectors are given they are used instead of embedding the docs again.
     Optionally persist to disk if index_dir is provided.
     """
     docs_list = list(docs)
@@ -40,12 +282,97 @@ def add_documents_to_faiss(
             raise ValueError("No documents to add and store is None.")
         return store
 
+    if vectors is None:
+        vectors = embed_documents(docs_list, embeddings)
+
+    texts = [d.page_content for d in docs_list]
+    metadatas = [d.metadata for d in docs_list]
+    ids = [d.id for d in docs_list] if all(d.id for d in docs_list) else None
+
     if store is None:
-        store = FAISS.from_documents(docs_list, embeddings)
+        store = FAISS.from_embeddings(zip(texts, vectors), embeddings, metadatas=metadatas, ids=ids)
     else:
-        store.add_documents(docs_list)
+        store.add_embeddings(zip(texts, vectors), metadatas=metadatas, ids=ids)
 
     if index_dir:
         save_faiss(store, index_dir)
 
     return store
+
+
+def subset_faiss(store: FAISS, keep: np.ndarray, *, vectors: Optional[np.ndarray] = None) -> FAISS:
+    """
+    Return a new flat store holding only the documents at positions `keep`, in order,
+    e.g. to purge deleted chunks. Pass full-precision vectors (all positions, in order)
+    to avoid copying lossy ones reconstructed from a compressed index.
+    """
+    import faiss
+
+    kept = index_vectors(store.index, keep) if vectors is None else vectors[keep]
+    kept = np.ascontiguousarray(kept, dtype=np.float32)
+    d = store.index.d
+    inner = store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+    index = faiss.IndexFlatIP(d) if inner else faiss.IndexFlatL2(d)
+    index.add(kept)
+
+    ids = [store.index_to_docstore_id[int(p)] for p in keep]
+    return FAISS(
+        store.embedding_function,
+        index,
+        InMemoryDocstore({doc_id: store.docstore._dict[doc_id] for doc_id in ids}),
+        dict(enumerate(ids)),
+        normalize_L2=store._normalize_L2,
+        distance_strategy=store.distance_strategy,
+    )
+
+
+def extend_faiss(store: FAISS, delta: FAISS) -> FAISS:
+    """
+    Return a store searching store's vectors followed by delta's, without copying
+    either index (see `SegmentedIndex`). The new store shares store's docstore and id
+    map, which gain delta's entries in place; store stays valid for readers, since it
+    never looks up positions past its own ntotal. Cost depends on the size of delta only.
+    Only one writer may extend a store at a time.
+    """
+    docs = store.docstore._dict
+    overlapping = [doc_id for doc_id in delta.docstore._dict if doc_id in docs]
+    if overlapping:
+        raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+
+    offset = store.index.ntotal
+    docs.update(delta.docstore._dict)
+    store.index_to_docstore_id.update(
+        {offset + i: doc_id for i, doc_id in delta.index_to_docstore_id.items()})
+    return FAISS(
+        store.embedding_function,
+        segmented(store.index, delta.index),
+        store.docstore,
+        store.index_to_docstore_id,
+        normalize_L2=store._normalize_L2,
+        distance_strategy=store.distance_strategy,
+    )
+
+
+def merge_segments(store: FAISS) -> FAISS:
+    """
+    Return store with the segments of its index merged into a copy of the first one,
+    which encodes the others' vectors with its own training, e.g. to write a single
+    segment when compacting. The docstore and id map are shared, not copied.
+    A store whose index has a single segment is returned as is.
+    """
+    if not isinstance(store.index, SegmentedIndex):
+        return store
+    import faiss
+
+    first, rest = store.index.segments[0], store.index.segments[1:]
+    # A serialize round-trip also copies memory-mapped indexes, unlike clone_index.
+    index = faiss.deserialize_index(faiss.serialize_index(first))
+    index.add(np.concatenate([index_vectors(s) for s in rest]))
+    return FAISS(
+        store.embedding_function,
+        index,
+        store.docstore,
+        store.index_to_docstore_id,
+        normalize_L2=store._normalize_L2,
+        distance_strategy=store.distance_strategy,
+    )
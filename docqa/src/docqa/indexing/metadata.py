@@ -0,0 +1,434 @@
+import operator
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
+from langchain_core.documents import Document
+
+from docqa.indexing.ann import SegmentedIndex, index_type_of, merge_hits
+
+# Filter operators on one field: {"page": {"gte": 2, "lte": 5}}, {"source_type": {"in": [...]}}.
+RANGE_OPS = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+FILTER_OPS = set(RANGE_OPS) | {"eq", "in"}
+
+# Approximate indexes can miss selective filters (HNSW walks the unfiltered graph, IVF
+# only probes nprobe lists), so small match sets are scanned exactly instead.
+_EXACT_SCAN_MAX = 4096
+# Positions reconstructed and scored at a time by an exact scan.
+_SCAN_CHUNK = 4096
+
+Filters = Mapping[str, Any]
+
+
+class Selection:
+    """
+    Sorted index positions a search is restricted to, out of `size`. The FAISS bitmap
+    of them, and the selections within each segment, are built on first use and kept
+    with the selection.
+    """
+
+    __slots__ = ("positions", "size", "_bitmap", "_within")
+
+    def __init__(self, positions: np.ndarray, size: int):
+        self.positions = positions
+        self.size = size
+        self._bitmap: Optional[np.ndarray] = None
+        self._within: Dict[Tuple[int, int], "Selection"] = {}
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def bitmap(self) -> np.ndarray:
+        """
+        Packed little-endian bitmap over `size` positions, as IDSelectorBitmap reads it.
+        """
+        if self._bitmap is None:
+            bitmap = np.zeros((self.size + 7) // 8, dtype=np.uint8)
+            np.bitwise_or.at(
+                bitmap, self.positions >> 3, np.left_shift(1, self.positions & 7).astype(np.uint8))
+            self._bitmap = bitmap
+        return self._bitmap
+
+    def within(self, start: int, stop: int) -> "Selection":
+        """
+        The selected positions in [start, stop), relative to start.
+        """
+        key = (start, stop)
+        if key not in self._within:
+            lo, hi = np.searchsorted(self.positions, (start, stop))
+            self._within[key] = Selection(self.positions[lo:hi] - start, stop - start)
+        return self._within[key]
+
+
+Positions = Union[np.ndarray, Selection]
+
+
+def _hashable(value: Any) -> bool:
+    return isinstance(value, (str, int, float, bool))
+
+
+class MetadataIndex:
+    """
+    Inverted index from chunk metadata to FAISS index positions, for the fields listed
+    in `fields`: field -> value -> sorted positions.
+
+    It also tracks deleted positions (chunks tombstoned but not yet purged from the
+    FAISS index): they never match a filter and are excluded by `select({})`.
+
+    Like BM25Index it is immutable once published; `merged` and `without` return a new index.
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = tuple(fields)
+        self.size = 0
+        self.values: Dict[str, Dict[Any, np.ndarray]] = {f: {} for f in self.fields}
+        self.deleted: Optional[np.ndarray] = None
+        # Built on first use; the index is immutable once published, so they stay valid.
+        self._live: Optional[Selection] = None
+        self._deleted_positions: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def deleted_count(self) -> int:
+        return len(self.deleted_positions())
+
+    # -----------------------
+    # Building
+    # -----------------------
+    @classmethod
+    def from_metadatas(cls, fields: Sequence[str], metadatas: Iterable[Mapping[str, Any]]) -> "MetadataIndex":
+        index = cls(fields)
+        positions: Dict[str, Dict[Any, List[int]]] = {f: {} for f in index.fields}
+        for position, md in enumerate(metadatas):
+            for field in index.fields:
+                value = md.get(field)
+                if value is not None and _hashable(value):
+                    positions[field].setdefault(value, []).append(position)
+            index.size = position + 1
+        for field, by_value in positions.items():
+            index.values[field] = {
+                value: np.asarray(found, dtype=np.int64) for value, found in by_value.items()
+            }
+        return index
+
+    @classmethod
+    def from_store(cls, fields: Sequence[str], store: FAISS) -> "MetadataIndex":
+        """
+        Index the metadata of every document of a FAISS store, in index position order.
+        """
+        ids = (store.index_to_docstore_id[i] for i in range(store.index.ntotal))
+        return cls.from_metadatas(
+            fields, (store.docstore.search(doc_id).metadata or {} for doc_id in ids))
+
+    def merged(self, other: "MetadataIndex") -> "MetadataIndex":
+        """
+        Return a new index holding the positions of self followed by those of other.
+        """
+        merged = MetadataIndex(self.fields)
+        merged.size = self.size + other.size
+        if self.deleted is not None or other.deleted is not None:
+            merged.deleted = np.concatenate([
+                self.deleted if self.deleted is not None else np.zeros(self.size, dtype=bool),
+                other.deleted if other.deleted is not None else np.zeros(other.size, dtype=bool),
+            ])
+        for field in self.fields:
+            values = dict(self.values[field])
+            for value, positions in other.values.get(field, {}).items():
+                shifted = positions + self.size
+                existing = values.get(value)
+                values[value] = shifted if existing is None else np.concatenate([existing, shifted])
+            merged.values[field] = values
+        return merged
+
+    def without(self, positions: np.ndarray, metadatas: Iterable[Mapping[str, Any]]) -> "MetadataIndex":
+        """
+        Return a new index where the given positions, whose documents carry `metadatas`
+        (same order), are deleted. Only the posting arrays they appear in are copied.
+        """
+        pruned = MetadataIndex(self.fields)
+        pruned.size = self.size
+        pruned.values = {field: dict(values) for field, values in self.values.items()}
+        pruned.deleted = (
+            self.deleted.copy() if self.deleted is not None else np.zeros(self.size, dtype=bool))
+        pruned.deleted[positions] = True
+
+        removed: Dict[str, Dict[Any, List[int]]] = {f: {} for f in self.fields}
+        for position, md in zip(positions, metadatas):
+            for field in self.fields:
+                value = md.get(field)
+                if value is not None and _hashable(value):
+                    removed[field].setdefault(value, []).append(int(position))
+        for field, by_value in removed.items():
+            values = pruned.values[field]
+            for value, gone in by_value.items():
+                if value in values:
+                    left = np.setdiff1d(values[value], gone, assume_unique=True)
+                    if left.size:
+                        values[value] = left
+                    else:
+                        del values[value]
+        return pruned
+
+    # -----------------------
+    # Filtering
+    # -----------------------
+    def _field_positions(self, field: str, condition: Any) -> np.ndarray:
+        if field not in self.values:
+            raise ValueError(
+                f"Cannot filter on {field!r}; indexed fields: {', '.join(self.fields)}")
+        values = self.values[field]
+
+        if isinstance(condition, Mapping):
+            unknown = set(condition) - FILTER_OPS
+            if unknown or not condition:
+                raise ValueError(
+                    f"Invalid filter on {field!r}; operators: {', '.join(sorted(FILTER_OPS))}")
+            if "in" in condition and not isinstance(condition["in"], (list, tuple, set)):
+                raise ValueError(f"Filter 'in' on {field!r} needs a list of values")
+        elif isinstance(condition, (list, tuple, set)):
+            condition = {"in": condition}
+        else:
+            condition = {"eq": condition}
+
+        def matches(value: Any) -> bool:
+            if "eq" in condition and value != condition["eq"]:
+                return False
+            if "in" in condition and value not in condition["in"]:
+                return False
+            for op in RANGE_OPS.keys() & condition.keys():
+                bound = condition[op]
+                if isinstance(value, str) != isinstance(bound, str):
+                    return False
+                if not RANGE_OPS[op](value, bound):
+                    return False
+            return True
+
+        if condition.keys() == {"eq"} or condition.keys() == {"in"}:
+            # Hash lookups only: no scan over the field's distinct values.
+            wanted = [condition["eq"]] if "eq" in condition else list(condition["in"])
+            found = [values[v] for v in wanted if _hashable(v) and v in values]
+        else:
+            found = [positions for value, positions in values.items() if matches(value)]
+
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(found))
+
+    def select(self, filters: Filters) -> np.ndarray:
+        """
+        Sorted positions of the live documents matching every field condition in filters.
+        A condition is a value (equality), a list (in-set) or a dict of operators
+        (eq, in, gt, gte, lt, lte). Empty filters select every live document.
+        """
+        selected: Optional[np.ndarray] = None
+        for field, condition in filters.items():
+            positions = self._field_positions(field, condition)
+            selected = positions if selected is None else np.intersect1d(
+                selected, positions, assume_unique=True)
+            if selected.size == 0:
+                break
+        if selected is None:
+            if self.deleted is not None:
+                return np.flatnonzero(~self.deleted)
+            return np.arange(self.size, dtype=np.int64)
+        return selected
+
+    def selection(self, filters: Filters) -> Selection:
+        """
+        `select(filters)` as a Selection. The selection of every live document (empty
+        filters), and so its bitmap, is computed once per index rather than per query.
+        Filtered selections need no tombstone bitmap: deleted positions are already
+        gone from the posting lists.
+        """
+        if filters:
+            return Selection(self.select(filters), self.size)
+        if self._live is None:
+            self._live = Selection(self.select({}), self.size)
+        return self._live
+
+    def deleted_positions(self) -> np.ndarray:
+        """
+        Sorted deleted positions, computed once per index.
+        """
+        if self._deleted_positions is None:
+            self._deleted_positions = (
+                np.flatnonzero(self.deleted) if self.deleted is not None else np.empty(0, dtype=np.int64))
+        return self._deleted_positions
+
+
+def validate_filters(filters: Filters, fields: Sequence[str]) -> None:
+    """
+    Raise ValueError for filters that `MetadataIndex.select` would reject, without
+    needing an index.
+    """
+    MetadataIndex(fields).select(filters)
+
+
+def _selection(index, positions: Positions) -> Selection:
+    return positions if isinstance(positions, Selection) else Selection(
+        np.asarray(positions, dtype=np.int64), index.ntotal)
+
+
+def takes_selector(index) -> bool:
+    """
+    Whether FAISS can restrict a search of index with an IDSelector; a flat IndexPQ
+    rejects any search parameters.
+    """
+    import faiss
+
+    return not isinstance(faiss.downcast_index(index), faiss.IndexPQ)
+
+
+def selector_params(index, positions: Positions):
+    """
+    FAISS search parameters restricting a search to positions, via an IDSelectorBitmap.
+    The index's own query-time settings (efSearch, nprobe) are carried over. index must
+    be a single FAISS index, not a SegmentedIndex.
+    """
+    import faiss
+
+    bitmap = _selection(index, positions).bitmap()
+    selector = faiss.IDSelectorBitmap(index.ntotal, faiss.swig_ptr(bitmap))
+
+    kind = index_type_of(index)
+    if kind == "hnsw":
+        params = faiss.SearchParametersHNSW(
+            sel=selector, efSearch=faiss.downcast_index(index).hnsw.efSearch)
+    elif kind == "ivf":
+        params = faiss.SearchParametersIVF(
+            sel=selector, nprobe=faiss.extract_index_ivf(index).nprobe)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    # The selector only points at the bitmap; keep both alive as long as the params.
+    params.bitmap, params.selector = bitmap, selector
+    return params
+
+
+def _exact_scan(index, queries: np.ndarray, positions: np.ndarray, k: int, inner: bool) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score queries against the vectors at positions only, reconstructing `_SCAN_CHUNK`
+    of them at a time and keeping a running top k, so memory doesn't grow with the
+    selection or the index.
+    """
+    best: Optional[Tuple[np.ndarray, np.ndarray]] = None
+    for start in range(0, len(positions), _SCAN_CHUNK):
+        chunk = positions[start:start + _SCAN_CHUNK]
+        vectors = index.reconstruct_batch(chunk)
+        if inner:
+            scores = queries @ vectors.T
+            order = np.argsort(-scores, axis=1)[:, :k]
+        else:
+            scores = (
+                np.sum(queries ** 2, axis=1, keepdims=True)
+                - 2.0 * queries @ vectors.T
+                + np.sum(vectors ** 2, axis=1)
+            )
+            order = np.argsort(scores, axis=1)[:, :k]
+        hits = (np.take_along_axis(scores, order, axis=1), chunk[order])
+        best = hits if best is None else merge_hits([best, hits], k, inner=inner)
+    return best
+
+
+def query_matrix(store: FAISS, embeddings: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    The (n, d) float32 queries FAISS searches with, normalized if the store normalizes.
+    """
+    import faiss
+
+    queries = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1))
+    if store._normalize_L2:
+        faiss.normalize_L2(queries)
+    return queries
+
+
+def query_vector(store: FAISS, embedding: List[float]) -> np.ndarray:
+    """
+    The (1, d) float32 query FAISS searches with, normalized if the store normalizes.
+    """
+    return query_matrix(store, [embedding])
+
+
+def search_ids_many(
+    store: FAISS,
+    embeddings: Sequence[Sequence[float]],
+    k: int,
+    positions: Optional[Positions] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search all queries in one FAISS call, only among `positions` if given. Returns
+    (scores, positions) of shape (n, k), best first, in FAISS units (L2 distance or
+    inner product); missing hits have position -1.
+    """
+    queries = query_matrix(store, embeddings)
+    if positions is None:
+        return store.index.search(queries, k)
+
+    selection = _selection(store.index, positions)
+    k = min(k, len(selection))
+    if k <= 0:
+        return (np.empty((len(queries), 0), dtype=np.float32),
+                np.empty((len(queries), 0), dtype=np.int64))
+    inner = store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+    return _restricted_search(store.index, queries, selection, k, inner)
+
+
+def _restricted_search(index, queries: np.ndarray, selection: Selection, k: int, inner: bool) -> Tuple[np.ndarray, np.ndarray]:
+    if isinstance(index, SegmentedIndex):
+        hits = []
+        for segment, start in zip(index.segments, index.offsets):
+            local = selection.within(int(start), int(start) + segment.ntotal)
+            if len(local):
+                scores, ids = _restricted_search(segment, queries, local, min(k, len(local)), inner)
+                hits.append((scores, np.where(ids >= 0, ids + start, -1)))
+        return merge_hits(hits, k, inner=inner)
+
+    # A flat IndexPQ takes no selector, so only the selected positions are scored.
+    if not takes_selector(index) or (
+            index_type_of(index) != "flat" and len(selection) <= _EXACT_SCAN_MAX):
+        return _exact_scan(index, queries, selection.positions, k, inner)
+    return index.search(queries, k, params=selector_params(index, selection))
+
+
+def search_ids(
+    store: FAISS,
+    embedding: List[float],
+    k: int,
+    positions: Positions,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search only the given index positions. Returns (scores, positions) of up to k hits,
+    best first, with scores in FAISS units (L2 distance or inner product).
+    """
+    scores, ids = search_ids_many(store, [embedding], k, positions)
+    found = ids[0] != -1
+    return scores[0][found], ids[0][found]
+
+
+def pairs_from_ids(store: FAISS, scores: np.ndarray, ids: np.ndarray) -> List[Tuple[Document, float]]:
+    """
+    One row of search results as (doc, score) pairs, skipping missing hits.
+    """
+    pairs: List[Tuple[Document, float]] = []
+    for score, i in zip(scores, ids):
+        if i == -1:
+            continue
+        doc = store.docstore.search(store.index_to_docstore_id[int(i)])
+        if isinstance(doc, Document):
+            pairs.append((doc, float(score)))
+    return pairs
+
+
+def search_positions(
+    store: FAISS,
+    embedding: List[float],
+    k: int,
+    positions: Positions,
+) -> List[Tuple[Document, float]]:
+    """
+    `search_ids` as (doc, score) pairs, like `similarity_search_with_score_by_vector`.
+    """
+    scores, ids = search_ids(store, embedding, k, positions)
+    return pairs_from_ids(store, scores, ids)
@@ -0,0 +1,49 @@
+"""
+Rebuild the persisted FAISS index in place with the structure configured in Settings.
+
+    python -m docqa.indexing.rebuild --index-type hnsw
+    python -m docqa.indexing.rebuild --index-type ivf --compression pq --pq-m 64 --rerank
+
+Options override the matching DOCQA_* environment variables.
+"""
+import argparse
+import json
+from typing import List, Optional
+
+from docqa.config import Settings
+from docqa.pipeline.engine import QAEngine
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--index-dir", help="FAISS index directory (DOCQA_FAISS_INDEX_DIR)")
+    parser.add_argument("--index-type", choices=["flat", "hnsw", "ivf"],
+                        help="Target index structure (DOCQA_FAISS_INDEX_TYPE)")
+    parser.add_argument("--hnsw-m", type=int)
+    parser.add_argument("--ivf-nlist", type=int)
+    parser.add_argument("--compression", choices=["none", "fp16", "sq8", "pq"],
+                        help="How vectors are stored in the index (DOCQA_FAISS_COMPRESSION)")
+    parser.add_argument("--pq-m", type=int, help="PQ bytes per vector (DOCQA_FAISS_PQ_M)")
+    parser.add_argument("--rerank", action=argparse.BooleanOptionalAction,
+                        help="Keep full vectors on disk to re-rank compressed results (DOCQA_FAISS_RERANK)")
+    args = parser.parse_args(argv)
+
+    overrides = {
+        "faiss_index_dir": args.index_dir,
+        "faiss_index_type": args.index_type,
+        "faiss_hnsw_m": args.hnsw_m,
+        "faiss_ivf_nlist": args.ivf_nlist,
+        "faiss_compression": args.compression,
+        "faiss_pq_m": args.pq_m,
+        "faiss_rerank": args.rerank,
+    }
+    settings = Settings(**{k: v for k, v in overrides.items() if v is not None})
+    settings.validate()
+
+    result = QAEngine(settings).rebuild_index()
+    print(json.dumps(result))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,70 @@
+import sqlite3
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Sequence, Union
+
+import numpy as np
+
+# SQLite limits the number of bound parameters per statement.
+_SQL_BATCH = 500
+
+
+class FullVectorStore:
+    """
+    Full-precision float32 vectors keyed by docstore id, kept on disk in SQLite.
+    Used to re-rank candidates found in a compressed index exactly.
+    """
+
+    def __init__(self, path: Union[str, Path]):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = Lock()
+        self._conn = sqlite3.connect(str(self.path), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors ("
+            " id TEXT PRIMARY KEY,"
+            " vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    def put_many(self, ids: Sequence[str], vectors: np.ndarray) -> None:
+        rows = [
+            (doc_id, np.asarray(vec, dtype=np.float32).tobytes())
+            for doc_id, vec in zip(ids, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (id, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def get_many(self, ids: Sequence[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for start in range(0, len(ids), _SQL_BATCH):
+                batch = list(ids[start:start + _SQL_BATCH])
+                marks = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT id, vector FROM vectors WHERE id IN ({marks})", batch
+                ).fetchall()
+                for doc_id, blob in rows:
+                    found[doc_id] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def delete_many(self, ids: Sequence[str]) -> None:
+        with self._lock:
+            for start in range(0, len(ids), _SQL_BATCH):
+                batch = list(ids[start:start + _SQL_BATCH])
+                marks = ",".join("?" * len(batch))
+                self._conn.execute(f"DELETE FROM vectors WHERE id IN ({marks})", batch)
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM vectors").fetchone()
+        return count
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,181 @@
+import math
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+TokenCounter = Callable[[str], int]
+
+# Conservative for English prose (usually ~4): overestimating only leaves budget unused,
+# underestimating overflows the model's context window.
+_CHARS_PER_TOKEN = 3.5
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / _CHARS_PER_TOKEN)
+
+
+def make_token_counter(tokenizer: str = "estimate", encoding: str = "cl100k_base") -> TokenCounter:
+    """
+    Token counter for prompt budgeting: "estimate" (from the character count, no
+    dependencies) or "tiktoken" (exact for OpenAI models; downloads the encoding once).
+    """
+    if tokenizer == "estimate":
+        return estimate_tokens
+    if tokenizer == "tiktoken":
+        import tiktoken
+
+        enc = tiktoken.get_encoding(encoding)
+        return lambda text: len(enc.encode(text, disallowed_special=()))
+    raise ValueError(f"Unsupported tokenizer={tokenizer}")
+
+
+class PackedContext(NamedTuple):
+    """
+    The context text sent to the LLM, the retrieved chunks it includes (relevance
+    order) and its size in tokens.
+    """
+    text: str
+    docs_and_scores: List[Tuple[Document, float]]
+    tokens: int
+
+
+class _Passage:
+    """
+    One numbered context entry: a chunk, possibly merged with overlapping chunks of the
+    same source page.
+    """
+
+    def __init__(self, doc: Document, score: float):
+        md = doc.metadata or {}
+        self.doc = doc
+        self.score = score
+        self.key = (md.get("source"), md.get("page"), md.get("row_index"))
+        self.text = doc.page_content or ""
+        self.start = md.get("start_index")
+        self.end = self.start + len(doc.page_content) if self.start is not None else None
+
+    def merge(self, doc: Document) -> Optional[str]:
+        """
+        Text of this passage extended by doc if doc overlaps or touches it, else None.
+        """
+        md = doc.metadata or {}
+        start = md.get("start_index")
+        if self.start is None or start is None:
+            return None
+        if (md.get("source"), md.get("page"), md.get("row_index")) != self.key:
+            return None
+        text = doc.page_content or ""
+        end = start + len(text)
+        if start > self.end or end < self.start:
+            return None
+
+        merged = self.text
+        if start < self.start:
+            merged = text[:self.start - start] + merged
+        if end > self.end:
+            merged = merged + text[self.end - start:]
+        return merged
+
+    def extend(self, doc: Document, text: str) -> None:
+        start = doc.metadata["start_index"]
+        self.start, self.end = min(self.start, start), max(self.end, start + len(doc.page_content))
+        self.text = text
+
+    def format(self, number: int, text: Optional[str] = None) -> str:
+        md = self.doc.metadata or {}
+        cite = []
+        if md.get("source_type") == "pdf" and "page" in md:
+            cite.append(f"page={md['page']}")
+        if md.get("source_type") == "json" and md.get("id"):
+            cite.append(f"id={md['id']}")
+        cite_str = ", ".join(cite) if cite else "no-meta"
+        return f"[{number}] ({cite_str}, score={self.score:.4f})\n{(self.text if text is None else text).strip()}"
+
+
+def _truncated(passage: _Passage, budget: int, count_tokens: TokenCounter) -> Optional[str]:
+    """
+    The longest prefix of passage's text whose formatted entry fits budget, if any.
+    """
+    lo, hi = 0, len(passage.text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if count_tokens(passage.format(1, passage.text[:mid])) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return passage.text[:lo].rstrip() if lo else None
+
+
+def pack_context(
+    docs_and_scores: Sequence[Tuple[Document, float]],
+    *,
+    budget: int,
+    count_tokens: TokenCounter = estimate_tokens,
+    merge_overlaps: bool = True,
+) -> PackedContext:
+    """
+    Build the LLM context from retrieved chunks, best first, until `budget` tokens are
+    used. Chunks that overlap or touch an included chunk of the same source page (by
+    `start_index`) are merged into it, so the splitter's overlap is sent only once.
+    Chunks that don't fit are skipped; a first chunk larger than the whole budget is
+    truncated.
+    """
+    separator = count_tokens("\n\n")
+    passages: List[_Passage] = []
+    costs: List[int] = []
+    included: List[Tuple[Document, float]] = []
+    used = 0
+
+    for doc, score in docs_and_scores:
+        if not (doc.page_content or "").strip():
+            continue
+
+        if merge_overlaps:
+            merged = None
+            for i, passage in enumerate(passages):
+                text = passage.merge(doc)
+                if text is not None:
+                    merged = i, text
+                    break
+            if merged is not None:
+                i, text = merged
+                cost = count_tokens(passages[i].format(i + 1, text)) + (separator if i else 0)
+                if used - costs[i] + cost <= budget:
+                    passages[i].extend(doc, text)
+                    used += cost - costs[i]
+                    costs[i] = cost
+                    included.append((doc, score))
+                continue
+
+        passage = _Passage(doc, score)
+        cost = count_tokens(passage.format(len(passages) + 1)) + (separator if passages else 0)
+        if used + cost > budget:
+            if passages:
+                continue
+            text = _truncated(passage, budget, count_tokens)
+            if text is None:
+                break
+            passage.text, passage.start, passage.end = text, None, None
+            cost = count_tokens(passage.format(1))
+        passages.append(passage)
+        costs.append(cost)
+        included.append((doc, score))
+        used += cost
+
+    text = "\n\n".join(p.format(i) for i, p in enumerate(passages, 1))
+    return PackedContext(text=text, docs_and_scores=included, tokens=count_tokens(text) if text else 0)
+
+
+def context_budget(
+    *,
+    num_ctx: int,
+    answer_tokens: int,
+    prompt_tokens: int,
+    max_tokens: int = 0,
+) -> int:
+    """
+    Tokens left for retrieved context: the model window minus the prompt around the
+    context and the tokens reserved for the answer, capped at max_tokens if set.
+    """
+    budget = max(num_ctx - answer_tokens - prompt_tokens, 0)
+    return min(budget, max_tokens) if max_tokens > 0 else budget
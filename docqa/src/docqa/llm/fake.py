@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import re
+import time
+from functools import lru_cache
+from typing import Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from docqa.indexing.bm25 import tokenize
+
+_FIRST_PASSAGE = re.compile(r"^\[1\][^\n]*\n(.+?)(?:\n\n\[2\]|\Z)", re.S | re.M)
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+@lru_cache(maxsize=65536)
+def _bucket(token: str, dim: int) -> Tuple[int, float]:
+    h = int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+    return h % dim, 1.0 if h >> 63 else -1.0
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Offline stand-in for an embeddings provider: hashed bag-of-words vectors (feature
+    hashing over BM25 tokens), so equal texts get equal vectors and texts sharing words
+    are close. Every request sleeps `latency_s` to mimic a server round trip.
+    """
+
+    def __init__(self, *, dim: int = 384, latency_s: float = 0.0):
+        self.dim = dim
+        self.latency_s = latency_s
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            index, sign = _bucket(token, self.dim)
+            vector[index] += sign
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        return [self._vector(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+def fake_answer(prompt: str) -> str:
+    """
+    The first sentence of the first context passage in a grounded prompt, or the
+    prompt's not-found reply if it has no context.
+    """
+    match = _FIRST_PASSAGE.search(prompt)
+    if match is None:
+        return "Answer not found"
+    text = " ".join(match.group(1).split())
+    return _SENTENCE_END.split(text, maxsplit=1)[0][:300]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for a chat model: answers with `fake_answer` after `latency_s`,
+    streaming it word by word.
+    """
+
+    model: str = "fake"
+    latency_s: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake"
+
+    @staticmethod
+    def _prompt(messages: List[BaseMessage]) -> str:
+        return "\n".join(str(m.content) for m in messages)
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        message = AIMessage(content=fake_answer(self._prompt(messages)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        message = AIMessage(content=fake_answer(self._prompt(messages)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        words = fake_answer(self._prompt(messages)).split(" ")
+        for i, word in enumerate(words):
+            yield ChatGenerationChunk(message=AIMessageChunk(content=word if i == 0 else f" {word}"))
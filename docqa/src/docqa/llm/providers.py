@@ -1,19 +1,142 @@
+import asyncio
 import os
+import random
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
 from docqa.config import Settings
+from docqa.llm.context import estimate_tokens
+
+T = TypeVar("T")
+
+# Upper bound on one backoff sleep, whatever the attempt number or Retry-After says.
+_MAX_BACKOFF_S = 30.0
+_RETRYABLE_STATUS = {408, 409, 429}
+
+
+class _LoopTransports:
+    """
+    An httpx async transport keeping one connection pool per event loop, since async
+    connections can only be used on the loop that opened them (e.g. the API's loop vs.
+    `asyncio.run` in an ingestion worker).
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self._lock = Lock()
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = (
+            weakref.WeakKeyDictionary())
+
+    def _current(self):
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(limits=self.limits)
+        return transport
+
+    async def handle_async_request(self, request):
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+
+class HttpPool(NamedTuple):
+    """
+    Keep-alive connection pools (httpx transports) shared by every provider client, so
+    the chat model and the embeddings reuse the same connections to the server. Async
+    requests share a pool per event loop (see `_LoopTransports`).
+    """
+    timeout: Any
+    transport: Any
+    async_transport: Any
+
+    def client(self):
+        import httpx
+        return httpx.Client(transport=self.transport, timeout=self.timeout)
+
+    def async_client(self):
+        import httpx
+        return httpx.AsyncClient(transport=self.async_transport, timeout=self.timeout)
+
+
+@lru_cache(maxsize=None)
+def _http_pool(
+    max_connections: int,
+    max_keepalive: int,
+    keepalive_expiry_s: float,
+    connect_timeout_s: float,
+    timeout_s: float,
+) -> HttpPool:
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive,
+        keepalive_expiry=keepalive_expiry_s,
+    )
+    return HttpPool(
+        timeout=httpx.Timeout(timeout_s, connect=connect_timeout_s),
+        transport=httpx.HTTPTransport(limits=limits),
+        async_transport=_LoopTransports(limits),
+    )
+
+
+def http_pool(settings: Settings) -> HttpPool:
+    """
+    The connection pools for these settings; the same pools are returned for equal settings.
+    """
+    return _http_pool(
+        settings.http_max_connections,
+        settings.http_max_keepalive,
+        settings.http_keepalive_expiry_s,
+        settings.http_connect_timeout_s,
+        settings.http_timeout_s,
+    )
+
+
+def _ollama_client_kwargs(pool: HttpPool) -> Dict[str, Any]:
+    # Extra kwargs of the ollama clients are passed to their httpx clients.
+    return {
+        "client_kwargs": {"timeout": pool.timeout},
+        "sync_client_kwargs": {"transport": pool.transport},
+        "async_client_kwargs": {"transport": pool.async_transport},
+    }
 
 
 def make_llm(settings: Settings):
     """
     Returns a chat model instance based on Settings.
-    Supported: ollama, openai
+    Supported: ollama, openai, fake
     """
     provider = settings.llm_provider.lower()
+    pool = http_pool(settings)
 
     if provider == "ollama":
         from langchain_ollama import ChatOllama
         return ChatOllama(
             model=settings.llm_model,
             temperature=settings.llm_temperature,
+            num_ctx=settings.llm_num_ctx,
+            **_ollama_client_kwargs(pool),
         )
 
     if provider == "openai":
@@ -26,28 +149,308 @@ def make_llm(settings: Settings):
         return ChatOpenAI(
             model=settings.llm_model,
             temperature=settings.llm_temperature,
+            http_client=pool.client(),
+            http_async_client=pool.async_client(),
         )
 
+    if provider == "fake":
+        from docqa.llm.fake import FakeChatModel
+        return FakeChatModel(latency_s=settings.fake_llm_latency_ms / 1000.0)
+
     raise ValueError(f"Unsupported llm_provider={provider}")
 
 
 def make_embeddings(settings: Settings):
     """
-    Returns an embeddings model instance based on Settings.
-    Supported: ollama, openai
+    Returns an embeddings model instance based on Settings, wrapped in a
+    BatchingEmbeddings client.
+    Supported: ollama, openai, fake
     """
     provider = settings.embed_provider.lower()
+    pool = http_pool(settings)
 
     if provider == "ollama":
         from langchain_ollama import OllamaEmbeddings
-        return OllamaEmbeddings(model=settings.embed_model)
+        model = OllamaEmbeddings(model=settings.embed_model, **_ollama_client_kwargs(pool))
 
-    if provider == "openai":
+    elif provider == "openai":
         from langchain_openai import OpenAIEmbeddings
         if not settings.openai_api_key:
             raise ValueError("DOCQA_OPENAI_API_KEY is required when embed_provider=openai")
         os.environ["OPENAI_API_KEY"] = settings.openai_api_key
 
-        return OpenAIEmbeddings(model=settings.embed_model)
+        # Batching and retries are done by the wrapper; don't repeat them per request.
+        model = OpenAIEmbeddings(
+            model=settings.embed_model,
+            chunk_size=settings.embed_batch_size,
+            max_retries=0,
+            http_client=pool.client(),
+            http_async_client=pool.async_client(),
+        )
+
+    elif provider == "fake":
+        from docqa.llm.fake import FakeEmbeddings
+        model = FakeEmbeddings(
+            dim=settings.fake_embed_dim, latency_s=settings.fake_embed_latency_ms / 1000.0)
+
+    else:
+        raise ValueError(f"Unsupported embed_provider={provider}")
+
+    return BatchingEmbeddings(
+        model,
+        batch_size=settings.embed_batch_size,
+        max_concurrency=settings.embed_max_concurrency,
+        max_retries=settings.embed_max_retries,
+        backoff_s=settings.embed_retry_backoff_s,
+        requests_per_minute=settings.embed_requests_per_minute,
+        tokens_per_minute=settings.embed_tokens_per_minute,
+    )
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter: `rate` units per second, bursts up to `capacity`.
+
+    `reserve` takes the units at once (the level may go negative) and returns how long
+    the caller must wait before using them, so no lock is held while sleeping and
+    requests larger than the capacity are still let through eventually.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._level = self.capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._updated) * self.rate)
+            self._updated = now
+            self._level -= amount
+            return -self._level / self.rate if self._level < 0 else 0.0
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """
+    Whether an embedding request failing with exc is worth retrying: connection errors,
+    timeouts, rate limiting (429) and server errors (5xx).
+    """
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in _RETRYABLE_STATUS or status >= 500
+
+    try:
+        import httpx
+        if isinstance(exc, httpx.TransportError):
+            return True
+    except ImportError:
+        pass
+    try:
+        import openai
+        if isinstance(exc, openai.APIConnectionError):
+            return True
+    except ImportError:
+        pass
+    return False
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class BatchingEmbeddings(Embeddings):
+    """
+    Embeddings client around a provider model: texts are sent in requests of at most
+    `batch_size`, up to `max_concurrency` at a time, optionally paced by requests- and
+    tokens-per-minute limits. Requests failing with a retryable error are retried with
+    exponential backoff (or the server's Retry-After), so one transient error doesn't
+    abort a whole ingest.
+
+    Vectors come back in input order. `stats` reports request and throughput counters.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        *,
+        batch_size: int = 16,
+        max_concurrency: int = 4,
+        max_retries: int = 5,
+        backoff_s: float = 0.5,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        count_tokens: Callable[[str], int] = estimate_tokens,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.underlying = underlying
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_s = backoff_s
+        self.count_tokens = count_tokens
+        self._sleep = sleep
+
+        self._requests = TokenBucket(requests_per_minute / 60.0) if requests_per_minute > 0 else None
+        self._tokens = TokenBucket(tokens_per_minute / 60.0) if tokens_per_minute > 0 else None
+        # Bounds in-flight requests across all threads using this client; async requests
+        # are bounded by one semaphore per event loop (see `_async_slots`).
+        self._slots = BoundedSemaphore(max_concurrency)
+        self._loop_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+            weakref.WeakKeyDictionary())
+
+        self._counter_lock = Lock()
+        self.requests = 0
+        self.texts = 0
+        self.retries = 0
+        self.failures = 0
+        self.throttled_s = 0.0
+        self.busy_s = 0.0
+
+    def _batches(self, texts: Sequence[str]) -> List[List[str]]:
+        return [list(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+
+    def _count(self, **deltas: float) -> None:
+        with self._counter_lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+
+    def _throttle(self, texts: Sequence[str]) -> float:
+        """
+        Seconds to wait before sending texts under the configured rate limits.
+        """
+        wait = 0.0
+        if self._requests is not None:
+            wait = max(wait, self._requests.reserve(1))
+        if self._tokens is not None:
+            wait = max(wait, self._tokens.reserve(sum(self.count_tokens(t) for t in texts)))
+        if wait:
+            self._count(throttled_s=wait)
+        return wait
+
+    def _backoff(self, exc: BaseException, attempt: int) -> Optional[float]:
+        """
+        Seconds to wait before retrying after exc, or None if it shouldn't be retried.
+        """
+        if attempt >= self.max_retries or not is_retryable(exc):
+            self._count(failures=1)
+            return None
+        self._count(retries=1)
+        delay = _retry_after(exc)
+        if delay is None:
+            # Exponential with jitter, so parallel requests failing together don't retry together.
+            delay = self.backoff_s * (2 ** attempt) * (0.5 + random.random() / 2)
+        return min(delay, _MAX_BACKOFF_S)
+
+    def _call(self, fn: Callable[[], T], texts: Sequence[str]) -> T:
+        attempt = 0
+        while True:
+            wait = self._throttle(texts)
+            if wait:
+                self._sleep(wait)
+            with self._slots:
+                self._count(requests=1)
+                try:
+                    result = fn()
+                except Exception as exc:
+                    delay = self._backoff(exc, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    self._count(texts=len(texts))
+                    return result
+            self._sleep(delay)
+            attempt += 1
+
+    def _async_slots(self) -> asyncio.Semaphore:
+        """
+        The semaphore shared by every async request of this client on the running event
+        loop (an asyncio.Semaphore can't be used across loops).
+        """
+        loop = asyncio.get_running_loop()
+        with self._counter_lock:
+            slots = self._loop_slots.get(loop)
+            if slots is None:
+                slots = self._loop_slots[loop] = asyncio.Semaphore(self.max_concurrency)
+        return slots
+
+    async def _acall(self, fn: Callable[[], "asyncio.Future"], texts: Sequence[str]):
+        attempt = 0
+        while True:
+            wait = self._throttle(texts)
+            if wait:
+                await asyncio.sleep(wait)
+            async with self._async_slots():
+                self._count(requests=1)
+                try:
+                    result = await fn()
+                except Exception as exc:
+                    delay = self._backoff(exc, attempt)
+                    if delay is None:
+                        raise
+                else:
+                    self._count(texts=len(texts))
+                    return result
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        try:
+            batches = self._batches(texts)
+            if len(batches) <= 1 or self.max_concurrency == 1:
+                results = [self._call(lambda b=b: self.underlying.embed_documents(b), b) for b in batches]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+                    results = list(pool.map(
+                        lambda b: self._call(lambda: self.underlying.embed_documents(b), b), batches))
+        finally:
+            self._count(busy_s=time.perf_counter() - start)
+        return [vector for vectors in results for vector in vectors]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        start = time.perf_counter()
+        try:
+            results = await asyncio.gather(*(
+                self._acall(lambda b=b: self.underlying.aembed_documents(b), b)
+                for b in self._batches(texts)
+            ))
+        finally:
+            self._count(busy_s=time.perf_counter() - start)
+        return [vector for vectors in results for vector in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        start = time.perf_counter()
+        try:
+            return self._call(lambda: self.underlying.embed_query(text), [text])
+        finally:
+            self._count(busy_s=time.perf_counter() - start)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        start = time.perf_counter()
+        try:
+            return await self._acall(lambda: self.underlying.aembed_query(text), [text])
+        finally:
+            self._count(busy_s=time.perf_counter() - start)
 
-    raise ValueError(f"Unsupported embed_provider={provider}")
+    def stats(self) -> Dict[str, Optional[float]]:
+        with self._counter_lock:
+            requests, texts, busy_s = self.requests, self.texts, self.busy_s
+            retries, failures, throttled_s = self.retries, self.failures, self.throttled_s
+        return {
+            "requests": requests,
+            "texts": texts,
+            "retries": retries,
+            "failures": failures,
+            "throttled_s": round(throttled_s, 3),
+            "texts_per_s": (texts / busy_s) if busy_s else None,
+        }
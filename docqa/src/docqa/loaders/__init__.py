@@ -1,4 +1,4 @@
-from .pdf import load_pdf
-from .json import load_json
+from .pdf import load_pdf, iter_pdf, load_pdf_parallel, iter_pdf_parallel
+from .json import load_json, iter_json
 
-__all__ = [load_json, load_pdf]
\ No newline at end of file
+__all__ = [load_json, load_pdf, iter_json, iter_pdf, load_pdf_parallel, iter_pdf_parallel]
\ No newline at end of file
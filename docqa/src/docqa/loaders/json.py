@@ -1,9 +1,11 @@
 import json
 from pathlib import Path
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterator, List, Union
 
 from langchain_core.documents import Document
 
+from docqa.metrics import stage
+
 
 def _read_json(path: Union[str, Path]) -> Any:
     p = Path(path)
@@ -14,30 +16,23 @@ def _read_json(path: Union[str, Path]) -> Any:
     return json.loads(raw)
 
 
-def load_json(
+def iter_json(
     path: Union[str, Path],
     *,
     include_answer: bool = True,
     include_comments: bool = True,
-) -> List[Document]:
+) -> Iterator[Document]:
     """
-    Load a JSON knowledge base as LangChain Documents.
-
-    Each record becomes one Document with rich text:
-      Question: ...
-      Answer: ...
-      Comments: ...
-
-    Metadata includes:
-      - source, source_type
+    Lazily yield one Document per JSON record; see `load_json`.
+    The file itself is parsed in one go, but Documents are built on demand.
     """
     p = Path(path)
-    data = _read_json(p)
+    with stage("parse"):
+        data = _read_json(p)
 
     if not isinstance(data, list):
         raise ValueError("Expected top-level JSON array (list).")
 
-    docs: List[Document] = []
     for i, item in enumerate(data):
         if not isinstance(item, dict):
             raise ValueError(f"Expected list items to be objects (dict). Got {type(item)} at index {i}")
@@ -60,6 +55,26 @@ def load_json(
             "row_index": i,
         }
 
-        docs.append(Document(page_content=text, metadata=metadata))
+        yield Document(page_content=text, metadata=metadata)
+
+
+def load_json(
+    path: Union[str, Path],
+    *,
+    include_answer: bool = True,
+    include_comments: bool = True,
+) -> List[Document]:
+    """
+    Load a JSON knowledge base as LangChain Documents.
+
+    Each record becomes one Document with rich text:
+      Question: ...
+      Answer: ...
+      Comments: ...
 
-    return docs
+    Metadata includes:
+      - source, source_type
+    """
+    return list(
+        iter_json(path, include_answer=include_answer, include_comments=include_comments)
+    )
@@ -0,0 +1,260 @@
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Seconds: from a cached lookup (~0.1 ms) to a slow generation (minutes).
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Timings:
+    """
+    Stage durations of one call, in seconds.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self._lock = Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Seconds per stage so far, copied so stages still running elsewhere can't change it.
+        """
+        with self._lock:
+            return dict(self.stages)
+
+    def as_dict(self) -> Dict[str, float]:
+        """
+        Milliseconds per stage plus "total_ms", for returning to callers.
+        """
+        stages = self.snapshot()
+        timings = {f"{name}_ms": round(seconds * 1000.0, 3) for name, seconds in stages.items()}
+        timings["total_ms"] = round(self.total() * 1000.0, 3)
+        return timings
+
+
+class _Frame:
+    __slots__ = ("children",)
+
+    def __init__(self):
+        self.children = 0.0
+
+
+_timings: ContextVar[Optional[Timings]] = ContextVar("docqa_timings", default=None)
+_frame: ContextVar[Optional[_Frame]] = ContextVar("docqa_timing_frame", default=None)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Timings]:
+    """
+    Collect the stages timed within the block, including tasks and threads started
+    from it with a copy of the context (e.g. `asyncio.to_thread`).
+    """
+    timings = Timings()
+    token = _timings.set(timings)
+    frame_token = _frame.set(None)
+    try:
+        yield timings
+    finally:
+        _frame.reset(frame_token)
+        _timings.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time the block as stage `name` of the current `collect_timings()`, if any.
+    Stage times are exclusive: time spent in a nested stage is not counted again in
+    the outer one, so stages add up to about the total. Must not stay open across a
+    generator's `yield`.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+
+    parent = _frame.get()
+    frame = _Frame()
+    token = _frame.set(frame)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _frame.reset(token)
+        timings.add(name, max(elapsed - frame.children, 0.0))
+        if parent is not None:
+            parent.children += elapsed
+
+
+def timed_iter(name: str, items: Iterable[T]) -> Iterator[T]:
+    """
+    Yield from items, timing the work of producing each one as stage `name`.
+    """
+    iterator = iter(items)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+# -----------------------
+# Prometheus metrics
+# -----------------------
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(str(labels[n]) for n in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * len(self.buckets), [0.0]))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        found = self._values.get(tuple(str(labels[n]) for n in self.labelnames))
+        return sum(found[0]) if found else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = sorted((key, (list(c), t[0])) for key, (c, t) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def render_values(
+    name: str,
+    help: str,
+    values: Dict[LabelValues, Optional[float]],
+    labelnames: Sequence[str] = (),
+    kind: str = "gauge",
+) -> List[str]:
+    """
+    Exposition lines for values read at scrape time (a gauge, or a counter kept
+    elsewhere); None values are left out.
+    """
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for key, value in sorted(values.items()):
+        if value is not None:
+            lines.append(f"{name}{_labels(labelnames, key)} {_number(value)}")
+    return lines
+
+
+class EngineMetrics:
+    """
+    Counters and histograms recorded by a QAEngine.
+    """
+
+    def __init__(self):
+        self.stage_seconds = Histogram(
+            "docqa_stage_seconds", "Time spent per stage of an operation",
+            LATENCY_BUCKETS, ("operation", "stage"))
+        self.operation_seconds = Histogram(
+            "docqa_operation_seconds", "End-to-end time of an operation",
+            LATENCY_BUCKETS, ("operation",))
+        self.prompt_tokens = Histogram(
+            "docqa_prompt_context_tokens", "Tokens of retrieved context sent to the LLM", TOKEN_BUCKETS)
+        self.chunks_retrieved = Histogram(
+            "docqa_chunks_retrieved", "Chunks returned by retrieval per question", COUNT_BUCKETS)
+        self.chunks_used = Histogram(
+            "docqa_chunks_used", "Retrieved chunks that fit in the prompt per question", COUNT_BUCKETS)
+        self.answers = Counter(
+            "docqa_answers_total", "Questions answered, by outcome", ("outcome",))
+        self.ingested_pages = Counter("docqa_ingested_pages_total", "Pages or records ingested")
+        self.ingested_chunks = Counter("docqa_ingested_chunks_total", "Chunks added to the index")
+
+    def observe(self, operation: str, timings: Timings) -> None:
+        for name, seconds in timings.snapshot().items():
+            self.stage_seconds.observe(seconds, operation=operation, stage=name)
+        self.operation_seconds.observe(timings.total(), operation=operation)
+
+    def render(self) -> List[str]:
+        lines: List[str] = []
+        for metric in (
+            self.stage_seconds,
+            self.operation_seconds,
+            self.prompt_tokens,
+            self.chunks_retrieved,
+            self.chunks_used,
+            self.answers,
+            self.ingested_pages,
+            self.ingested_chunks,
+        ):
+            lines.extend(metric.render())
+        return lines
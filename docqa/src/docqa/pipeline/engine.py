@@ -1,161 +1,1614 @@
+import asyncio
+import time
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from threading import RLock
-from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from threading import Lock, Thread
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+import numpy as np
 from langchain_core.documents import Document
+from langchain_community.vectorstores import FAISS
 
 from docqa.config import Settings
-from docqa.chunking import split_documents
-from docqa.indexing.faiss_store import load_faiss, add_documents_to_faiss, save_faiss
-from docqa.llm.providers import make_llm, make_embeddings
+from docqa.cache import (
+    CachedEmbeddings,
+    EmbeddingStore,
+    QueryEmbeddingCache,
+    SingleFlight,
+    answer_cache_key,
+    make_answer_cache,
+)
+from docqa.chunking import iter_split_documents
+from docqa.indexing.faiss_store import (
+    load_faiss,
+    add_documents_to_faiss,
+    extend_faiss,
+    merge_segments,
+    embed_documents,
+    read_index_version,
+    append_segment,
+    write_segment,
+    load_segment,
+    discard_segments,
+    bump_index_version,
+    compact_segments,
+    read_manifest,
+    read_deleted,
+    load_lexical,
+    subset_faiss,
+)
+from docqa.indexing.ann import (
+    SegmentedIndex,
+    bytes_per_vector,
+    configure_search,
+    index_compression_of,
+    index_type_of,
+    index_vectors,
+    rebuild_faiss,
+    trained_layout,
+)
+from docqa.indexing.bm25 import BM25Index
+from docqa.indexing.dedup import (
+    HASH_KEY,
+    SIMHASH_KEY,
+    DedupIndex,
+    content_hash,
+    fingerprints_of,
+    simhash,
+)
+from docqa.indexing.metadata import Filters, MetadataIndex, validate_filters
+from docqa.indexing.vectors import FullVectorStore
+from docqa.llm.providers import BatchingEmbeddings, make_llm, make_embeddings
+from docqa.metrics import EngineMetrics, Timings, collect_timings, render_values, stage
+from docqa.llm.context import context_budget, make_token_counter, pack_context
 from docqa.llm.prompts import build_grounded_prompt
-from docqa.retrieval.retriever import retrieve
-from docqa.loaders.pdf import load_pdf
-from docqa.loaders.json import load_json
+from docqa.retrieval.retriever import retrieve, aretrieve, retrieve_many, aretrieve_many
+from docqa.loaders.pdf import iter_pdf_parallel
+from docqa.loaders.json import iter_json
 
 PathLike = Union[str, Path]
 
+# Receives partial progress updates, e.g. {"pages_parsed": 12} or {"persisted": True}.
+ProgressFn = Callable[[Dict[str, Any]], None]
+
+# Chunk metadata key naming the document a chunk belongs to (for upsert / delete).
+DOCUMENT_KEY = "document_id"
+
+
+class DocumentNotFound(LookupError):
+    """Raised when no indexed chunk carries the given document_id."""
+
+
+def _report(progress: Optional[ProgressFn], **update: Any) -> None:
+    if progress is not None:
+        progress(update)
+
+
+def _take(items: Iterator[Document], n: int) -> List[Document]:
+    return list(islice(items, n))
+
+
+class IndexSnapshot(NamedTuple):
+    """
+    An immutable view of the index. Readers hold on to one for a whole request.
+    """
+    store: Optional[FAISS]
+    version: Optional[str]
+    lexical: Optional[BM25Index] = None
+    metadata: Optional[MetadataIndex] = None
+
+
+class _Replacement(NamedTuple):
+    """
+    The indexed chunks of a document being upserted, as of when the upsert started.
+    """
+    store: FAISS
+    positions: Dict[str, int]
+    fingerprints: DedupIndex
+
 
 class QAEngine:
     """
     Core RAG engine:
     - ingest docs into a persistent FAISS store
     - retrieve + answer with an LLM
+
+    Concurrency: readers never lock. They take the current IndexSnapshot and use it for
+    the whole request. Ingestion embeds without any lock, then, under a writer-only lock,
+    adds its chunks to the store as a new segment (see `extend_faiss`) and publishes it
+    by swapping the snapshot reference.
+
+    Persistence: each ingest writes only its own chunks as an immutable segment on disk;
+    segments are searched side by side and compacted into one once there are too many.
+    Deleting a document only records tombstones; its vectors are skipped at search time
+    and purged by the next compaction.
     """
 
     def __init__(self, settings: Optional[Settings] = None):
         self.settings = settings or Settings()
         self.settings.validate()
 
-        self._lock = RLock()
+        self._write_lock = Lock()
+        # Held while a background compaction is scheduled or running.
+        self._compact_lock = Lock()
 
+        embed_namespace = f"{self.settings.embed_provider}:{self.settings.embed_model}"
         self.embeddings = make_embeddings(self.settings)
+        self.embed_client: Optional[BatchingEmbeddings] = (
+            self.embeddings if isinstance(self.embeddings, BatchingEmbeddings) else None)
+        if self.settings.embed_cache_enabled:
+            self.embeddings = CachedEmbeddings(
+                self.embeddings,
+                EmbeddingStore(
+                    self.settings.embed_cache_path,
+                    max_entries=self.settings.embed_cache_max_entries,
+                ),
+                namespace=embed_namespace,
+            )
+
+        self.query_cache: Optional[QueryEmbeddingCache] = None
+        if self.settings.query_cache_max_entries > 0:
+            self.query_cache = QueryEmbeddingCache(
+                self.embeddings,
+                namespace=embed_namespace,
+                max_entries=self.settings.query_cache_max_entries,
+            )
+
         self.llm = make_llm(self.settings)
-        self.vector_store = load_faiss(self.settings.faiss_index_dir, self.embeddings)
+        self._count_tokens = make_token_counter(self.settings.context_tokenizer)
+
+        self.full_vectors: Optional[FullVectorStore] = None
+        if self.settings.faiss_rerank:
+            self.full_vectors = FullVectorStore(self.settings.faiss_full_vectors_path)
+
+        # Cached answers are keyed by index version; every ingest bumps it.
+        self.answer_cache = make_answer_cache(self.settings)
+        self.metrics = EngineMetrics()
+        # Identical questions already being answered wait for that answer (same key).
+        self.inflight: Optional[SingleFlight] = SingleFlight() if self.settings.coalesce_answers else None
+        store = load_faiss(
+            self.settings.faiss_index_dir,
+            self.embeddings,
+            mmap=self.settings.faiss_mmap,
+        )
+        lexical = None
+        metadata = None
+        deleted = set(read_deleted(self.settings.faiss_index_dir))
+        if store is not None:
+            if self.settings.bm25_enabled:
+                lexical = load_lexical(self.settings.faiss_index_dir, store)
+            metadata = self._metadata_index(store)
+            if deleted:
+                gone = np.asarray(
+                    [p for p, doc_id in store.index_to_docstore_id.items() if doc_id in deleted],
+                    dtype=np.int64,
+                )
+                metadata = metadata.without(gone, self._chunk_metadatas(store, gone))
+
+        # Fingerprints of indexed chunks; only writers use it, updated under the write lock.
+        self._dedup: Optional[DedupIndex] = None
+        if self.settings.dedup_enabled:
+            self._dedup = (
+                DedupIndex.from_store(
+                    store, max_distance=self.settings.dedup_simhash_distance, exclude=deleted)
+                if store is not None
+                else self._new_dedup()
+            )
+
+        self._snapshot = IndexSnapshot(
+            store=self._searchable(store) if store is not None else None,
+            version=read_index_version(self.settings.faiss_index_dir),
+            lexical=lexical,
+            metadata=metadata,
+        )
+
+    @property
+    def vector_store(self) -> Optional[FAISS]:
+        return self._snapshot.store
+
+    @property
+    def index_version(self) -> Optional[str]:
+        return self._snapshot.version
+
+    def _metadata_fields(self) -> List[str]:
+        fields = list(self.settings.filter_fields)
+        return fields if DOCUMENT_KEY in fields else [*fields, DOCUMENT_KEY]
+
+    @staticmethod
+    def _doc_at(store: FAISS, position: int) -> Document:
+        return store.docstore.search(store.index_to_docstore_id[int(position)])
+
+    @classmethod
+    def _chunk_metadatas(cls, store: FAISS, positions: Iterable[int]) -> Iterator[Dict[str, Any]]:
+        for position in positions:
+            md = cls._doc_at(store, position).metadata or {}
+            # Chunks ingested before document ids existed belong to their source file.
+            yield md if DOCUMENT_KEY in md else {**md, DOCUMENT_KEY: md.get("source")}
+
+    def _metadata_index(self, store: FAISS) -> MetadataIndex:
+        return MetadataIndex.from_metadatas(
+            self._metadata_fields(), self._chunk_metadatas(store, range(store.index.ntotal)))
+
+    def _new_dedup(self) -> DedupIndex:
+        return DedupIndex(max_distance=self.settings.dedup_simhash_distance)
+
+    def _unique(
+        self,
+        batch: List[Document],
+        fresh: DedupIndex,
+        counts: Dict[str, int],
+        replacement: Optional[_Replacement] = None,
+    ) -> List[Document]:
+        """
+        Drop chunks duplicating indexed ones or earlier chunks of this ingest (`fresh`),
+        recording their fingerprints in the metadata of those kept. Chunks of the
+        document being replaced don't count as duplicates.
+        """
+        ignore = replacement.fingerprints if replacement is not None else None
+        kept: List[Document] = []
+        for d in batch:
+            digest, fingerprint = content_hash(d.page_content), simhash(d.page_content)
+            kind = (
+                self._dedup.duplicate_of(digest, fingerprint, ignore=ignore)
+                or fresh.duplicate_of(digest, fingerprint)
+            )
+            if kind is not None:
+                counts["duplicates" if kind == "exact" else "near_duplicates"] += 1
+                continue
+            fresh.add(digest, fingerprint)
+            d.metadata[HASH_KEY] = digest
+            d.metadata[SIMHASH_KEY] = fingerprint
+            kept.append(d)
+        return kept
+
+    def _replacement(self, document_id: str) -> Optional[_Replacement]:
+        snapshot = self._snapshot
+        if snapshot.store is None:
+            return None
+        positions = snapshot.metadata.select({DOCUMENT_KEY: document_id})
+        docs = [self._doc_at(snapshot.store, p) for p in positions]
+        return _Replacement(
+            store=snapshot.store,
+            positions={fingerprints_of(d)[0]: int(p) for d, p in zip(docs, positions)},
+            fingerprints=DedupIndex.from_documents(
+                docs, max_distance=self.settings.dedup_simhash_distance),
+        )
+
+    def _vectors_at(self, store: FAISS, positions: List[int]) -> np.ndarray:
+        """
+        Vectors at index positions, full precision when stored.
+        """
+        if self.full_vectors is not None:
+            ids = [store.index_to_docstore_id[p] for p in positions]
+            found = self.full_vectors.get_many(ids)
+            if len(found) == len(ids):
+                return np.stack([found[doc_id] for doc_id in ids])
+        return index_vectors(store.index, np.asarray(positions, dtype=np.int64))
+
+    def _reusable(
+        self,
+        batch: List[Document],
+        replacement: Optional[_Replacement],
+        counts: Dict[str, int],
+    ) -> List[Optional[np.ndarray]]:
+        """
+        Vectors for chunks whose text is unchanged in the document being replaced, None
+        for those that need embedding.
+        """
+        reused: List[Optional[np.ndarray]] = [None] * len(batch)
+        if replacement is None:
+            return reused
+
+        found: Dict[int, int] = {}
+        for i, d in enumerate(batch):
+            position = replacement.positions.get(d.metadata.get(HASH_KEY) or content_hash(d.page_content))
+            if position is not None:
+                found[i] = position
+        if found:
+            vectors = self._vectors_at(replacement.store, list(found.values()))
+            for i, vector in zip(found, vectors):
+                reused[i] = vector
+            counts["reused"] += len(found)
+        return reused
+
+    @staticmethod
+    def _fill(reused: List[Optional[np.ndarray]], embedded: Sequence[Sequence[float]]) -> List[Any]:
+        fresh = iter(embedded)
+        return [vector if vector is not None else next(fresh) for vector in reused]
+
+    def _chunks(
+        self,
+        docs: Iterable[Document],
+        counts: Dict[str, int],
+        document_id: Optional[str] = None,
+    ) -> Iterator[Document]:
+        """
+        Lazily split docs page by page, numbering chunks across the whole input and
+        tagging them with document_id (by default their source).
+        `counts` is updated as pages and chunks stream through.
+        """
+        def pages() -> Iterator[Document]:
+            for d in docs:
+                counts["pages"] += 1
+                yield d
+
+        chunks = iter_split_documents(
+            pages(),
+            chunk_size=self.settings.chunk_size,
+            overlap=self.settings.chunk_overlap,
+        )
+        for d in chunks:
+            d.metadata = d.metadata or {}
+            d.metadata.setdefault("chunk_index", counts["chunks"])
+            if document_id is not None:
+                d.metadata[DOCUMENT_KEY] = document_id
+            elif d.metadata.get("source") is not None:
+                d.metadata.setdefault(DOCUMENT_KEY, d.metadata["source"])
+            counts["chunks"] += 1
+            yield d
+
+    def _segment(self, delta: FAISS) -> Tuple[FAISS, Optional[BM25Index]]:
+        """
+        delta as a segment of its own, with its lexical index. Each segment is built as
+        configured on its own; IVF and PQ are only trained once the merged index is
+        large enough, at compaction.
+        """
+        if self.full_vectors is not None:
+            self.full_vectors.put_many(
+                [delta.index_to_docstore_id[i] for i in range(delta.index.ntotal)],
+                index_vectors(delta.index),
+            )
+        lexical = BM25Index.from_store(delta) if self.settings.bm25_enabled else None
+        return self._rebuilt(delta, only_if_type_differs=True), lexical
 
-    def ingest_documents(self, docs: List[Document]) -> Dict[str, Any]:
+    def _spill(self, delta: FAISS) -> str:
+        """
+        Write chunks of an ingest still in progress as an unpublished segment, so it
+        holds at most `ingest_spill_chunks` of them in memory. Returns the segment name
+        to pass to `_publish`.
+        """
+        segment, lexical = self._segment(delta)
+        return write_segment(segment, self.settings.faiss_index_dir, lexical=lexical)
+
+    def _publish(
+        self,
+        delta: Optional[FAISS],
+        fresh: Optional[DedupIndex] = None,
+        *,
+        replace: Optional[str] = None,
+        spilled: Sequence[str] = (),
+    ) -> int:
+        """
+        Persist newly embedded chunks as a new segment, add it to the current store
+        without copying it and swap the result in. Segments spilled earlier by the same
+        ingest are published with it, before delta. `fresh` holds the fingerprints of
+        all the ingest's chunks. With `replace`, the chunks of that document already
+        indexed are deleted in the same publish. Returns how many chunks were deleted.
+        """
+        with self._write_lock:
+            current = self._snapshot
+            gone = np.empty(0, dtype=np.int64)
+            if replace is not None and current.store is not None:
+                gone = current.metadata.select({DOCUMENT_KEY: replace})
+            if delta is None and not spilled and gone.size == 0:
+                if current.store is None:
+                    raise ValueError("No documents to add and store is None.")
+                return 0
+
+            index_dir = self.settings.faiss_index_dir
+            parts = [
+                load_segment(index_dir, name, self.embeddings, mmap=self.settings.faiss_mmap)
+                for name in spilled
+            ]
+            segment, lexical = self._segment(delta) if delta is not None else (None, None)
+            gone_docs = [self._doc_at(current.store, p) for p in gone]
+            version = append_segment(
+                segment,
+                index_dir,
+                lexical=lexical,
+                deleted=[current.store.index_to_docstore_id[int(p)] for p in gone],
+                written=spilled,
+            )
+            if segment is not None:
+                parts.append((segment, lexical))
+
+            store, metadata, lexical = current.store, current.metadata, current.lexical
+            if gone.size:
+                metadata = metadata.without(gone, self._chunk_metadatas(current.store, gone))
+                if self._dedup is not None:
+                    for doc in gone_docs:
+                        self._dedup.remove(*fingerprints_of(doc))
+            for part, part_lexical in parts:
+                store = part if store is None else extend_faiss(store, part)
+                part_metadata = self._metadata_index(part)
+                metadata = part_metadata if metadata is None else metadata.merged(part_metadata)
+                if self.settings.bm25_enabled and (lexical is not None or current.store is None):
+                    part_lexical = part_lexical or BM25Index.from_store(part)
+                    lexical = part_lexical if lexical is None else lexical.merged(part_lexical)
+            if self.settings.bm25_enabled and lexical is None:
+                lexical = BM25Index.from_store(store)
+
+            self._snapshot = IndexSnapshot(
+                store=self._searchable(store),
+                version=version,
+                lexical=lexical,
+                metadata=metadata,
+            )
+            if self._dedup is not None and fresh is not None:
+                self._dedup.update(fresh)
+
+        self._maybe_compact()
+        return int(gone.size)
+
+    def _rebuilt(self, store: FAISS, *, only_if_type_differs: bool = False) -> FAISS:
+        index_type = self.settings.faiss_index_type
+        compression = self.settings.faiss_compression
+        if only_if_type_differs:
+            # Small indexes stay flat / uncompressed until IVF / PQ can be trained.
+            wanted = trained_layout(
+                index_type,
+                compression,
+                store.index.ntotal,
+                ivf_nlist=self.settings.faiss_ivf_nlist,
+                min_points_per_centroid=self.settings.faiss_min_points_per_centroid,
+            )
+            if (index_type_of(store.index), index_compression_of(store.index)) == wanted:
+                return store
+
+        return rebuild_faiss(
+            store,
+            index_type,
+            compression=compression,
+            vectors=self._full_precision(store),
+            hnsw_m=self.settings.faiss_hnsw_m,
+            hnsw_ef_construction=self.settings.faiss_hnsw_ef_construction,
+            ivf_nlist=self.settings.faiss_ivf_nlist,
+            pq_m=self.settings.faiss_pq_m,
+            min_points_per_centroid=self.settings.faiss_min_points_per_centroid,
+        )
+
+    def _full_precision(self, store: FAISS) -> Optional[np.ndarray]:
+        """
+        Stored full vectors in index order, or None if any is missing.
+        """
+        if self.full_vectors is None:
+            return None
+        ids = [store.index_to_docstore_id[i] for i in range(store.index.ntotal)]
+        found = self.full_vectors.get_many(ids)
+        if len(found) < len(ids):
+            return None
+        return np.stack([found[doc_id] for doc_id in ids])
+
+    def _searchable(self, store: FAISS) -> FAISS:
+        configure_search(
+            store.index,
+            hnsw_ef_search=self.settings.faiss_hnsw_ef_search,
+            ivf_nprobe=self.settings.faiss_ivf_nprobe,
+        )
+        return store
+
+    def _purged(self, current: IndexSnapshot, *, retrain: bool = False) -> IndexSnapshot:
+        """
+        A snapshot without the deleted chunks of current, in a freshly built index
+        (a new version: approximate indexes can return different neighbours).
+        """
+        keep = current.metadata.select({})
+        store = subset_faiss(current.store, keep, vectors=self._full_precision(current.store))
+        if keep.size:
+            store = self._rebuilt(store, only_if_type_differs=not retrain)
+        return IndexSnapshot(
+            store=self._searchable(store),
+            version=bump_index_version(self.settings.faiss_index_dir),
+            lexical=current.lexical.subset(keep) if current.lexical is not None else None,
+            metadata=self._metadata_index(store),
+        )
+
+    def _merged(self, current: IndexSnapshot) -> IndexSnapshot:
+        """
+        current with its segments merged into one index, trained as configured once it's
+        large enough. Unless the result is exact, that gets a new version: approximate
+        indexes can return different neighbours.
+        """
+        store = self._rebuilt(merge_segments(current.store), only_if_type_differs=True)
+        exact = index_type_of(store.index) == "flat" and index_compression_of(store.index) == "none"
+        return current._replace(
+            store=self._searchable(store),
+            version=current.version if exact else bump_index_version(self.settings.faiss_index_dir),
+        )
+
+    def _drop_full_vectors(self, before: IndexSnapshot, after: IndexSnapshot) -> None:
+        if self.full_vectors is None or before.store is after.store:
+            return
+        kept = set(after.store.index_to_docstore_id.values())
+        self.full_vectors.delete_many(
+            [doc_id for doc_id in before.store.index_to_docstore_id.values() if doc_id not in kept])
+
+    def rebuild_index(self) -> Dict[str, Any]:
+        """
+        Rebuild the whole index as `faiss_index_type` (retraining IVF on all vectors) and
+        rewrite it on disk as a single segment. Readers use the old index until it's done.
+        Deleted chunks are purged.
+        """
+        with self._write_lock:
+            previous = self._snapshot
+            if previous.store is None:
+                raise ValueError("No index to rebuild.")
+            if previous.metadata.deleted_count:
+                current = self._purged(previous, retrain=True)
+                store = current.store
+            else:
+                current = previous
+                store = self._searchable(self._rebuilt(current.store))
+            compact_segments(
+                store, self.settings.faiss_index_dir, force=True, lexical=current.lexical)
+            # Approximate indexes can return different neighbours; don't reuse old answers.
+            self._snapshot = IndexSnapshot(
+                store=store,
+                version=bump_index_version(self.settings.faiss_index_dir),
+                lexical=current.lexical,
+                metadata=current.metadata,
+            )
+            self._drop_full_vectors(previous, current)
+
+        return {
+            "index_type": index_type_of(store.index),
+            "compression": index_compression_of(store.index),
+            "bytes_per_vector": bytes_per_vector(store.index),
+            "vectors": store.index.ntotal,
+            "index_dir": self.settings.faiss_index_dir,
+        }
+
+    def _maybe_compact(self) -> None:
+        max_segments = self.settings.faiss_max_segments
+        if max_segments <= 0 or self._compact_lock.locked():
+            return
+
+        manifest = read_manifest(self.settings.faiss_index_dir)
+        if manifest is None:
+            return
+        metadata = self._snapshot.metadata
+        deleted_share = metadata.deleted_count / len(metadata) if metadata else 0.0
+        if (
+            len(manifest["segments"]) <= max_segments
+            and deleted_share <= self.settings.faiss_max_deleted_fraction
+        ):
+            return
+
+        if not self._compact_lock.acquire(blocking=False):
+            return
+        try:
+            Thread(target=self._compact_in_background, name="docqa-compact", daemon=True).start()
+        except BaseException:
+            self._compact_lock.release()
+            raise
+
+    def _compact_in_background(self) -> None:
+        try:
+            self.compact()
+        finally:
+            self._compact_lock.release()
+
+    def compact(self) -> Dict[str, Any]:
+        """
+        Merge all segments into one, on disk and in memory, purging deleted chunks.
+        Readers are not blocked; ingests wait for the write lock until the merged segment
+        is written.
+        """
+        with self._write_lock:
+            current = self._snapshot
+            merged = 0
+            if current.store is None:
+                compacted = None
+            elif current.metadata.deleted_count:
+                compacted = self._purged(current)
+            elif isinstance(current.store.index, SegmentedIndex):
+                compacted = self._merged(current)
+            else:
+                compacted = None
+            if compacted is not None:
+                merged = compact_segments(
+                    compacted.store,
+                    self.settings.faiss_index_dir,
+                    force=True,
+                    lexical=compacted.lexical,
+                )
+                self._snapshot = compacted
+                self._drop_full_vectors(current, compacted)
+            elif current.store is not None:
+                merged = compact_segments(
+                    current.store, self.settings.faiss_index_dir, lexical=current.lexical)
+        return {"segments_merged": merged, "index_dir": self.settings.faiss_index_dir}
+
+    @staticmethod
+    def _embedded(counts: Dict[str, int]) -> int:
+        return counts["chunks"] - counts["duplicates"] - counts["near_duplicates"]
+
+    def _embed_cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.embeddings.stats() if isinstance(self.embeddings, CachedEmbeddings) else None
+
+    def _ingest_result(
+        self,
+        counts: Dict[str, int],
+        document_id: Optional[str] = None,
+        replaced: Optional[int] = None,
+        timings: Optional[Timings] = None,
+        embed_cache: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        The result of an ingest; `embed_cache` is the embedding cache's stats() when it
+        started, so only its own hits and misses are reported.
+        """
+        self.metrics.ingested_pages.inc(counts["pages"])
+        self.metrics.ingested_chunks.inc(self._embedded(counts))
+        if timings is not None:
+            self.metrics.observe("ingest", timings)
+
+        result: Dict[str, Any] = {
+            "ingested_pages": counts["pages"],
+            "chunks_added": self._embedded(counts),
+            "duplicates_skipped": counts["duplicates"],
+            "near_duplicates_skipped": counts["near_duplicates"],
+            "index_dir": self.settings.faiss_index_dir,
+        }
+        if document_id is not None:
+            result["document_id"] = document_id
+        if replaced is not None:
+            result["chunks_replaced"] = replaced
+            result["chunks_reused"] = counts["reused"]
+        store = self._snapshot.store
+        if store is not None:
+            result["bytes_per_vector"] = bytes_per_vector(store.index)
+        if isinstance(self.embeddings, CachedEmbeddings):
+            result["embed_cache"] = self.embeddings.stats(since=embed_cache)
+        if self.embed_client is not None:
+            result["embed_requests"] = self.embed_client.stats()
+        if timings is not None:
+            result["timings"] = timings.as_dict()
+        return result
+
+    def ingest_documents(
+        self,
+        docs: Iterable[Document],
+        *,
+        progress: Optional[ProgressFn] = None,
+        document_id: Optional[str] = None,
+        replace: bool = False,
+    ) -> Dict[str, Any]:
         """
         Split and add docs to the vector store. Persists to disk.
+
+        docs may be a lazy iterator: pages are split as they arrive and chunks are embedded
+        in batches of `ingest_batch_size`, so only one batch is in flight at a time. The
+        batches are collected in a delta store, written to an unpublished segment on disk
+        whenever it reaches `ingest_spill_chunks`, and all of it is published at once at
+        the end. Only the vectors and texts of the delta are bounded that way: the
+        published index holds every chunk's text in memory.
+        With `dedup_enabled`, chunks already indexed (or repeated within docs) are skipped
+        before embedding.
+
+        Chunks are tagged with `document_id` (default: their source). With replace=True
+        they replace every chunk already indexed under that id; unchanged chunks reuse
+        their stored vectors instead of being embedded again.
+        """
+        if replace and document_id is None:
+            raise ValueError("replace=True needs a document_id")
+        with collect_timings() as timings:
+            counts = {"pages": 0, "chunks": 0, "duplicates": 0, "near_duplicates": 0, "reused": 0}
+            embed_cache = self._embed_cache_stats()
+            chunks = self._chunks(docs, counts, document_id)
+            fresh = self._new_dedup()
+            replacement = self._replacement(document_id) if replace else None
+
+            # Embedding is the slow part and needs no lock.
+            delta: Optional[FAISS] = None
+            spilled: List[str] = []
+            try:
+                while True:
+                    with stage("split"):
+                        batch = _take(chunks, self.settings.ingest_batch_size)
+                    if not batch:
+                        break
+                    if self._dedup is not None:
+                        with stage("dedup"):
+                            batch = self._unique(batch, fresh, counts, replacement)
+                    if batch:
+                        reused = self._reusable(batch, replacement, counts)
+                        missing = [d for d, vector in zip(batch, reused) if vector is None]
+                        with stage("embed"):
+                            embedded = embed_documents(missing, self.embeddings) if missing else []
+                        with stage("index"):
+                            delta = add_documents_to_faiss(
+                                delta, batch, self.embeddings, vectors=self._fill(reused, embedded))
+                            if delta.index.ntotal >= self.settings.ingest_spill_chunks:
+                                spilled.append(self._spill(delta))
+                                delta = None
+                    _report(progress, pages_parsed=counts["pages"], chunks_embedded=self._embedded(counts))
+            except BaseException:
+                discard_segments(self.settings.faiss_index_dir, spilled)
+                raise
+
+            with stage("publish"):
+                replaced = self._publish(
+                    delta, fresh, replace=document_id if replace else None, spilled=spilled)
+            _report(progress, persisted=True)
+
+        return self._ingest_result(
+            counts, document_id, replaced if replace else None, timings, embed_cache)
+
+    async def aingest_documents(
+        self,
+        docs: Iterable[Document],
+        *,
+        progress: Optional[ProgressFn] = None,
+        document_id: Optional[str] = None,
+        replace: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Async `ingest_documents`: batches are embedded with the async client while parsing,
+        splitting and the FAISS updates run in worker threads.
+        """
+        if replace and document_id is None:
+            raise ValueError("replace=True needs a document_id")
+        with collect_timings() as timings:
+            counts = {"pages": 0, "chunks": 0, "duplicates": 0, "near_duplicates": 0, "reused": 0}
+            embed_cache = self._embed_cache_stats()
+            chunks = self._chunks(docs, counts, document_id)
+            fresh = self._new_dedup()
+            replacement = self._replacement(document_id) if replace else None
+
+            delta: Optional[FAISS] = None
+            spilled: List[str] = []
+            try:
+                while True:
+                    with stage("split"):
+                        batch = await asyncio.to_thread(_take, chunks, self.settings.ingest_batch_size)
+                    if not batch:
+                        break
+                    if self._dedup is not None:
+                        with stage("dedup"):
+                            batch = await asyncio.to_thread(
+                                self._unique, batch, fresh, counts, replacement)
+                    if batch:
+                        reused = await asyncio.to_thread(self._reusable, batch, replacement, counts)
+                        missing = [d.page_content for d, vector in zip(batch, reused) if vector is None]
+                        with stage("embed"):
+                            embedded = await self.embeddings.aembed_documents(missing) if missing else []
+                        with stage("index"):
+                            delta = await asyncio.to_thread(
+                                add_documents_to_faiss,
+                                delta,
+                                batch,
+                                self.embeddings,
+                                vectors=self._fill(reused, embedded),
+                            )
+                            if delta.index.ntotal >= self.settings.ingest_spill_chunks:
+                                spilled.append(await asyncio.to_thread(self._spill, delta))
+                                delta = None
+                    _report(progress, pages_parsed=counts["pages"], chunks_embedded=self._embedded(counts))
+            except BaseException:
+                discard_segments(self.settings.faiss_index_dir, spilled)
+                raise
+
+            with stage("publish"):
+                replaced = await asyncio.to_thread(
+                    self._publish,
+                    delta,
+                    fresh,
+                    replace=document_id if replace else None,
+                    spilled=spilled,
+                )
+            _report(progress, persisted=True)
+
+        return self._ingest_result(
+            counts, document_id, replaced if replace else None, timings, embed_cache)
+
+    def _iter_pdf(self, pdf_path: PathLike) -> Iterator[Document]:
+        return iter_pdf_parallel(
+            pdf_path,
+            workers=self.settings.pdf_parse_workers,
+            pages_per_task=self.settings.pdf_pages_per_task,
+        )
+
+    def ingest_pdf(
+        self,
+        pdf_path: PathLike,
+        *,
+        progress: Optional[ProgressFn] = None,
+        document_id: Optional[str] = None,
+        replace: bool = False,
+    ) -> Dict[str, Any]:
+        return self.ingest_documents(
+            self._iter_pdf(pdf_path), progress=progress, document_id=document_id, replace=replace)
+
+    def ingest_json(
+        self,
+        json_path: PathLike,
+        *,
+        progress: Optional[ProgressFn] = None,
+        document_id: Optional[str] = None,
+        replace: bool = False,
+    ) -> Dict[str, Any]:
+        return self.ingest_documents(
+            iter_json(json_path), progress=progress, document_id=document_id, replace=replace)
+
+    async def aingest_pdf(
+        self,
+        pdf_path: PathLike,
+        *,
+        progress: Optional[ProgressFn] = None,
+        document_id: Optional[str] = None,
+        replace: bool = False,
+    ) -> Dict[str, Any]:
+        return await self.aingest_documents(
+            self._iter_pdf(pdf_path), progress=progress, document_id=document_id, replace=replace)
+
+    async def aingest_json(
+        self,
+        json_path: PathLike,
+        *,
+        progress: Optional[ProgressFn] = None,
+        document_id: Optional[str] = None,
+        replace: bool = False,
+    ) -> Dict[str, Any]:
+        return await self.aingest_documents(
+            iter_json(json_path), progress=progress, document_id=document_id, replace=replace)
+
+    # -----------------------
+    # Documents
+    # -----------------------
+    def upsert_document(
+        self,
+        document_id: str,
+        docs: Iterable[Document],
+        *,
+        progress: Optional[ProgressFn] = None,
+    ) -> Dict[str, Any]:
+        """
+        Replace every chunk of document_id with the chunks of docs (adding it if new).
+        Only chunks whose content changed are embedded.
+        """
+        return self.ingest_documents(docs, progress=progress, document_id=document_id, replace=True)
+
+    def delete_document(self, document_id: str) -> Dict[str, Any]:
+        """
+        Remove every chunk of document_id from search. Raises DocumentNotFound if none is
+        indexed. The vectors stay on disk as tombstones until the next compaction.
+        """
+        snapshot = self._snapshot
+        if snapshot.store is None or snapshot.metadata.select({DOCUMENT_KEY: document_id}).size == 0:
+            raise DocumentNotFound(document_id)
+
+        deleted = self._publish(None, replace=document_id)
+        if deleted == 0:
+            # A concurrent writer got there first.
+            raise DocumentNotFound(document_id)
+        return {
+            "document_id": document_id,
+            "chunks_deleted": deleted,
+            "index_dir": self.settings.faiss_index_dir,
+        }
+
+    def list_documents(self) -> List[Dict[str, Any]]:
+        """
+        Indexed documents with their chunk count, source and source type, by document_id.
         """
-        with self._lock:
-            splits = split_documents(
-                docs,
-                chunk_size=self.settings.chunk_size,
-                overlap=self.settings.chunk_overlap,
+        snapshot = self._snapshot
+        if snapshot.store is None:
+            return []
+
+        documents: List[Dict[str, Any]] = []
+        for document_id, positions in sorted(
+                snapshot.metadata.values[DOCUMENT_KEY].items(), key=lambda item: str(item[0])):
+            md = self._doc_at(snapshot.store, positions[0]).metadata or {}
+            documents.append({
+                "document_id": document_id,
+                "chunks": len(positions),
+                "source": md.get("source"),
+                "source_type": md.get("source_type"),
+            })
+        return documents
+
+    def _model_name(self) -> Optional[str]:
+        return getattr(self.llm, "model", None) or getattr(self.llm, "model_name", None)
+
+    def _not_found(self, question: str) -> Dict[str, Any]:
+        return {
+            "question": question,
+            "answer": self.settings.not_found_token,
+            "sources": [],
+            "model": self._model_name(),
+        }
+
+    def _lookup(
+        self,
+        question: str,
+        snapshot: IndexSnapshot,
+        filters: Optional[Filters] = None,
+    ) -> Dict[str, Any]:
+        """
+        Answers that need no retrieval: an empty index or an answer cache hit.
+        Returns either a finished "result" or the "cache_key" to store the answer under.
+        """
+        if snapshot.store is None:
+            return {"result": self._not_found(question)}
+
+        cache_key = answer_cache_key(
+            question, index_version=snapshot.version, settings=self.settings, filters=filters)
+        if self.answer_cache is not None:
+            with stage("answer_cache"):
+                cached = self.answer_cache.get(cache_key)
+            if cached is not None:
+                return {"result": {**cached, "question": question, "cached": True}}
+        return {"cache_key": cache_key}
+
+    async def _alookup(
+        self,
+        question: str,
+        snapshot: IndexSnapshot,
+        filters: Optional[Filters] = None,
+    ) -> Dict[str, Any]:
+        """
+        Async `_lookup`: the answer cache may be SQLite, so it's read in a worker thread.
+        """
+        if snapshot.store is None or self.answer_cache is None:
+            return self._lookup(question, snapshot, filters)
+        return await asyncio.to_thread(self._lookup, question, snapshot, filters)
+
+    def _with_prompt(
+        self,
+        question: str,
+        cache_key: str,
+        docs: List[Document],
+        scores: Optional[List[float]],
+    ) -> Dict[str, Any]:
+        self.metrics.chunks_retrieved.observe(len(docs))
+        with stage("context"):
+            return self._packed_prompt(question, cache_key, docs, scores)
+
+    def _packed_prompt(
+        self,
+        question: str,
+        cache_key: str,
+        docs: List[Document],
+        scores: Optional[List[float]],
+    ) -> Dict[str, Any]:
+        if not docs:
+            return {"result": self._not_found(question)}
+
+        # Combine docs with scores for context building
+        docs_and_scores: List[Tuple[Document, float]] = [
+            (doc, scores[i] if scores and i < len(scores) else 0.0)
+            for i, doc in enumerate(docs)
+        ]
+
+        # Only what fits the model's window: an overflowing prompt gets truncated by the
+        # server, and every extra token adds prefill time.
+        budget = context_budget(
+            num_ctx=self.settings.llm_num_ctx,
+            answer_tokens=self.settings.context_answer_tokens,
+            prompt_tokens=self._count_tokens(build_grounded_prompt(context="", question=question)),
+            max_tokens=self.settings.context_max_tokens,
+        )
+        packed = pack_context(
+            docs_and_scores,
+            budget=budget,
+            count_tokens=self._count_tokens,
+            merge_overlaps=self.settings.context_merge_overlaps,
+        )
+        if not packed.docs_and_scores:
+            return {"result": self._not_found(question)}
+
+        prompt = build_grounded_prompt(
+            context=packed.text,
+            question=question,
+        )
+        return {
+            "cache_key": cache_key,
+            "docs_and_scores": packed.docs_and_scores,
+            "prompt": prompt,
+            "context": {
+                "tokens": packed.tokens,
+                "budget": budget,
+                "chunks_used": len(packed.docs_and_scores),
+                "chunks_retrieved": len(docs_and_scores),
+            },
+        }
+
+    def _prepare(
+        self,
+        question: str,
+        snapshot: IndexSnapshot,
+        filters: Optional[Filters] = None,
+    ) -> Dict[str, Any]:
+        """
+        Everything before generation: answer cache lookup, retrieval and prompt building.
+        Returns either a finished "result" or the "prompt" still to be sent to the LLM.
+        """
+        early = self._lookup(question, snapshot, filters)
+        if "result" in early:
+            return early
+        return self._retrieve_prompt(question, snapshot, filters, early["cache_key"])
+
+    def _retrieve_prompt(
+        self,
+        question: str,
+        snapshot: IndexSnapshot,
+        filters: Optional[Filters],
+        cache_key: str,
+    ) -> Dict[str, Any]:
+        docs, scores = retrieve(
+            snapshot.store, question, self.settings, **self._retrieval_options(snapshot, filters))
+        return self._with_prompt(question, cache_key, docs, scores)
+
+    async def _aprepare(
+        self,
+        question: str,
+        snapshot: IndexSnapshot,
+        filters: Optional[Filters] = None,
+    ) -> Dict[str, Any]:
+        early = await self._alookup(question, snapshot, filters)
+        if "result" in early:
+            return early
+        return await self._aretrieve_prompt(question, snapshot, filters, early["cache_key"])
+
+    async def _aretrieve_prompt(
+        self,
+        question: str,
+        snapshot: IndexSnapshot,
+        filters: Optional[Filters],
+        cache_key: str,
+    ) -> Dict[str, Any]:
+        docs, scores = await aretrieve(
+            snapshot.store, question, self.settings, **self._retrieval_options(snapshot, filters))
+        return self._with_prompt(question, cache_key, docs, scores)
+
+    def _retrieval_options(self, snapshot: IndexSnapshot, filters: Optional[Filters]) -> Dict[str, Any]:
+        return {
+            "query_cache": self.query_cache,
+            "full_vectors": self.full_vectors,
+            "lexical": snapshot.lexical,
+            "metadata": snapshot.metadata,
+            "filters": filters,
+        }
+
+    def _isolated(self, prepare: Callable[[], Dict[str, Any]], question: str) -> Dict[str, Any]:
+        try:
+            return prepare()
+        except Exception as exc:
+            return {"result": self._error_result(question, exc)}
+
+    def _prepare_many(
+        self,
+        questions: Sequence[str],
+        snapshot: IndexSnapshot,
+        filters: Optional[Filters],
+        workers: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        `_prepare` for a batch: questions missing from the answer cache are embedded in
+        one request and searched as one query matrix. If that fails, each question is
+        prepared on its own so a bad question only fails itself.
+        """
+        prepared = [self._isolated(lambda q=q: self._lookup(q, snapshot, filters), q) for q in questions]
+        todo = [i for i, p in enumerate(prepared) if "result" not in p]
+        if not todo:
+            return prepared
+
+        try:
+            retrieved = retrieve_many(
+                snapshot.store,
+                [questions[i] for i in todo],
+                self.settings,
+                **self._retrieval_options(snapshot, filters),
             )
+        except Exception:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                fallback = list(pool.map(
+                    lambda i: self._isolated(lambda: self._prepare(questions[i], snapshot, filters), questions[i]),
+                    todo,
+                ))
+            for i, p in zip(todo, fallback):
+                prepared[i] = p
+            return prepared
 
-            for i, d in enumerate(splits):
-                d.metadata = d.metadata or {}
-                d.metadata.setdefault("chunk_index", i)
+        for i, (docs, scores) in zip(todo, retrieved):
+            prepared[i] = self._isolated(
+                lambda: self._with_prompt(questions[i], prepared[i]["cache_key"], docs, scores),
+                questions[i],
+            )
+        return prepared
 
-            self.vector_store = add_documents_to_faiss(
-                self.vector_store,
-                splits,
-                self.embeddings,
-                index_dir=self.settings.faiss_index_dir,
+    async def _aprepare_many(
+        self,
+        questions: Sequence[str],
+        snapshot: IndexSnapshot,
+        filters: Optional[Filters],
+        workers: int,
+    ) -> List[Dict[str, Any]]:
+        """
+        Async `_prepare_many`; the per-question fallback runs as bounded concurrent tasks.
+        """
+        prepared = await asyncio.to_thread(
+            lambda: [self._isolated(lambda q=q: self._lookup(q, snapshot, filters), q) for q in questions])
+        todo = [i for i, p in enumerate(prepared) if "result" not in p]
+        if not todo:
+            return prepared
+
+        try:
+            retrieved = await aretrieve_many(
+                snapshot.store,
+                [questions[i] for i in todo],
+                self.settings,
+                **self._retrieval_options(snapshot, filters),
             )
+        except Exception:
+            semaphore = asyncio.Semaphore(workers)
 
-            return {
-                "ingested_pages": len(docs),
-                "chunks_added": len(splits),
-                "index_dir": self.settings.faiss_index_dir,
-            }
+            async def prepare(question: str) -> Dict[str, Any]:
+                async with semaphore:
+                    try:
+                        return await self._aprepare(question, snapshot, filters)
+                    except Exception as exc:
+                        return {"result": self._error_result(question, exc)}
 
-    def ingest_pdf(self, pdf_path: PathLike) -> Dict[str, Any]:
-        docs = load_pdf(pdf_path)
-        return self.ingest_documents(docs)
+            fallback = await asyncio.gather(*(prepare(questions[i]) for i in todo))
+            for i, p in zip(todo, fallback):
+                prepared[i] = p
+            return prepared
 
-    def ingest_json(self, json_path: PathLike) -> Dict[str, Any]:
-        docs = load_json(json_path)
-        return self.ingest_documents(docs)
+        for i, (docs, scores) in zip(todo, retrieved):
+            prepared[i] = self._isolated(
+                lambda: self._with_prompt(questions[i], prepared[i]["cache_key"], docs, scores),
+                questions[i],
+            )
+        return prepared
 
-    def _build_context(self, docs_and_scores: Sequence[Tuple[Document, float]]) -> str:
+    def _sources(self, docs_and_scores: Sequence[Tuple[Document, float]]) -> List[Dict[str, Any]]:
+        sources: List[Dict[str, Any]] = []
+        for i, (doc, score) in enumerate(docs_and_scores):
+            md = doc.metadata or {}
+            sources.append(
+                {
+                    "source": md.get("source"),
+                    "source_type": md.get("source_type"),
+                    "page": md.get("page"),
+                    "chunk_index": md.get("chunk_index", i),
+                    "doc_id": md.get("id"),
+                    "text_snippet": (doc.page_content or "").replace("\n", " ").strip(),
+                    "score": score,
+                }
+            )
+        return sources
+
+    def _finalize(self, question: str, prepared: Dict[str, Any], resp: Any) -> Dict[str, Any]:
         """
-        Build context from retrieved sources by appending metadata and citations for the downstream LLM.
+        Turn an LLM response into the answer dict and store it in the answer cache.
         """
-        parts: List[str] = []
+        answer_text = (getattr(resp, "content", None) or str(resp)).strip()
 
-        for i, (doc, score) in enumerate(docs_and_scores, 1):
-            meta = doc.metadata or {}
-            cite = []
+        result = {
+            "question": question,
+            "answer": answer_text if answer_text else self.settings.not_found_token,
+            "sources": self._sources(prepared["docs_and_scores"]),
+            "model": self._model_name(),
+            "context": prepared["context"],
+        }
+        self.metrics.prompt_tokens.observe(prepared["context"]["tokens"])
+        self.metrics.chunks_used.observe(prepared["context"]["chunks_used"])
+        if self.answer_cache is not None:
+            self.answer_cache.put(prepared["cache_key"], result)
+        return {**result, "cached": False}
 
-            if meta.get("source_type") == "pdf":
-                if "page" in meta:
-                    cite.append(f"page={meta['page']}")
+    def _record(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Count an answer by outcome; returns it unchanged.
+        """
+        if result.get("error"):
+            outcome = "error"
+        elif result.get("cached"):
+            outcome = "cached"
+        elif not result.get("sources"):
+            outcome = "not_found"
+        else:
+            outcome = "generated"
+        self.metrics.answers.inc(outcome=outcome)
+        return result
 
-            if meta.get("source_type") == "json" and meta.get("id"):
-                cite.append(f"id={meta['id']}")
+    def _timed(self, operation: str, result: Dict[str, Any], timings: Timings) -> Dict[str, Any]:
+        """
+        Record an answer's metrics and attach its stage timings if `answer_timings` is set.
+        """
+        self.metrics.observe(operation, timings)
+        self._record(result)
+        if self.settings.answer_timings:
+            return {**result, "timings": timings.as_dict()}
+        return result
 
-            cite_str = ", ".join(cite) if cite else "no-meta"
-            chunk = doc.page_content or ""
-            
-            if not chunk:
-                continue
-            chunk = chunk.strip()
-            if not chunk:
-                continue
+    def _error_result(self, question: str, exc: BaseException) -> Dict[str, Any]:
+        return {
+            "question": question,
+            "answer": None,
+            "sources": [],
+            "model": self._model_name(),
+            "error": f"{type(exc).__name__}: {exc}",
+        }
 
-            formatted_chunk = f"[{i}] ({cite_str}, score={score:.4f})\n{chunk}"
-            parts.append(formatted_chunk)
+    def _collect(
+        self,
+        questions: Sequence[str],
+        prepared: List[Dict[str, Any]],
+        pending: List[int],
+        responses: List[Any],
+    ) -> List[Dict[str, Any]]:
+        """
+        Merge batched LLM responses back into input order, isolating per-question errors.
+        """
+        results = [p.get("result") for p in prepared]
+        for i, resp in zip(pending, responses):
+            if isinstance(resp, Exception):
+                results[i] = self._error_result(questions[i], resp)
+            else:
+                results[i] = self._finalize(questions[i], prepared[i], resp)
+        return [self._record(r) for r in results]
+
+    def retrieve_many(
+        self,
+        questions: Sequence[str],
+        *,
+        filters: Optional[Filters] = None,
+    ) -> List[Tuple[List[Document], Optional[List[float]]]]:
+        """
+        Retrieve chunks for several questions with one embedding request and one FAISS
+        search over the query matrix. Returns (docs, scores) per question, in input order.
+        """
+        self.check_filters(filters)
+        snapshot = self._snapshot
+        if snapshot.store is None:
+            return [([], []) for _ in questions]
+        return retrieve_many(
+            snapshot.store, questions, self.settings, **self._retrieval_options(snapshot, filters))
 
-        return "\n\n".join(parts)
+    async def aretrieve_many(
+        self,
+        questions: Sequence[str],
+        *,
+        filters: Optional[Filters] = None,
+    ) -> List[Tuple[List[Document], Optional[List[float]]]]:
+        self.check_filters(filters)
+        snapshot = self._snapshot
+        if snapshot.store is None:
+            return [([], []) for _ in questions]
+        return await aretrieve_many(
+            snapshot.store, questions, self.settings, **self._retrieval_options(snapshot, filters))
 
-    def answer(self, question: str) -> Dict[str, Any]:
+    def render_metrics(self) -> str:
+        """
+        The engine's metrics in the Prometheus text format: stage latency, prompt and
+        retrieval size histograms, answer and ingest counters, plus index size and cache
+        statistics read now.
+        """
+        lines = self.metrics.render()
+
+        snapshot = self._snapshot
+        vectors = snapshot.store.index.ntotal if snapshot.store is not None else 0
+        index_bytes = bytes_per_vector(snapshot.store.index) * vectors if vectors else 0
+        deleted = snapshot.metadata.deleted_count if snapshot.metadata is not None else 0
+        lines += render_values("docqa_index_vectors", "Vectors in the FAISS index", {(): vectors})
+        lines += render_values("docqa_index_deleted_vectors", "Deleted vectors awaiting compaction", {(): deleted})
+        lines += render_values("docqa_index_bytes", "Approximate resident bytes of the vector index", {(): index_bytes})
+
+        caches = {}
+        if isinstance(self.embeddings, CachedEmbeddings):
+            caches["embeddings"] = self.embeddings.stats()
+        if self.query_cache is not None:
+            caches["query"] = self.query_cache.stats()
+        if self.answer_cache is not None:
+            caches["answer"] = self.answer_cache.stats()
+        for field, name, kind, help in (
+            ("hits", "docqa_cache_hits_total", "counter", "Cache hits"),
+            ("misses", "docqa_cache_misses_total", "counter", "Cache misses"),
+            ("hit_rate", "docqa_cache_hit_ratio", "gauge", "Cache hits / lookups"),
+            ("entries", "docqa_cache_entries", "gauge", "Entries held by the cache"),
+        ):
+            values = {(cache,): stats[field] for cache, stats in caches.items()}
+            lines += render_values(name, help, values, ("cache",), kind)
+
+        if self.inflight is not None:
+            shared = self.inflight.stats()["shared"]
+            lines += render_values(
+                "docqa_coalesced_answers_total", "Answers shared with an identical in-flight question",
+                {(): shared}, kind="counter")
+        if self.embed_client is not None:
+            stats = self.embed_client.stats()
+            for field, help in (
+                ("requests", "Embedding requests sent"),
+                ("retries", "Embedding requests retried"),
+                ("failures", "Embedding requests failed after retries"),
+            ):
+                lines += render_values(f"docqa_embed_{field}_total", help, {(): stats[field]}, kind="counter")
+        return "\n".join(lines) + "\n"
+
+    def check_filters(self, filters: Optional[Filters]) -> None:
+        """
+        Raise ValueError if filters use unknown fields or operators.
+        """
+        if filters:
+            validate_filters(filters, self.settings.filter_fields)
+
+    def answer(self, question: str, *, filters: Optional[Filters] = None) -> Dict[str, Any]:
         """
         Answer a single question. Returns a JSON-serializable dict.
+        `filters` restricts retrieval to matching chunks, e.g. {"source": "q.pdf"}.
+
+        Concurrent calls for the same question (after normalization), filters and index
+        version share one retrieval and one LLM call.
         """
-        with self._lock:
-            if self.vector_store is None:
-                return {
-                    "question": question,
-                    "answer": "Answer not found in the document.",
-                    "sources": [],
-                    "model": getattr(self.llm, "model", None) or getattr(self.llm, "model_name", None),
-                }
+        self.check_filters(filters)
+        with collect_timings() as timings:
+            try:
+                result = self._answer(question, filters)
+            except Exception:
+                self.metrics.answers.inc(outcome="error")
+                raise
+        return self._timed("answer", result, timings)
 
-            docs, scores = retrieve(self.vector_store, question, self.settings)
+    def _answer(self, question: str, filters: Optional[Filters]) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        early = self._lookup(question, snapshot, filters)
+        if "result" in early:
+            return early["result"]
 
-            if not docs:
-                return {
-                    "question": question,
-                    "answer": "Answer not found in the document.",
-                    "sources": [],
-                    "model": getattr(self.llm, "model", None) or getattr(self.llm, "model_name", None),
-                }
+        def generate() -> Dict[str, Any]:
+            prepared = self._retrieve_prompt(question, snapshot, filters, early["cache_key"])
+            if "result" in prepared:
+                return prepared["result"]
+            with stage("llm"):
+                resp = self.llm.invoke(prepared["prompt"])
+            return self._finalize(question, prepared, resp)
 
-            # Combine docs with scores for context building
-            docs_and_scores: List[Tuple[Document, float]] = [
-                (doc, scores[i] if scores and i < len(scores) else 0.0)
-                for i, doc in enumerate(docs)
-            ]
+        if self.inflight is None:
+            return generate()
+        return {**self.inflight.do(early["cache_key"], generate), "question": question}
 
-            context = self._build_context(docs_and_scores)
-            prompt = build_grounded_prompt(
-                context=context,
-                question=question,
-            )
+    def answer_many(
+        self,
+        questions: Sequence[str],
+        *,
+        max_concurrency: Optional[int] = None,
+        filters: Optional[Filters] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer several questions concurrently. Retrieval embeds and searches all questions
+        at once (see `retrieve_many`) and the prompts go to the LLM through its `batch`
+        API. Results are returned in input order; a failure on one question is reported
+        in its "error" field and does not affect the others. `filters` applies to every
+        question.
+        """
+        self.check_filters(filters)
+        if not questions:
+            return []
 
-            resp = self.llm.invoke(prompt)
-            answer_text = (getattr(resp, "content", None) or str(resp)).strip()
-
-            sources: List[Dict[str, Any]] = []
-            for i, (doc, score) in enumerate(docs_and_scores):
-                md = doc.metadata or {}
-                sources.append(
-                    {
-                        "source": md.get("source"),
-                        "source_type": md.get("source_type"),
-                        "page": md.get("page"),
-                        "chunk_index": md.get("chunk_index", i),
-                        "doc_id": md.get("id"),
-                        "text_snippet": (doc.page_content or "").replace("\n", " ").strip(),
-                        "score": score,
-                    }
-                )
+        workers = max_concurrency or self.settings.batch_max_concurrency
+        with collect_timings() as timings:
+            prepared = self._prepare_many(questions, self._snapshot, filters, workers)
+
+            pending = [i for i, p in enumerate(prepared) if "result" not in p]
+            responses = []
+            if pending:
+                with stage("llm"):
+                    responses = self.llm.batch(
+                        [prepared[i]["prompt"] for i in pending],
+                        config={"max_concurrency": workers},
+                        return_exceptions=True,
+                    )
+
+        self.metrics.observe("answer_many", timings)
+        return self._collect(questions, prepared, pending, responses)
+
+    async def aanswer(self, question: str, *, filters: Optional[Filters] = None) -> Dict[str, Any]:
+        """
+        Async `answer` built on `aembed_query` and `ainvoke`.
+        """
+        self.check_filters(filters)
+        with collect_timings() as timings:
+            try:
+                result = await self._aanswer(question, filters)
+            except Exception:
+                self.metrics.answers.inc(outcome="error")
+                raise
+        return self._timed("answer", result, timings)
+
+    async def _aanswer(self, question: str, filters: Optional[Filters]) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        early = await self._alookup(question, snapshot, filters)
+        if "result" in early:
+            return early["result"]
+
+        async def generate() -> Dict[str, Any]:
+            prepared = await self._aretrieve_prompt(question, snapshot, filters, early["cache_key"])
+            if "result" in prepared:
+                return prepared["result"]
+            with stage("llm"):
+                resp = await self.llm.ainvoke(prepared["prompt"])
+            # Stores the answer, possibly in SQLite.
+            return await asyncio.to_thread(self._finalize, question, prepared, resp)
+
+        if self.inflight is None:
+            return await generate()
+        return {**await self.inflight.ado(early["cache_key"], generate), "question": question}
 
-            return {
+    async def aanswer_many(
+        self,
+        questions: Sequence[str],
+        *,
+        max_concurrency: Optional[int] = None,
+        filters: Optional[Filters] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Async `answer_many`: batched retrieval with the async embedding client, and the
+        prompts go to the LLM through `abatch`, bounded by `max_concurrency`.
+        """
+        self.check_filters(filters)
+        if not questions:
+            return []
+
+        workers = max_concurrency or self.settings.batch_max_concurrency
+        with collect_timings() as timings:
+            prepared = await self._aprepare_many(questions, self._snapshot, filters, workers)
+
+            pending = [i for i, p in enumerate(prepared) if "result" not in p]
+            responses = []
+            if pending:
+                with stage("llm"):
+                    responses = await self.llm.abatch(
+                        [prepared[i]["prompt"] for i in pending],
+                        config={"max_concurrency": workers},
+                        return_exceptions=True,
+                    )
+
+        self.metrics.observe("answer_many", timings)
+        return await asyncio.to_thread(self._collect, questions, prepared, pending, responses)
+
+    @staticmethod
+    def _chunk_text(chunk: Any) -> str:
+        content = getattr(chunk, "content", chunk)
+        return content if isinstance(content, str) else ""
+
+    def _timings(self, started: float, retrieved: float, first_token: Optional[float]) -> Dict[str, Any]:
+        finished = time.perf_counter()
+        metrics = self.metrics
+        metrics.stage_seconds.observe(retrieved - started, operation="stream", stage="retrieval")
+        if first_token:
+            metrics.stage_seconds.observe(first_token - started, operation="stream", stage="first_token")
+        metrics.operation_seconds.observe(finished - started, operation="stream")
+        return {
+            "retrieval_ms": (retrieved - started) * 1000.0,
+            "first_token_ms": (first_token - started) * 1000.0 if first_token else None,
+            "total_ms": (finished - started) * 1000.0,
+        }
+
+    def _stream_head(self, question: str, sources: List[Dict[str, Any]], cached: bool) -> Dict[str, Any]:
+        return {
+            "event": "sources",
+            "data": {
                 "question": question,
-                "answer": answer_text if answer_text else self.settings.not_found_token,
                 "sources": sources,
-                "model": getattr(self.llm, "model", None) or getattr(self.llm, "model_name", None),
-            }
\ No newline at end of file
+                "model": self._model_name(),
+                "cached": cached,
+            },
+        }
+
+    def _stream_finished(self, question: str, result: Dict[str, Any], started: float, retrieved: float):
+        """
+        Events for an answer that needed no generation (cache hit or nothing retrieved).
+        """
+        self._record(result)
+        yield self._stream_head(question, result["sources"], result.get("cached", False))
+        first_token = time.perf_counter()
+        yield {"event": "token", "data": result["answer"]}
+        yield {
+            "event": "done",
+            "data": {
+                "answer": result["answer"],
+                "timings": self._timings(started, retrieved, first_token),
+            },
+        }
+
+    def stream_answer(
+        self,
+        question: str,
+        *,
+        filters: Optional[Filters] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Answer a question incrementally. Yields events as dicts with "event" and "data":
+        - sources: the retrieved sources, sent before generation starts
+        - token: a piece of answer text, as produced by the LLM's `stream`
+        - done: the full answer plus retrieval / time-to-first-token / total timings and
+          the size of the context sent to the LLM
+        """
+        self.check_filters(filters)
+        started = time.perf_counter()
+        prepared = self._prepare(question, self._snapshot, filters)
+        retrieved = time.perf_counter()
+
+        if "result" in prepared:
+            yield from self._stream_finished(question, prepared["result"], started, retrieved)
+            return
+
+        yield self._stream_head(question, self._sources(prepared["docs_and_scores"]), False)
+
+        parts: List[str] = []
+        first_token: Optional[float] = None
+        for chunk in self.llm.stream(prepared["prompt"]):
+            text = self._chunk_text(chunk)
+            if not text:
+                continue
+            first_token = first_token or time.perf_counter()
+            parts.append(text)
+            yield {"event": "token", "data": text}
+
+        result = self._record(self._finalize(question, prepared, "".join(parts)))
+        yield {
+            "event": "done",
+            "data": {
+                "answer": result["answer"],
+                "timings": self._timings(started, retrieved, first_token),
+                "context": result["context"],
+            },
+        }
+
+    async def astream_answer(
+        self,
+        question: str,
+        *,
+        filters: Optional[Filters] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Async `stream_answer` built on the LLM's `astream`.
+        """
+        self.check_filters(filters)
+        started = time.perf_counter()
+        prepared = await self._aprepare(question, self._snapshot, filters)
+        retrieved = time.perf_counter()
+
+        if "result" in prepared:
+            for event in self._stream_finished(question, prepared["result"], started, retrieved):
+                yield event
+            return
+
+        yield self._stream_head(question, self._sources(prepared["docs_and_scores"]), False)
+
+        parts: List[str] = []
+        first_token: Optional[float] = None
+        async for chunk in self.llm.astream(prepared["prompt"]):
+            text = self._chunk_text(chunk)
+            if not text:
+                continue
+            first_token = first_token or time.perf_counter()
+            parts.append(text)
+            yield {"event": "token", "data": text}
+
+        result = self._record(await asyncio.to_thread(self._finalize, question, prepared, "".join(parts)))
+        yield {
+            "event": "done",
+            "data": {
+                "answer": result["answer"],
+                "timings": self._timings(started, retrieved, first_token),
+                "context": result["context"],
+            },
+        }
@@ -0,0 +1,333 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+PathLike = Union[str, Path]
+
+
+class IngestQueueFull(RuntimeError):
+    """Raised when a job is submitted while the ingestion queue is at capacity."""
+
+
+class IngestJobQueue:
+    """
+    Background ingestion: uploads are spooled to disk, recorded in a SQLite job table and
+    processed by a bounded pool of worker threads calling `engine.ingest_pdf` /
+    `engine.ingest_json`.
+
+    A job either adds the file's chunks (mode "add") or replaces every chunk of its
+    document_id (mode "upsert").
+
+    Job status is one of: queued | running | succeeded | failed. Progress (pages parsed,
+    chunks embedded, persisted) is written to the table as the engine reports it.
+
+    Several queues (e.g. one per API process) can share the table: each running job
+    records the queue that claimed it, which refreshes its heartbeat while it runs. A
+    running job whose heartbeat is older than `stale_after` seconds was abandoned (its
+    process died) and is queued again, up to `max_attempts` runs; after that it fails.
+    Queued jobs, and abandoned ones, are picked up by `start()` and then periodically.
+    """
+
+    def __init__(
+        self,
+        engine,
+        *,
+        db_path: PathLike,
+        spool_dir: PathLike,
+        workers: int = 2,
+        max_queued: int = 100,
+        max_attempts: int = 3,
+        stale_after: float = 300.0,
+    ):
+        self.engine = engine
+        self.spool_dir = Path(spool_dir)
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.stale_after = stale_after
+        self.owner = uuid.uuid4().hex
+
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), timeout=30.0, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ingest_jobs ("
+            " id TEXT PRIMARY KEY,"
+            " filename TEXT,"
+            " file_type TEXT NOT NULL,"
+            " path TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " progress TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " document_id TEXT,"
+            " mode TEXT NOT NULL DEFAULT 'add',"
+            " owner TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " heartbeat_at REAL)"
+        )
+        # Tables created by earlier versions lack the later columns.
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(ingest_jobs)")}
+        for column, definition in (
+            ("document_id", "TEXT"),
+            ("mode", "TEXT NOT NULL DEFAULT 'add'"),
+            ("owner", "TEXT"),
+            ("attempts", "INTEGER NOT NULL DEFAULT 0"),
+            ("heartbeat_at", "REAL"),
+        ):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE ingest_jobs ADD COLUMN {column} {definition}")
+        self._conn.commit()
+
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._submit_lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+
+    # -----------------------
+    # Lifecycle
+    # -----------------------
+    def start(self) -> None:
+        """
+        Start the workers and enqueue queued jobs, including those abandoned by a
+        process that stopped while running them.
+        """
+        if self._threads:
+            return
+
+        self._recover()
+        with self._db_lock:
+            rows = self._conn.execute(
+                "SELECT id FROM ingest_jobs WHERE status = 'queued' ORDER BY created_at"
+            ).fetchall()
+        for (job_id,) in rows:
+            self._queue.put(job_id)
+
+        self._stopping.clear()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"docqa-ingest-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._watch, name="docqa-ingest-watch", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop the workers after their current job. Queued jobs stay queued for next start.
+        """
+        self._stopping.set()
+        for _ in range(self.workers):
+            self._queue.put(None)
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    # -----------------------
+    # Public API
+    # -----------------------
+    def spool_path(self, suffix: str = "") -> str:
+        return str(self.spool_dir / f"{uuid.uuid4().hex}{suffix}")
+
+    def submit(
+        self,
+        path: PathLike,
+        *,
+        file_type: str,
+        filename: Optional[str] = None,
+        document_id: Optional[str] = None,
+        mode: str = "add",
+    ) -> str:
+        """
+        Enqueue an already spooled file. The queue takes ownership of the file and deletes
+        it once the job finishes. Raises IngestQueueFull when at capacity.
+        """
+        if file_type not in {"pdf", "json"}:
+            raise ValueError(f"Unsupported file_type={file_type}")
+        if mode not in {"add", "upsert"}:
+            raise ValueError(f"Unsupported mode={mode}")
+        if mode == "upsert" and document_id is None:
+            raise ValueError("An upsert job needs a document_id")
+
+        with self._submit_lock:
+            if self._queue.qsize() >= self.max_queued:
+                raise IngestQueueFull(
+                    f"Ingestion queue is full ({self.max_queued} jobs); retry later")
+
+            job_id = uuid.uuid4().hex
+            now = time.time()
+            with self._db_lock:
+                self._conn.execute(
+                    "INSERT INTO ingest_jobs"
+                    " (id, filename, file_type, path, status, progress, created_at, updated_at,"
+                    " document_id, mode)"
+                    " VALUES (?, ?, ?, ?, 'queued', '{}', ?, ?, ?, ?)",
+                    (job_id, filename, file_type, str(path), now, now, document_id, mode),
+                )
+                self._conn.commit()
+            self._queue.put(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT id, filename, file_type, status, progress, result, error,"
+                " created_at, updated_at, document_id, mode FROM ingest_jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+
+        (job_id, filename, file_type, status, progress, result, error,
+         created, updated, document_id, mode) = row
+        return {
+            "job_id": job_id,
+            "filename": filename,
+            "file_type": file_type,
+            "document_id": document_id,
+            "mode": mode,
+            "status": status,
+            "progress": json.loads(progress),
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created,
+            "updated_at": updated,
+        }
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    # -----------------------
+    # Workers
+    # -----------------------
+    def _update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self._db_lock:
+            self._conn.execute(
+                f"UPDATE ingest_jobs SET {assignments} WHERE id = ?",
+                [*fields.values(), job_id],
+            )
+            self._conn.commit()
+
+    def _recover(self) -> List[str]:
+        """
+        Queue running jobs whose heartbeat is older than `stale_after` again, or fail
+        them once they have been started `max_attempts` times (e.g. a file that crashes
+        the process). Returns the ids of the jobs queued again.
+        """
+        now = time.time()
+        stale = "status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)"
+        cutoff = now - self.stale_after
+        with self._db_lock:
+            abandoned = self._conn.execute(
+                f"SELECT path FROM ingest_jobs WHERE {stale} AND attempts >= ?",
+                (cutoff, self.max_attempts),
+            ).fetchall()
+            self._conn.execute(
+                f"UPDATE ingest_jobs SET status = 'failed', error = ?, updated_at = ?"
+                f" WHERE {stale} AND attempts >= ?",
+                (f"Abandoned after {self.max_attempts} attempts: the worker stopped while"
+                 " running the job", now, cutoff, self.max_attempts),
+            )
+            rows = self._conn.execute(
+                f"SELECT id FROM ingest_jobs WHERE {stale} ORDER BY created_at", (cutoff,)
+            ).fetchall()
+            self._conn.execute(
+                f"UPDATE ingest_jobs SET status = 'queued', owner = NULL, updated_at = ?"
+                f" WHERE {stale}",
+                (now, cutoff),
+            )
+            self._conn.commit()
+        for (path,) in abandoned:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return [job_id for (job_id,) in rows]
+
+    def _watch(self) -> None:
+        """
+        Refresh the heartbeat of the jobs this queue runs, and pick up abandoned ones.
+        """
+        while not self._stopping.wait(self.stale_after / 3):
+            with self._db_lock:
+                self._conn.execute(
+                    "UPDATE ingest_jobs SET heartbeat_at = ? WHERE owner = ? AND status = 'running'",
+                    (time.time(), self.owner),
+                )
+                self._conn.commit()
+            for job_id in self._recover():
+                self._queue.put(job_id)
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _claim(self, job_id: str) -> Optional[tuple]:
+        """
+        Mark a queued job running and return its row, or None if it isn't queued (any
+        more). One UPDATE checks and sets the status, so of several workers or processes
+        sharing the table only one claims a job.
+        """
+        now = time.time()
+        with self._db_lock:
+            claimed = self._conn.execute(
+                "UPDATE ingest_jobs SET status = 'running', owner = ?, attempts = attempts + 1,"
+                " heartbeat_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                (self.owner, now, now, job_id),
+            ).rowcount
+            self._conn.commit()
+            if claimed != 1:
+                return None
+            return self._conn.execute(
+                "SELECT file_type, path, document_id, mode FROM ingest_jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+
+    def _run(self, job_id: str) -> None:
+        row = self._claim(job_id)
+        if row is None:
+            return
+        file_type, path, document_id, mode = row
+
+        progress: Dict[str, Any] = {}
+
+        def report(update: Dict[str, Any]) -> None:
+            progress.update(update)
+            self._update(job_id, progress=json.dumps(progress))
+
+        try:
+            fn = self.engine.ingest_pdf if file_type == "pdf" else self.engine.ingest_json
+            result = fn(
+                path, progress=report, document_id=document_id, replace=mode == "upsert")
+            self._update(job_id, status="succeeded", result=json.dumps(result))
+        except Exception as exc:
+            self._update(job_id, status="failed", error=f"{type(exc).__name__}: {exc}")
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        self.stop()
+        with self._db_lock:
+            self._conn.close()
@@ -1,3 +1,29 @@
-from .retriever import retrieve
+from .retriever import (
+    retrieve,
+    aretrieve,
+    retrieve_many,
+    aretrieve_many,
+    embed_query,
+    aembed_query,
+    embed_queries,
+    aembed_queries,
+    search_by_vector,
+    search_many_by_vector,
+    reciprocal_rank_fusion,
+    mmr_select,
+)
 
-__all__ = [retrieve]    
\ No newline at end of file
+__all__ = [
+    retrieve,
+    aretrieve,
+    retrieve_many,
+    aretrieve_many,
+    embed_query,
+    aembed_query,
+    embed_queries,
+    aembed_queries,
+    search_by_vector,
+    search_many_by_vector,
+    reciprocal_rank_fusion,
+    mmr_select,
+]
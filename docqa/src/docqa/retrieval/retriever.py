@@ -1,7 +1,26 @@
-from typing import List, Optional, Tuple
+import asyncio
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import numpy as np
 from langchain_core.documents import Document
+from langchain_community.vectorstores.utils import DistanceStrategy
 from docqa.config import Settings
+from docqa.cache import QueryEmbeddingCache
+from docqa.cache.embeddings import aembed_queries as _aembed_queries
+from docqa.cache.embeddings import embed_queries as _embed_queries
+from docqa.indexing.bm25 import BM25Index
+from docqa.indexing.metadata import (
+    Filters,
+    MetadataIndex,
+    Selection,
+    pairs_from_ids,
+    query_vector,
+    search_ids,
+    search_ids_many,
+    search_positions,
+)
+from docqa.indexing.vectors import FullVectorStore
+from docqa.metrics import stage
 
 
 def _distance_to_relevance(distance: float) -> float:
@@ -12,42 +31,545 @@ def _distance_to_relevance(distance: float) -> float:
     return 1.0 / (1.0 + float(distance))
 
 
-def retrieve(
+def embed_query(
+    vector_store,
+    query: str,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+) -> List[float]:
+    """
+    Embed the query once, reusing a cached vector when available.
+    """
+    if query_cache is not None:
+        return query_cache.embed_query(query)
+    return vector_store.embeddings.embed_query(query)
+
+
+async def aembed_query(
     vector_store,
     query: str,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+) -> List[float]:
+    if query_cache is not None:
+        return await query_cache.aembed_query(query)
+    return await vector_store.embeddings.aembed_query(query)
+
+
+def embed_queries(
+    vector_store,
+    queries: Sequence[str],
+    query_cache: Optional[QueryEmbeddingCache] = None,
+) -> List[List[float]]:
+    """
+    Embed several queries in one request (cached ones are not re-embedded).
+    """
+    if query_cache is not None:
+        return query_cache.embed_queries(queries)
+    return _embed_queries(vector_store.embeddings, list(queries))
+
+
+async def aembed_queries(
+    vector_store,
+    queries: Sequence[str],
+    query_cache: Optional[QueryEmbeddingCache] = None,
+) -> List[List[float]]:
+    if query_cache is not None:
+        return await query_cache.aembed_queries(queries)
+    return await _aembed_queries(vector_store.embeddings, list(queries))
+
+
+def rerank_exact(
+    vector_store,
+    embedding: List[float],
+    pairs: List[Tuple[Document, float]],
+    full_vectors: FullVectorStore,
+    k: int,
+) -> List[Tuple[Document, float]]:
+    """
+    Re-score (doc, distance) candidates from a compressed index against their
+    full-precision vectors and keep the best k. Candidates without a stored vector
+    keep their approximate score.
+    """
+    vectors = full_vectors.get_many([d.id for d, _ in pairs if d.id])
+    query = np.asarray(embedding, dtype=np.float32)
+    if vector_store._normalize_L2:
+        query = query / np.linalg.norm(query)
+    inner = vector_store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT
+
+    rescored: List[Tuple[Document, float]] = []
+    for doc, score in pairs:
+        vec = vectors.get(doc.id)
+        if vec is not None:
+            if vector_store._normalize_L2:
+                vec = vec / np.linalg.norm(vec)
+            # Same units FAISS reports: inner product, or squared L2 distance.
+            score = float(vec @ query) if inner else float(np.sum((vec - query) ** 2))
+        rescored.append((doc, score))
+
+    rescored.sort(key=lambda p: p[1], reverse=inner)
+    return rescored[:k]
+
+
+def _similarity_pairs(
+    vector_store,
+    embedding: List[float],
+    k: int,
+    settings: Settings,
+    full_vectors: Optional[FullVectorStore],
+    positions: Optional[Selection] = None,
+) -> List[Tuple[Document, float]]:
+    def search(n: int) -> List[Tuple[Document, float]]:
+        if positions is None:
+            return vector_store.similarity_search_with_score_by_vector(embedding, k=n)
+        return search_positions(vector_store, embedding, n, positions)
+
+    if full_vectors is None:
+        return search(k)
+
+    pairs = search(k * settings.faiss_rerank_factor)
+    return rerank_exact(vector_store, embedding, pairs, full_vectors, k)
+
+
+def _similarity_pairs_many(
+    vector_store,
+    embeddings: Sequence[List[float]],
+    k: int,
+    settings: Settings,
+    full_vectors: Optional[FullVectorStore],
+    positions: Optional[Selection] = None,
+) -> List[List[Tuple[Document, float]]]:
+    """
+    `_similarity_pairs` for several query vectors with one matrix search.
+    """
+    n = k * settings.faiss_rerank_factor if full_vectors is not None else k
+    scores, ids = search_ids_many(vector_store, embeddings, n, positions)
+    results = [pairs_from_ids(vector_store, row_scores, row_ids) for row_scores, row_ids in zip(scores, ids)]
+    if full_vectors is None:
+        return results
+    return [
+        rerank_exact(vector_store, embedding, pairs, full_vectors, k)
+        for embedding, pairs in zip(embeddings, results)
+    ]
+
+
+def mmr_select(
+    query: np.ndarray,
+    vectors: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5,
+) -> List[int]:
+    """
+    Maximal marginal relevance: pick k of `vectors` (rows), each maximizing
+    lambda * sim(query) - (1 - lambda) * max sim(already picked), with cosine similarity.
+    All pairwise similarities come from one matrix product; each pick then only updates
+    the running max similarity to the picked set.
+    """
+    n = len(vectors)
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.where(norms == 0.0, 1.0, norms)
+    q = np.asarray(query, dtype=np.float32).reshape(-1)
+    q = q / (np.linalg.norm(q) or 1.0)
+    relevance = unit @ q
+    similarity = unit @ unit.T
+
+    first = int(np.argmax(relevance))
+    selected = [first]
+    max_sim = similarity[first].copy()
+    score = lambda_mult * relevance
+    score[first] = -np.inf
+    while len(selected) < k:
+        mmr = score - (1.0 - lambda_mult) * max_sim
+        best = int(np.argmax(mmr))
+        selected.append(best)
+        score[best] = -np.inf
+        np.maximum(max_sim, similarity[best], out=max_sim)
+    return selected
+
+
+def _mmr(
+    vector_store,
+    embedding: List[float],
+    settings: Settings,
+    *,
+    full_vectors: Optional[FullVectorStore] = None,
+    positions: Optional[Selection] = None,
+) -> List[Tuple[Document, float]]:
+    """
+    MMR over the nearest `retrieval_fetch_k` candidates, restricted
+    to `positions` if given. Candidate vectors are read back from the index (or
+    `full_vectors`) rather than re-embedded. Returns (doc, FAISS score) pairs in MMR order.
+    """
+    fetch_k = settings.retrieval_fetch_k
+    query = query_vector(vector_store, embedding)
+    if positions is None:
+        _, found = vector_store.index.search(query, fetch_k)
+        ids = found[0][found[0] != -1]
+    else:
+        _, ids = search_ids(vector_store, embedding, fetch_k, positions)
+    if ids.size == 0:
+        return []
+
+    vectors = vector_store.index.reconstruct_batch(ids)
+    if full_vectors is not None:
+        doc_ids = [vector_store.index_to_docstore_id[int(i)] for i in ids]
+        stored = full_vectors.get_many(doc_ids)
+        if len(stored) == len(doc_ids):
+            vectors = np.stack([stored[doc_id] for doc_id in doc_ids])
+            if vector_store._normalize_L2:
+                vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # Same units FAISS reports, exact for the vectors used: inner product or squared L2.
+    if vector_store.distance_strategy == DistanceStrategy.MAX_INNER_PRODUCT:
+        scores = vectors @ query[0]
+    else:
+        scores = np.sum((vectors - query[0]) ** 2, axis=1)
+
+    pairs: List[Tuple[Document, float]] = []
+    for i in mmr_select(query[0], vectors, settings.retrieval_k, settings.retrieval_lambda_mult):
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[int(ids[i])])
+        if isinstance(doc, Document):
+            pairs.append((doc, float(scores[i])))
+    return pairs
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], *, k: int, rrf_k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuse several best-first id rankings: score(id) = sum over rankings of 1 / (rrf_k + rank).
+    Returns the top k (id, score) pairs.
+    """
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (rrf_k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def _hybrid(
+    vector_store,
+    embedding: List[float],
     settings: Settings,
+    *,
+    query: str,
+    lexical: BM25Index,
+    full_vectors: Optional[FullVectorStore],
+    positions: Optional[Selection] = None,
+    deleted: Optional[np.ndarray] = None,
+    dense: Optional[List[Tuple[Document, float]]] = None,
+) -> Tuple[List[Document], List[float]]:
+    k = settings.retrieval_k
+    candidates = settings.retrieval_fetch_k
+
+    if dense is None:
+        dense = _similarity_pairs(vector_store, embedding, candidates, settings, full_vectors, positions)
+    by_id = {d.id: d for d, _ in dense}
+
+    def docstore_ids(selected: np.ndarray):
+        return {vector_store.index_to_docstore_id[int(p)] for p in selected}
+
+    if deleted is not None:
+        # Unfiltered: cheaper to name the (few) deleted chunks than every live one.
+        lexical_hits = lexical.search(query, candidates, exclude=docstore_ids(deleted))
+    elif positions is not None:
+        lexical_hits = lexical.search(query, candidates, ids=docstore_ids(positions.positions))
+    else:
+        lexical_hits = lexical.search(query, candidates)
+    lexical_ids = [doc_id for doc_id, _ in lexical_hits]
+
+    fused = reciprocal_rank_fusion(
+        [[d.id for d, _ in dense], lexical_ids], k=k, rrf_k=settings.hybrid_rrf_k)
+
+    docs: List[Document] = []
+    scores: List[float] = []
+    for doc_id, score in fused:
+        doc = by_id.get(doc_id) or vector_store.docstore.search(doc_id)
+        if isinstance(doc, Document):
+            docs.append(doc)
+            scores.append(score)
+    return docs, scores
+
+
+def _restriction(
+    metadata: Optional[MetadataIndex],
+    filters: Optional[Filters],
+) -> Tuple[Optional[Selection], Optional[np.ndarray]]:
+    """
+    (positions to search, deleted positions) for filters and tombstones; (None, None)
+    when the whole index is searchable.
+    """
+    if not filters and (metadata is None or not metadata.deleted_count):
+        return None, None
+    if metadata is None:
+        raise ValueError("filtered retrieval needs a metadata index")
+    positions = metadata.selection(filters or {})
+    deleted = metadata.deleted_positions() if not filters else None
+    return positions, deleted
+
+
+def _scored(pairs: List[Tuple[Document, float]], settings: Settings) -> Tuple[List[Document], List[float]]:
+    """
+    (docs, relevance scores) of similarity pairs, applying the score threshold mode.
+    """
+    docs: List[Document] = []
+    scores: List[float] = []
+    threshold = settings.retrieval_type == "similarity_score_threshold"
+    for doc, distance in pairs:
+        relevance = _distance_to_relevance(distance)
+        if threshold and relevance < float(settings.score_threshold):
+            continue
+        docs.append(doc)
+        scores.append(relevance)
+    return docs, scores
+
+
+def search_by_vector(
+    vector_store,
+    embedding: List[float],
+    settings: Settings,
+    *,
+    full_vectors: Optional[FullVectorStore] = None,
+    lexical: Optional[BM25Index] = None,
+    query: Optional[str] = None,
+    metadata: Optional[MetadataIndex] = None,
+    filters: Optional[Filters] = None,
 ) -> Tuple[List[Document], Optional[List[float]]]:
     """
-    Returns (docs, scores) where scores are OPTIONAL and represent a relevance-like score
-    (higher is better). For MMR, scores are typically not available.
+    Run the configured retrieval mode against an already embedded query.
+    Returns (docs, scores) as described in `retrieve`.
+    With `full_vectors`, similarity candidates are over-fetched and re-ranked exactly.
+    The hybrid mode also needs the query text and a `lexical` index.
+    With `filters`, only chunks whose metadata matches (looked up in `metadata`) are
+    searched; the restriction is applied inside the FAISS search, not afterwards.
+    Chunks deleted in `metadata` are excluded the same way.
     """
     rtype = settings.retrieval_type
     k = settings.retrieval_k
 
+    positions, deleted = _restriction(metadata, filters)
+    if positions is not None and len(positions) == 0:
+        return [], []
+
+    if rtype == "hybrid":
+        if lexical is None or query is None:
+            raise ValueError("hybrid retrieval needs the query text and a lexical index")
+        return _hybrid(
+            vector_store,
+            embedding,
+            settings,
+            query=query,
+            lexical=lexical,
+            full_vectors=full_vectors,
+            positions=positions,
+            deleted=deleted,
+        )
+
     if rtype == "similarity":
-        pairs = vector_store.similarity_search_with_score(query, k=k)
-        docs = [d for d, _ in pairs]
-        scores = [_distance_to_relevance(s) for _, s in pairs]
-        return docs, scores
+        pairs = _similarity_pairs(vector_store, embedding, k, settings, full_vectors, positions)
+        return _scored(pairs, settings)
 
     if rtype == "mmr":
-        docs = vector_store.max_marginal_relevance_search(
-            query,
-            k=k,
-            fetch_k=settings.retrieval_fetch_k,
-            lambda_mult=settings.retrieval_lambda_mult,
-        )
-        return docs, None
+        pairs = _mmr(
+            vector_store, embedding, settings, full_vectors=full_vectors, positions=positions)
+        return [d for d, _ in pairs], [_distance_to_relevance(s) for _, s in pairs]
 
     if rtype == "similarity_score_threshold":
-        pairs = vector_store.similarity_search_with_score(query, k=k)
-        filtered_docs: List[Document] = []
-        filtered_scores: List[float] = []
-        for d, dist in pairs:
-            rel = _distance_to_relevance(dist)
-            if rel >= float(settings.score_threshold):
-                filtered_docs.append(d)
-                filtered_scores.append(rel)
-        return filtered_docs, filtered_scores
+        pairs = _similarity_pairs(vector_store, embedding, k, settings, full_vectors, positions)
+        return _scored(pairs, settings)
 
     raise ValueError(f"Unknown retrieval_type={rtype}")
+
+
+def search_many_by_vector(
+    vector_store,
+    embeddings: Sequence[List[float]],
+    settings: Settings,
+    *,
+    full_vectors: Optional[FullVectorStore] = None,
+    lexical: Optional[BM25Index] = None,
+    queries: Optional[Sequence[str]] = None,
+    metadata: Optional[MetadataIndex] = None,
+    filters: Optional[Filters] = None,
+) -> List[Tuple[List[Document], Optional[List[float]]]]:
+    """
+    `search_by_vector` for several query vectors, one (docs, scores) per query.
+    Similarity, score-threshold and the dense half of hybrid retrieval search the
+    whole query matrix in one FAISS call, which FAISS parallelizes across queries;
+    MMR selects per query from its own candidates.
+    """
+    rtype = settings.retrieval_type
+    if rtype not in {"similarity", "similarity_score_threshold", "hybrid"}:
+        return [
+            search_by_vector(
+                vector_store,
+                embedding,
+                settings,
+                full_vectors=full_vectors,
+                lexical=lexical,
+                query=queries[i] if queries is not None else None,
+                metadata=metadata,
+                filters=filters,
+            )
+            for i, embedding in enumerate(embeddings)
+        ]
+
+    positions, deleted = _restriction(metadata, filters)
+    if positions is not None and len(positions) == 0:
+        return [([], []) for _ in embeddings]
+
+    if rtype != "hybrid":
+        batch = _similarity_pairs_many(
+            vector_store, embeddings, settings.retrieval_k, settings, full_vectors, positions)
+        return [_scored(pairs, settings) for pairs in batch]
+
+    if lexical is None or queries is None:
+        raise ValueError("hybrid retrieval needs the query text and a lexical index")
+    dense = _similarity_pairs_many(
+        vector_store, embeddings, settings.retrieval_fetch_k, settings, full_vectors, positions)
+    return [
+        _hybrid(
+            vector_store,
+            embedding,
+            settings,
+            query=query,
+            lexical=lexical,
+            full_vectors=full_vectors,
+            positions=positions,
+            deleted=deleted,
+            dense=pairs,
+        )
+        for embedding, query, pairs in zip(embeddings, queries, dense)
+    ]
+
+
+def retrieve(
+    vector_store,
+    query: str,
+    settings: Settings,
+    *,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+    full_vectors: Optional[FullVectorStore] = None,
+    lexical: Optional[BM25Index] = None,
+    metadata: Optional[MetadataIndex] = None,
+    filters: Optional[Filters] = None,
+) -> Tuple[List[Document], Optional[List[float]]]:
+    """
+    Returns (docs, scores) where scores are OPTIONAL and represent a relevance-like score
+    (higher is better). MMR returns docs in selection order with their similarity
+    relevance; for hybrid they are reciprocal rank fusion scores.
+
+    The query is embedded once (through `query_cache` if given) and every mode searches
+    by vector, so repeated questions skip the embedding round-trip.
+
+    `filters` restricts retrieval to chunks with matching metadata, e.g.
+    {"source": "q.pdf", "page": {"gte": 2, "lte": 5}}; see `MetadataIndex.select`.
+    """
+    with stage("embed_query"):
+        embedding = embed_query(vector_store, query, query_cache)
+    with stage("search"):
+        return search_by_vector(
+            vector_store,
+            embedding,
+            settings,
+            full_vectors=full_vectors,
+            lexical=lexical,
+            query=query,
+            metadata=metadata,
+            filters=filters,
+        )
+
+
+async def aretrieve(
+    vector_store,
+    query: str,
+    settings: Settings,
+    *,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+    full_vectors: Optional[FullVectorStore] = None,
+    lexical: Optional[BM25Index] = None,
+    metadata: Optional[MetadataIndex] = None,
+    filters: Optional[Filters] = None,
+) -> Tuple[List[Document], Optional[List[float]]]:
+    """
+    Async `retrieve`: the query is embedded with the async client and the CPU-bound
+    FAISS search runs in a worker thread, off the event loop.
+    """
+    with stage("embed_query"):
+        embedding = await aembed_query(vector_store, query, query_cache)
+    with stage("search"):
+        return await asyncio.to_thread(
+            search_by_vector,
+            vector_store,
+            embedding,
+            settings,
+            full_vectors=full_vectors,
+            lexical=lexical,
+            query=query,
+            metadata=metadata,
+            filters=filters,
+        )
+
+
+def retrieve_many(
+    vector_store,
+    queries: Sequence[str],
+    settings: Settings,
+    *,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+    full_vectors: Optional[FullVectorStore] = None,
+    lexical: Optional[BM25Index] = None,
+    metadata: Optional[MetadataIndex] = None,
+    filters: Optional[Filters] = None,
+) -> List[Tuple[List[Document], Optional[List[float]]]]:
+    """
+    `retrieve` for several queries: one embedding request for all of them, then one
+    matrix search (see `search_many_by_vector`). Results are in input order.
+    """
+    if not queries:
+        return []
+    with stage("embed_query"):
+        embeddings = embed_queries(vector_store, queries, query_cache)
+    with stage("search"):
+        return search_many_by_vector(
+            vector_store,
+            embeddings,
+            settings,
+            full_vectors=full_vectors,
+            lexical=lexical,
+            queries=queries,
+            metadata=metadata,
+            filters=filters,
+        )
+
+
+async def aretrieve_many(
+    vector_store,
+    queries: Sequence[str],
+    settings: Settings,
+    *,
+    query_cache: Optional[QueryEmbeddingCache] = None,
+    full_vectors: Optional[FullVectorStore] = None,
+    lexical: Optional[BM25Index] = None,
+    metadata: Optional[MetadataIndex] = None,
+    filters: Optional[Filters] = None,
+) -> List[Tuple[List[Document], Optional[List[float]]]]:
+    """
+    Async `retrieve_many`: the search runs in a worker thread, off the event loop.
+    """
+    if not queries:
+        return []
+    with stage("embed_query"):
+        embeddings = await aembed_queries(vector_store, queries, query_cache)
+    with stage("search"):
+        return await asyncio.to_thread(
+            search_many_by_vector,
+            vector_store,
+            embeddings,
+            settings,
+            full_vectors=full_vectors,
+            lexical=lexical,
+            queries=queries,
+            metadata=metadata,
+            filters=filters,
+        )
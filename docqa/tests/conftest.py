@@ -2,6 +2,8 @@ import pytest
 import json
 import tempfile
 from pathlib import Path
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
 from docqa.config import Settings
 from docqa.pipeline.engine import QAEngine
 
@@ -50,6 +52,33 @@ def sample_json_file_temp(temp_dir):
     return str(file_path)
 
 
+@pytest.fixture
+def sample_pdf_file(temp_dir):
+    """Create a small multi-page PDF with one line of text per page."""
+    from pypdf import PdfWriter
+    from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+    writer = PdfWriter()
+    font = writer._add_object(DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    }))
+    for i in range(5):
+        page = writer.add_blank_page(612, 792)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): font}),
+        })
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td (Security policy page {i}) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+
+    file_path = Path(temp_dir) / "sample.pdf"
+    with open(file_path, "wb") as f:
+        writer.write(f)
+    return str(file_path)
+
+
 @pytest.fixture
 def test_settings(temp_dir):
     """Return test settings with temporary storage."""
@@ -59,6 +88,8 @@ def test_settings(temp_dir):
         llm_model="qwen2.5:7b",
         embed_model="nomic-embed-text",
         faiss_index_dir=str(Path(temp_dir) / "faiss_index"),
+        embed_cache_path=str(Path(temp_dir) / "embed_cache.sqlite"),
+        answer_cache_path=str(Path(temp_dir) / "answer_cache.sqlite"),
         chunk_size=500,
         chunk_overlap=50,
     )
@@ -67,4 +98,14 @@ def test_settings(temp_dir):
 @pytest.fixture
 def qa_engine(test_settings):
     """Return QAEngine instance for testing."""
-    return QAEngine(settings=test_settings)
\ No newline at end of file
+    return QAEngine(settings=test_settings)
+
+
+@pytest.fixture
+def fake_engine(test_settings, monkeypatch):
+    """Return QAEngine wired to deterministic offline embeddings and LLM."""
+    monkeypatch.setattr(
+        "docqa.pipeline.engine.make_embeddings", lambda s: DeterministicFakeEmbedding(size=32))
+    monkeypatch.setattr(
+        "docqa.pipeline.engine.make_llm", lambda s: FakeListChatModel(responses=["AWS"]))
+    return QAEngine(settings=test_settings)
@@ -0,0 +1,63 @@
+import pytest
+from pathlib import Path
+
+from docqa.indexing import BM25Index, tokenize
+
+
+@pytest.fixture
+def bm25():
+    return BM25Index.from_texts(
+        ["a", "b", "c"],
+        [
+            "Customer data is encrypted at rest with AES-256.",
+            "The company is SOC 2 Type II certified.",
+            "Access to customer data is reviewed quarterly under control CC6.1.",
+        ],
+    )
+
+
+@pytest.mark.unit
+class TestBM25Index:
+    """Unit tests for the BM25 lexical index."""
+
+    def test_tokenize_keeps_compound_terms_and_parts(self):
+        assert tokenize("AES-256 and CC6.1") == ["aes-256", "aes", "256", "and", "cc6.1", "cc6", "1"]
+
+    def test_exact_terms_rank_first(self, bm25):
+        assert bm25.search("Is AES-256 used?", k=1)[0][0] == "a"
+        assert bm25.search("soc 2 report", k=1)[0][0] == "b"
+        assert bm25.search("cc6.1", k=1)[0][0] == "c"
+
+    def test_unknown_terms_return_nothing(self, bm25):
+        assert bm25.search("kubernetes", k=3) == []
+
+    def test_search_can_be_restricted_to_ids(self, bm25):
+        assert bm25.search("aes-256", k=3, ids={"b", "c"}) == []
+        assert [doc_id for doc_id, _ in bm25.search("aes-256", k=3, ids={"a"})] == ["a"]
+
+    def test_exclude_and_subset_drop_documents(self, bm25):
+        assert bm25.search("customer data", k=3, exclude={"a"})[0][0] == "c"
+
+        subset = bm25.subset([2, 0])
+
+        assert subset.doc_ids == ["c", "a"]
+        assert subset.search("aes-256", k=3)[0][0] == "a"
+        assert subset.search("soc 2", k=3) == []
+
+    def test_merged_leaves_original_untouched(self, bm25):
+        extra = BM25Index.from_texts(["d"], ["Backups are encrypted with AES-256 too."])
+
+        merged = bm25.merged(extra)
+
+        assert len(bm25) == 3
+        assert len(merged) == 4
+        assert {doc_id for doc_id, _ in merged.search("aes-256", k=5)} == {"a", "d"}
+        assert {doc_id for doc_id, _ in bm25.search("aes-256", k=5)} == {"a"}
+
+    def test_save_and_load_round_trip(self, bm25, temp_dir):
+        bm25.save(temp_dir)
+
+        loaded = BM25Index.load(temp_dir)
+
+        assert loaded.search("quarterly review", k=3) == bm25.search("quarterly review", k=3)
+        assert BM25Index.load(Path(temp_dir) / "missing") is None
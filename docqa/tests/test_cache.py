@@ -0,0 +1,281 @@
+import asyncio
+import threading
+import time
+import pytest
+from pathlib import Path
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from docqa.cache import (
+    CachedEmbeddings,
+    EmbeddingStore,
+    MemoryAnswerCache,
+    QueryEmbeddingCache,
+    SingleFlight,
+    SQLiteAnswerCache,
+    answer_cache_key,
+)
+from docqa.config import Settings
+
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic fake embeddings that record how many texts and requests were embedded."""
+
+    calls: int = 0
+    requests: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        self.requests += 1
+        return super().embed_documents(texts)
+
+    def embed_query(self, text):
+        self.calls += 1
+        self.requests += 1
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def embed_store(temp_dir):
+    store = EmbeddingStore(Path(temp_dir) / "embed_cache.sqlite", max_entries=3)
+    yield store
+    store.close()
+
+
+@pytest.mark.unit
+class TestCachedEmbeddings:
+    """Unit tests for the persistent embedding cache."""
+
+    def test_repeated_texts_are_not_re_embedded(self, embed_store):
+        inner = CountingEmbeddings(size=8)
+        cached = CachedEmbeddings(inner, embed_store, namespace="fake:test")
+
+        first = cached.embed_documents(["alpha", "beta"])
+        second = cached.embed_documents(["beta", "alpha"])
+
+        assert inner.calls == 2
+        assert second == [first[1], first[0]]
+        assert cached.stats()["hits"] == 2
+        assert cached.stats()["misses"] == 2
+
+    def test_namespace_separates_models(self, embed_store):
+        inner = CountingEmbeddings(size=8)
+        CachedEmbeddings(inner, embed_store, namespace="fake:a").embed_documents(["alpha"])
+        CachedEmbeddings(inner, embed_store, namespace="fake:b").embed_documents(["alpha"])
+
+        assert inner.calls == 2
+
+    def test_eviction_bounds_entries(self, embed_store):
+        cached = CachedEmbeddings(CountingEmbeddings(size=8), embed_store, namespace="fake:test")
+        cached.embed_documents(["a", "b", "c", "d", "e"])
+
+        assert len(embed_store) == 3
+
+    def test_puts_keep_a_running_count(self, embed_store):
+        """Rewritten keys aren't counted twice, and no put counts the whole table."""
+        statements = []
+        embed_store._conn.set_trace_callback(statements.append)
+        embed_store.put_many({"a": [1.0], "b": [2.0]})
+        embed_store.put_many({"a": [1.5], "c": [3.0]})
+        embed_store._conn.set_trace_callback(None)
+
+        assert "SELECT COUNT(*) FROM embeddings" not in statements
+        assert len(embed_store) == 3
+        assert embed_store.get_many(["a", "b", "c"]) == {"a": [1.5], "b": [2.0], "c": [3.0]}
+
+    def test_vectors_persist_across_instances(self, temp_dir):
+        path = Path(temp_dir) / "persist.sqlite"
+        inner = CountingEmbeddings(size=8)
+
+        store = EmbeddingStore(path)
+        CachedEmbeddings(inner, store, namespace="fake:test").embed_documents(["alpha"])
+        store.close()
+
+        store = EmbeddingStore(path)
+        CachedEmbeddings(inner, store, namespace="fake:test").embed_documents(["alpha"])
+        store.close()
+
+        assert inner.calls == 1
+
+
+@pytest.mark.unit
+class TestQueryEmbeddingCache:
+    """Unit tests for the in-memory query vector LRU."""
+
+    def test_normalized_queries_share_an_entry(self):
+        inner = CountingEmbeddings(size=8)
+        cache = QueryEmbeddingCache(inner, namespace="fake:test")
+
+        first = cache.embed_query("Is data  encrypted at rest?")
+        second = cache.embed_query("  Is data encrypted at rest? ")
+
+        assert first == second
+        assert inner.calls == 1
+        assert cache.stats()["hits"] == 1
+
+    def test_least_recently_used_entry_is_evicted(self):
+        inner = CountingEmbeddings(size=8)
+        cache = QueryEmbeddingCache(inner, namespace="fake:test", max_entries=2)
+
+        cache.embed_query("a")
+        cache.embed_query("b")
+        cache.embed_query("a")
+        cache.embed_query("c")  # evicts "b"
+        cache.embed_query("a")
+        cache.embed_query("b")
+
+        assert inner.calls == 4
+
+    def test_embed_queries_batches_misses(self, embed_store):
+        inner = CountingEmbeddings(size=8)
+        cache = QueryEmbeddingCache(
+            CachedEmbeddings(inner, embed_store, namespace="fake:test"), namespace="fake:test")
+        cache.embed_query("a")
+
+        vectors = cache.embed_queries(["a", "b", "b ", "c"])
+
+        assert inner.calls == 3
+        assert inner.requests == 2
+        assert vectors[1] == vectors[2] == cache.embed_query("b")
+        assert vectors[0] == cache.embed_query("a")
+        assert len(embed_store) == 0  # query vectors stay out of the document cache
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def answer_cache(request, temp_dir):
+    if request.param == "memory":
+        yield MemoryAnswerCache(ttl_s=60, max_entries=2)
+    else:
+        cache = SQLiteAnswerCache(Path(temp_dir) / "answers.sqlite", ttl_s=60, max_entries=2)
+        yield cache
+        cache.close()
+
+
+@pytest.mark.unit
+class TestAnswerCache:
+    """Unit tests for the answer caches."""
+
+    def test_key_depends_on_index_version_and_settings(self):
+        settings = Settings()
+        key = answer_cache_key("Is MFA enforced?", index_version="v1", settings=settings)
+
+        assert key == answer_cache_key(" Is  MFA enforced? ", index_version="v1", settings=settings)
+        assert key != answer_cache_key("Is MFA enforced?", index_version="v2", settings=settings)
+        assert key != answer_cache_key(
+            "Is MFA enforced?", index_version="v1", settings=Settings(retrieval_k=5))
+        assert key != answer_cache_key(
+            "Is MFA enforced?", index_version="v1", settings=settings, filters={"page": 1})
+        for changed in (
+            {"context_max_tokens": 1000},
+            {"llm_num_ctx": 2048},
+            {"context_answer_tokens": 256},
+            {"context_tokenizer": "tiktoken"},
+            {"context_merge_overlaps": False},
+            {"faiss_index_type": "hnsw"},
+            {"faiss_compression": "pq"},
+            {"faiss_pq_m": 8},
+        ):
+            assert key != answer_cache_key(
+                "Is MFA enforced?", index_version="v1", settings=Settings(**changed)), changed
+
+    def test_round_trip(self, answer_cache):
+        answer_cache.put("k", {"answer": "Yes", "sources": []})
+
+        assert answer_cache.get("k") == {"answer": "Yes", "sources": []}
+        assert answer_cache.get("missing") is None
+        assert answer_cache.stats()["hits"] == 1
+
+    def test_expired_entries_are_not_served(self, answer_cache, monkeypatch):
+        answer_cache.put("k", {"answer": "Yes"})
+        later = time.time() + 120
+        monkeypatch.setattr("docqa.cache.answers.time.time", lambda: later)
+
+        assert answer_cache.get("k") is None
+
+    def test_size_bound_evicts_least_recently_used(self, answer_cache):
+        answer_cache.put("a", {"answer": "A"})
+        answer_cache.put("b", {"answer": "B"})
+        answer_cache.get("a")
+        answer_cache.put("c", {"answer": "C"})
+
+        assert answer_cache.get("b") is None
+        assert answer_cache.get("a") == {"answer": "A"}
+
+    def test_sqlite_puts_keep_a_running_count(self, temp_dir):
+        cache = SQLiteAnswerCache(Path(temp_dir) / "answers.sqlite", max_entries=2)
+        statements = []
+        cache._conn.set_trace_callback(statements.append)
+        cache.put("a", {"answer": "A"})
+        cache.put("b", {"answer": "B"})
+        cache.put("a", {"answer": "A2"})
+
+        assert cache.get("b") == {"answer": "B"}
+        assert cache.get("a") == {"answer": "A2"}
+        assert not [s for s in statements if "COUNT(*)" in s]
+        cache.close()
+
+
+@pytest.mark.unit
+class TestSingleFlight:
+    """Unit tests for coalescing concurrent identical calls."""
+
+    def test_concurrent_threads_share_one_call(self):
+        flight = SingleFlight()
+        started, release = threading.Event(), threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return {"answer": "AWS"}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(3)]
+        for t in followers:
+            t.start()
+        while flight.stats()["shared"] < 3:
+            time.sleep(0.001)
+        release.set()
+        for t in [leader, *followers]:
+            t.join(5)
+
+        assert len(calls) == 1
+        assert results == [{"answer": "AWS"}] * 4
+        assert flight.stats() == {"leaders": 1, "shared": 3, "shared_rate": 0.75, "in_flight": 0}
+        assert flight.do("k", lambda: "again") == "again"
+
+    async def test_coroutines_share_result_and_errors(self):
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "AWS"
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("llm down")
+
+        assert await asyncio.gather(*(flight.ado("k", work) for _ in range(5))) == ["AWS"] * 5
+        assert len(calls) == 1
+
+        results = await asyncio.gather(*(flight.ado("k", fail) for _ in range(2)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def test_cancelled_waiter_does_not_cancel_shared_work(self):
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "AWS"
+
+        first = asyncio.ensure_future(flight.ado("k", work))
+        second = asyncio.ensure_future(flight.ado("k", work))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert await second == "AWS"
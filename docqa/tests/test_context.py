@@ -0,0 +1,59 @@
+import pytest
+from langchain_core.documents import Document
+
+from docqa.chunking import split_documents
+from docqa.llm.context import estimate_tokens, make_token_counter, pack_context
+
+PAGE = " ".join(f"Control {i} requires encryption of customer data at rest and in transit." for i in range(20))
+
+
+@pytest.fixture
+def chunks():
+    page = Document(page_content=PAGE, metadata={"source": "policy.pdf", "source_type": "pdf", "page": 1})
+    return split_documents([page], chunk_size=300, overlap=100)
+
+
+@pytest.mark.unit
+class TestPackContext:
+    """Unit tests for token-budgeted context packing."""
+
+    def test_overlapping_chunks_are_merged_once(self, chunks):
+        ranked = [(c, 0.1 * i) for i, c in enumerate(reversed(chunks))]
+
+        packed = pack_context(ranked, budget=10_000)
+
+        assert len(chunks) > 2
+        assert len(packed.docs_and_scores) == len(chunks)
+        assert packed.text.count("[1]") == 1 and "[2]" not in packed.text
+        assert packed.text.endswith(PAGE)
+
+    def test_without_merging_each_chunk_is_a_passage(self, chunks):
+        packed = pack_context([(c, 0.0) for c in chunks], budget=10_000, merge_overlaps=False)
+
+        assert f"[{len(chunks)}]" in packed.text
+        assert packed.tokens > pack_context([(c, 0.0) for c in chunks], budget=10_000).tokens
+
+    def test_budget_is_filled_in_relevance_order(self):
+        docs = [
+            (Document(page_content=f"Answer {i}: " + "word " * 40, metadata={"source": f"d{i}"}), float(i))
+            for i in range(10)
+        ]
+
+        packed = pack_context(docs, budget=220)
+
+        assert packed.tokens <= 220
+        assert [score for _, score in packed.docs_and_scores] == [0.0, 1.0, 2.0]
+
+    def test_oversized_first_chunk_is_truncated(self):
+        doc = Document(page_content="word " * 1000, metadata={})
+
+        packed = pack_context([(doc, 0.0)], budget=50)
+
+        assert 0 < packed.tokens <= 50
+        assert packed.docs_and_scores == [(doc, 0.0)]
+
+    def test_token_counters(self):
+        assert make_token_counter("estimate") is estimate_tokens
+        assert estimate_tokens("a" * 35) == 10
+        with pytest.raises(ValueError, match="Unsupported tokenizer"):
+            make_token_counter("words")
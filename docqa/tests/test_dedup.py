@@ -0,0 +1,64 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from docqa.indexing import DedupIndex, add_documents_to_faiss
+from docqa.indexing.dedup import content_hash, simhash
+
+BOILERPLATE = (
+    "The vendor maintains an information security program that is reviewed annually "
+    "by senior management and communicated to all employees and contractors."
+)
+
+
+@pytest.mark.unit
+class TestDedup:
+    """Unit tests for duplicate chunk detection."""
+
+    def test_content_hash_ignores_case_and_spacing(self):
+        assert content_hash("Data is  encrypted.") == content_hash("data is encrypted")
+        assert content_hash("Data is encrypted.") != content_hash("Data is not encrypted.")
+
+    def test_simhash_is_close_for_small_edits(self):
+        edited = BOILERPLATE.replace("annually", "yearly")
+
+        assert (simhash(BOILERPLATE) ^ simhash(edited)).bit_count() <= 8
+        assert (simhash(BOILERPLATE) ^ simhash("Backups run nightly to S3.")).bit_count() > 8
+
+    def test_duplicate_of(self):
+        index = DedupIndex(max_distance=8)
+        index.add(content_hash(BOILERPLATE), simhash(BOILERPLATE))
+        edited = BOILERPLATE.replace("annually", "yearly")
+
+        assert index.duplicate_of(content_hash(BOILERPLATE.upper()), simhash(BOILERPLATE.upper())) == "exact"
+        assert index.duplicate_of(content_hash(edited), simhash(edited)) == "near"
+        other = "Backups run nightly to S3."
+        assert index.duplicate_of(content_hash(other), simhash(other)) is None
+
+    def test_negative_distance_disables_near_duplicates(self):
+        index = DedupIndex(max_distance=-1)
+        index.add(content_hash(BOILERPLATE), simhash(BOILERPLATE))
+        edited = BOILERPLATE.replace("annually", "yearly")
+
+        assert index.duplicate_of(content_hash(edited), simhash(edited)) is None
+
+    def test_from_store_fingerprints_existing_chunks(self):
+        store = add_documents_to_faiss(
+            None, [Document(page_content=BOILERPLATE, metadata={})], DeterministicFakeEmbedding(size=8))
+
+        index = DedupIndex.from_store(store)
+
+        assert len(index) == 1
+        assert index.duplicate_of(content_hash(BOILERPLATE), simhash(BOILERPLATE)) == "exact"
+
+    def test_remove_and_ignore(self):
+        index = DedupIndex(max_distance=8)
+        digest, fingerprint = content_hash(BOILERPLATE), simhash(BOILERPLATE)
+        index.add(digest, fingerprint)
+        old_version = DedupIndex.from_documents(
+            [Document(page_content=BOILERPLATE, metadata={})], max_distance=8)
+
+        assert index.duplicate_of(digest, fingerprint, ignore=old_version) is None
+        index.remove(digest, fingerprint)
+        assert len(index) == 0
+        assert index.duplicate_of(digest, fingerprint) is None
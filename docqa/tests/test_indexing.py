@@ -0,0 +1,210 @@
+import json
+import pytest
+from pathlib import Path
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from docqa.indexing import rebuild
+from docqa.indexing import (
+    add_documents_to_faiss,
+    bytes_per_vector,
+    configure_search,
+    index_compression_of,
+    index_type_of,
+    rebuild_faiss,
+    append_segment,
+    compact_segments,
+    extend_faiss,
+    load_faiss,
+    merge_segments,
+    read_index_version,
+    read_manifest,
+    save_faiss,
+    trained_layout,
+)
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=16)
+
+
+def _delta(embeddings, *texts):
+    docs = [Document(page_content=t, metadata={}) for t in texts]
+    return add_documents_to_faiss(None, docs, embeddings)
+
+
+@pytest.mark.unit
+class TestSegments:
+    """Unit tests for segmented index persistence."""
+
+    def test_segments_are_merged_on_load(self, temp_dir, embeddings):
+        index_dir = str(Path(temp_dir) / "index")
+        append_segment(_delta(embeddings, "alpha", "beta"), index_dir)
+        version = append_segment(_delta(embeddings, "gamma"), index_dir)
+
+        store = load_faiss(index_dir, embeddings)
+
+        assert store.index.ntotal == 3
+        assert len(read_manifest(index_dir)["segments"]) == 2
+        assert read_index_version(index_dir) == version
+
+    def test_unlisted_segment_is_ignored(self, temp_dir, embeddings):
+        """A segment written without a manifest update (e.g. crash) never becomes live."""
+        index_dir = str(Path(temp_dir) / "index")
+        append_segment(_delta(embeddings, "alpha"), index_dir)
+        manifest = read_manifest(index_dir)
+        append_segment(_delta(embeddings, "beta"), index_dir)
+        (Path(index_dir) / "manifest.json").write_text(json.dumps(manifest))
+
+        assert load_faiss(index_dir, embeddings).index.ntotal == 1
+
+    def test_compaction_keeps_contents_and_version(self, temp_dir, embeddings):
+        index_dir = str(Path(temp_dir) / "index")
+        store = None
+        for text in ("alpha", "beta", "gamma"):
+            delta = _delta(embeddings, text)
+            version = append_segment(delta, index_dir)
+            store = delta if store is None else extend_faiss(store, delta)
+
+        assert compact_segments(merge_segments(store), index_dir) == 3
+
+        assert read_manifest(index_dir)["segments"] == [
+            p.name for p in (Path(index_dir) / "segments").iterdir()]
+        assert read_index_version(index_dir) == version
+        loaded = load_faiss(index_dir, embeddings)
+        assert sorted(d.page_content for d in loaded.docstore._dict.values()) == [
+            "alpha", "beta", "gamma"]
+
+    def test_legacy_index_becomes_first_segment(self, temp_dir, embeddings):
+        index_dir = str(Path(temp_dir) / "index")
+        save_faiss(_delta(embeddings, "alpha"), index_dir)
+
+        append_segment(_delta(embeddings, "beta"), index_dir)
+
+        assert read_manifest(index_dir)["segments"][0] == "."
+        assert load_faiss(index_dir, embeddings).index.ntotal == 2
+
+    def test_mmapped_index_can_be_extended(self, temp_dir, embeddings):
+        """A memory-mapped store gains a segment in RAM and is merged into one on compaction."""
+        index_dir = str(Path(temp_dir) / "index")
+        append_segment(_delta(embeddings, "alpha", "beta"), index_dir)
+
+        store = load_faiss(index_dir, embeddings, mmap=True)
+        extended = extend_faiss(store, _delta(embeddings, "gamma"))
+        merged = merge_segments(extended)
+
+        assert store.index.ntotal == 2
+        assert extended.similarity_search("gamma", k=1)[0].page_content == "gamma"
+        assert merged.index.ntotal == 3
+        assert merged.similarity_search("alpha", k=1)[0].page_content == "alpha"
+
+    def test_mmapped_segments_are_searched_in_place(self, temp_dir, embeddings):
+        """Every segment stays memory-mapped; merging copies them into one index."""
+        index_dir = str(Path(temp_dir) / "index")
+        append_segment(_delta(embeddings, "alpha", "beta"), index_dir)
+        append_segment(_delta(embeddings, "gamma"), index_dir)
+
+        store = load_faiss(index_dir, embeddings, mmap=True)
+        merged = merge_segments(store)
+
+        assert [s.ntotal for s in store.index.segments] == [2, 1]
+        assert store.similarity_search("gamma", k=1)[0].page_content == "gamma"
+        assert merged.index.ntotal == 3
+        assert merged.similarity_search("gamma", k=1)[0].page_content == "gamma"
+
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw"])
+    def test_extend_adds_a_segment_without_copying(self, embeddings, index_type):
+        base = rebuild_faiss(_delta(embeddings, "alpha", "beta", "gamma"), index_type)
+
+        extended = extend_faiss(base, _delta(embeddings, "delta", "epsilon"))
+
+        assert extended.index.segments[0] is base.index
+        assert base.index.ntotal == 3
+        assert extended.index.ntotal == 5
+        assert base.similarity_search("delta", k=5)[0].page_content != "delta"
+        assert extended.similarity_search("delta", k=1)[0].page_content == "delta"
+        assert extended.similarity_search("beta", k=1)[0].page_content == "beta"
+        assert len(extended.max_marginal_relevance_search("beta", k=2, fetch_k=5)) == 2
+        with pytest.raises(ValueError, match="already exist"):
+            extend_faiss(extended, extended)
+
+
+@pytest.mark.unit
+class TestANNIndexes:
+    """Unit tests for HNSW / IVF index structures."""
+
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+    def test_appends_keep_index_type(self, embeddings, index_type):
+        base = rebuild_faiss(
+            _delta(embeddings, "alpha", "beta", "gamma"), index_type, ivf_nlist=2, min_points_per_centroid=1)
+        configure_search(base.index, hnsw_ef_search=16, ivf_nprobe=2)
+
+        merged = merge_segments(extend_faiss(base, _delta(embeddings, "delta")))
+
+        assert index_type_of(merged.index) == index_type
+        assert merged.index.ntotal == 4
+        assert merged.similarity_search("delta", k=1)[0].page_content == "delta"
+        assert merged.max_marginal_relevance_search("beta", k=2, fetch_k=4)
+
+    def test_small_indexes_are_not_trained(self, embeddings):
+        """IVF and PQ wait for ~39 vectors per centroid instead of training on a handful."""
+        store = _delta(embeddings, *(f"policy {i}" for i in range(100)))
+
+        small = rebuild_faiss(store, "ivf", compression="pq", ivf_nlist=4, pq_m=4)
+
+        assert (index_type_of(small.index), index_compression_of(small.index)) == ("flat", "none")
+        assert trained_layout("ivf", "pq", 156, ivf_nlist=4) == ("ivf", "none")
+        assert trained_layout("hnsw", "pq", 39 * 256) == ("hnsw", "pq")
+
+    def test_rebuild_preserves_documents(self, embeddings):
+        store = _delta(embeddings, "alpha", "beta")
+
+        rebuilt = rebuild_faiss(store, "hnsw")
+
+        assert index_type_of(store.index) == "flat"
+        assert rebuilt.index_to_docstore_id == store.index_to_docstore_id
+        assert rebuilt.similarity_search("beta", k=1)[0].page_content == "beta"
+
+    @pytest.mark.parametrize("compression,code_bytes", [("fp16", 32), ("sq8", 16), ("pq", 4)])
+    def test_compressed_storage(self, embeddings, compression, code_bytes):
+        # PQ trains 256 centroids per sub-quantizer.
+        store = _delta(embeddings, *(f"policy {i}" for i in range(256)))
+
+        compressed = rebuild_faiss(store, "flat", compression=compression, pq_m=4, min_points_per_centroid=1)
+        merged = merge_segments(extend_faiss(compressed, _delta(embeddings, "delta")))
+
+        assert bytes_per_vector(store.index) == 64
+        assert bytes_per_vector(merged.index) == code_bytes
+        assert index_compression_of(merged.index) == compression
+        assert merged.index.ntotal == 257
+
+
+@pytest.mark.unit
+class TestRebuildCommand:
+    """Unit tests for the `python -m docqa.indexing.rebuild` command line."""
+
+    def test_options_override_settings(self, monkeypatch, capsys):
+        seen = []
+
+        class Engine:
+            def __init__(self, settings):
+                seen.append(settings)
+
+            def rebuild_index(self):
+                return {"compression": seen[0].faiss_compression}
+        monkeypatch.setattr(rebuild, "QAEngine", Engine)
+
+        assert rebuild.main(
+            ["--index-type", "ivf", "--compression", "pq", "--pq-m", "8", "--rerank"]) == 0
+
+        settings = seen[0]
+        assert (settings.faiss_index_type, settings.faiss_compression) == ("ivf", "pq")
+        assert settings.faiss_pq_m == 8
+        assert settings.faiss_rerank is True
+        assert json.loads(capsys.readouterr().out) == {"compression": "pq"}
+
+        rebuild.main(["--no-rerank"])
+        assert seen[1].faiss_rerank is False
+        with pytest.raises(ValueError, match="faiss_pq_m"):
+            rebuild.main(["--pq-m", "0"])
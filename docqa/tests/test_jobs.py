@@ -0,0 +1,156 @@
+import shutil
+import time
+import pytest
+from pathlib import Path
+
+from docqa.pipeline.jobs import IngestJobQueue, IngestQueueFull
+
+
+def _spool(jobs, sample_json_file):
+    path = jobs.spool_path(".json")
+    shutil.copy(sample_json_file, path)
+    return path
+
+
+def _wait(jobs, job_id, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = jobs.get(job_id)
+        if job["status"] in {"succeeded", "failed"}:
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _expire_heartbeats(jobs):
+    """Make every running job look abandoned, as if its process had died."""
+    jobs._conn.execute("UPDATE ingest_jobs SET heartbeat_at = 0")
+    jobs._conn.commit()
+
+
+@pytest.fixture
+def make_jobs(fake_engine, temp_dir):
+    created = []
+
+    def _make(**kwargs):
+        jobs = IngestJobQueue(
+            fake_engine,
+            db_path=Path(temp_dir) / "jobs.sqlite",
+            spool_dir=Path(temp_dir) / "spool",
+            **kwargs,
+        )
+        created.append(jobs)
+        return jobs
+
+    yield _make
+    for jobs in created:
+        jobs.close()
+
+
+@pytest.mark.unit
+class TestIngestJobQueue:
+    """Unit tests for background ingestion jobs."""
+
+    def test_job_runs_and_reports_progress(self, make_jobs, sample_json_file):
+        jobs = make_jobs(workers=1)
+        jobs.start()
+        path = _spool(jobs, sample_json_file)
+
+        job = _wait(jobs, jobs.submit(path, file_type="json", filename="sample.json"))
+
+        assert job["status"] == "succeeded"
+        assert job["result"]["chunks_added"] > 0
+        assert job["progress"]["pages_parsed"] > 0
+        assert job["progress"]["chunks_embedded"] == job["result"]["chunks_added"]
+        assert job["progress"]["persisted"] is True
+        assert not Path(path).exists()
+
+    def test_failed_job_records_error(self, make_jobs, temp_dir):
+        jobs = make_jobs(workers=1)
+        jobs.start()
+        path = jobs.spool_path(".json")
+        Path(path).write_text("not json", encoding="utf-8")
+
+        job = _wait(jobs, jobs.submit(path, file_type="json"))
+
+        assert job["status"] == "failed"
+        assert job["error"]
+
+    def test_full_queue_rejects_submissions(self, make_jobs, sample_json_file):
+        jobs = make_jobs(max_queued=1)  # not started, so nothing drains the queue
+        jobs.submit(_spool(jobs, sample_json_file), file_type="json")
+
+        with pytest.raises(IngestQueueFull):
+            jobs.submit(_spool(jobs, sample_json_file), file_type="json")
+
+    def test_queued_jobs_resume_after_restart(self, make_jobs, sample_json_file):
+        jobs = make_jobs()
+        job_id = jobs.submit(_spool(jobs, sample_json_file), file_type="json")
+        jobs.close()
+
+        restarted = make_jobs(workers=1)
+        restarted.start()
+
+        assert _wait(restarted, job_id)["status"] == "succeeded"
+
+    def test_job_is_claimed_once(self, make_jobs, sample_json_file):
+        """Two queues sharing the table (e.g. two API processes) never run the same job."""
+        first, second = make_jobs(), make_jobs()
+        job_id = first.submit(_spool(first, sample_json_file), file_type="json")
+
+        assert first._claim(job_id) is not None
+        assert second._claim(job_id) is None
+        assert first._claim(job_id) is None
+        assert first.get(job_id)["status"] == "running"
+
+    def test_live_running_job_is_not_taken_over(self, make_jobs, sample_json_file):
+        """A job running in another process with a fresh heartbeat stays with it."""
+        other = make_jobs()
+        job_id = other.submit(_spool(other, sample_json_file), file_type="json")
+        other._claim(job_id)
+
+        jobs = make_jobs(workers=1)
+        jobs.start()
+
+        assert jobs.queued() == 0
+        assert jobs.get(job_id)["status"] == "running"
+
+    def test_abandoned_job_is_retried_then_failed(self, make_jobs, sample_json_file):
+        """A job whose process died is run again, until it has used up its attempts."""
+        other = make_jobs(max_attempts=2)
+        job_id = other.submit(_spool(other, sample_json_file), file_type="json")
+
+        other._claim(job_id)
+        _expire_heartbeats(other)
+        assert other._recover() == [job_id]
+        other._claim(job_id)
+        _expire_heartbeats(other)
+        assert other._recover() == []
+
+        job = other.get(job_id)
+        assert job["status"] == "failed"
+        assert "2 attempts" in job["error"]
+
+    def test_abandoned_job_resumes_on_start(self, make_jobs, sample_json_file):
+        other = make_jobs()
+        job_id = other.submit(_spool(other, sample_json_file), file_type="json")
+        other._claim(job_id)
+        _expire_heartbeats(other)
+
+        jobs = make_jobs(workers=1)
+        jobs.start()
+
+        assert _wait(jobs, job_id)["status"] == "succeeded"
+
+    def test_upsert_job_replaces_document(self, make_jobs, sample_json_file):
+        jobs = make_jobs(workers=1)
+        jobs.start()
+        _wait(jobs, jobs.submit(_spool(jobs, sample_json_file), file_type="json", document_id="faq"))
+
+        job = _wait(jobs, jobs.submit(
+            _spool(jobs, sample_json_file), file_type="json", document_id="faq", mode="upsert"))
+
+        assert job["status"] == "succeeded"
+        assert job["mode"] == "upsert"
+        assert job["result"]["chunks_reused"] == job["result"]["chunks_replaced"] > 0
+        assert [d["document_id"] for d in jobs.engine.list_documents()] == ["faq"]
@@ -0,0 +1,28 @@
+import pytest
+
+from docqa.loaders import load_pdf, load_pdf_parallel
+
+
+@pytest.mark.unit
+class TestPDFLoaders:
+    """Unit tests for the PDF loaders."""
+
+    def test_parallel_matches_sequential(self, sample_pdf_file):
+        """Pages parsed across processes come back in order with identical content and metadata."""
+        expected = load_pdf(sample_pdf_file)
+        docs = load_pdf_parallel(sample_pdf_file, workers=2, pages_per_task=2)
+
+        assert [d.page_content for d in docs] == [d.page_content for d in expected]
+        assert [d.metadata for d in docs] == [d.metadata for d in expected]
+        assert [d.metadata["page"] for d in docs] == [0, 1, 2, 3, 4]
+        assert docs[0].metadata["source_type"] == "pdf"
+
+    def test_single_range_is_parsed_in_process(self, sample_pdf_file):
+        """A file that fits in one task is not handed to a process pool."""
+        docs = load_pdf_parallel(sample_pdf_file, workers=4, pages_per_task=16)
+
+        assert docs[2].page_content == "Security policy page 2"
+
+    def test_missing_file_raises(self, temp_dir):
+        with pytest.raises(FileNotFoundError):
+            load_pdf_parallel(f"{temp_dir}/missing.pdf", workers=2)
@@ -0,0 +1,145 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from docqa.indexing import (
+    MetadataIndex,
+    add_documents_to_faiss,
+    configure_search,
+    extend_faiss,
+    index_compression_of,
+    rebuild_faiss,
+)
+from docqa.indexing.metadata import search_positions
+
+FIELDS = ["source", "source_type", "page"]
+
+
+@pytest.fixture
+def embeddings():
+    return DeterministicFakeEmbedding(size=16)
+
+
+def _store(embeddings, n):
+    docs = [
+        Document(
+            page_content=f"Policy text {i}",
+            metadata={"source": f"vendor-{i % 3}.pdf", "source_type": "pdf", "page": i},
+        )
+        for i in range(n)
+    ]
+    return add_documents_to_faiss(None, docs, embeddings)
+
+
+@pytest.fixture
+def store(embeddings):
+    return _store(embeddings, 30)
+
+
+@pytest.mark.unit
+class TestMetadataIndex:
+    """Unit tests for metadata filters."""
+
+    def test_equality_in_set_and_range(self, store):
+        metadata = MetadataIndex.from_store(FIELDS, store)
+
+        assert metadata.select({"source": "vendor-1.pdf"}).tolist() == list(range(1, 30, 3))
+        assert len(metadata.select({"source": ["vendor-0.pdf", "vendor-1.pdf"]})) == 20
+        assert metadata.select(
+            {"source": "vendor-1.pdf", "page": {"gte": 5, "lt": 13}}).tolist() == [7, 10]
+        assert metadata.select({"source": "missing.pdf"}).size == 0
+
+    def test_invalid_filters_raise(self, store):
+        metadata = MetadataIndex.from_store(FIELDS, store)
+
+        with pytest.raises(ValueError, match="Cannot filter"):
+            metadata.select({"producer": "x"})
+        with pytest.raises(ValueError, match="operators"):
+            metadata.select({"page": {"between": [1, 2]}})
+
+    def test_merged_shifts_positions(self, store):
+        metadata = MetadataIndex.from_store(FIELDS, store)
+        extra = MetadataIndex.from_metadatas(FIELDS, [{"source": "vendor-1.pdf", "page": 0}])
+
+        merged = metadata.merged(extra)
+
+        assert len(merged) == 31
+        assert merged.select({"source": "vendor-1.pdf", "page": 0}).tolist() == [30]
+        assert metadata.select({"source": "vendor-1.pdf", "page": 0}).size == 0
+
+    def test_without_hides_deleted_positions(self, store):
+        metadata = MetadataIndex.from_store(FIELDS, store)
+        gone = metadata.select({"source": "vendor-1.pdf"})
+
+        metadatas = [store.docstore.search(store.index_to_docstore_id[int(p)]).metadata for p in gone]
+
+        pruned = metadata.without(gone, metadatas)
+
+        assert pruned.deleted_count == 10
+        assert pruned.select({"source": "vendor-1.pdf"}).size == 0
+        assert pruned.select({"page": {"lt": 3}}).tolist() == [0, 2]
+        assert len(pruned.select({})) == 20
+        assert metadata.deleted_count == 0
+
+    @pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+    def test_search_only_returns_selected_positions(self, store, embeddings, index_type):
+        indexed = rebuild_faiss(store, index_type, ivf_nlist=4, min_points_per_centroid=1)
+        configure_search(indexed.index, hnsw_ef_search=16, ivf_nprobe=1)
+        positions = MetadataIndex.from_store(FIELDS, indexed).select({"source": "vendor-2.pdf"})
+
+        pairs = search_positions(indexed, embeddings.embed_query("Policy text 8"), 4, positions)
+
+        assert len(pairs) == 4
+        assert pairs[0][0].page_content == "Policy text 8"
+        assert {d.metadata["source"] for d, _ in pairs} == {"vendor-2.pdf"}
+
+    @pytest.mark.parametrize("scan_chunk", [4096, 16])
+    def test_pq_search_with_filters_and_tombstones(self, embeddings, monkeypatch, scan_chunk):
+        """A flat PQ index takes no selector: only the selected positions are scored, chunk by chunk."""
+        monkeypatch.setattr("docqa.indexing.metadata._EXACT_SCAN_MAX", 0)
+        monkeypatch.setattr("docqa.indexing.metadata._SCAN_CHUNK", scan_chunk)
+        indexed = rebuild_faiss(_store(embeddings, 300), "flat", compression="pq", pq_m=4, min_points_per_centroid=1)
+        assert index_compression_of(indexed.index) == "pq"
+        index, scanned = indexed.index, []
+        reconstruct_batch = index.reconstruct_batch
+        index.reconstruct_batch = lambda ids: (scanned.append(len(ids)), reconstruct_batch(ids))[1]
+        index.search = None  # would score every position
+        metadata = MetadataIndex.from_store(FIELDS, indexed)
+        query = embeddings.embed_query("Policy text 8")
+
+        filtered = search_positions(indexed, query, 4, metadata.selection({"source": "vendor-2.pdf"}))
+        assert len(filtered) == 4
+        assert filtered[0][0].page_content == "Policy text 8"
+        assert {d.metadata["source"] for d, _ in filtered} == {"vendor-2.pdf"}
+        assert sum(scanned) == 100 and max(scanned) <= scan_chunk
+
+        gone = metadata.select({"source": "vendor-2.pdf"})
+        pruned = metadata.without(gone, [{"source": "vendor-2.pdf"}] * len(gone))
+        live = search_positions(indexed, query, 250, pruned.selection({}))
+        assert len(live) == 200
+        assert "vendor-2.pdf" not in {d.metadata["source"] for d, _ in live}
+
+    @pytest.mark.parametrize("exact_scan_max", [4096, 0])
+    def test_search_across_segments(self, store, embeddings, monkeypatch, exact_scan_max):
+        """Selections are split per segment and the hits merged, best first."""
+        monkeypatch.setattr("docqa.indexing.metadata._EXACT_SCAN_MAX", exact_scan_max)
+        base = rebuild_faiss(store, "hnsw")
+        extended = extend_faiss(base, _store(embeddings, 30))
+        metadata = MetadataIndex.from_store(FIELDS, extended)
+        query = embeddings.embed_query("Policy text 8")
+
+        pairs = search_positions(extended, query, 4, metadata.selection({"source": "vendor-2.pdf"}))
+
+        assert [d.page_content for d, _ in pairs[:2]] == ["Policy text 8"] * 2
+        assert {d.metadata["source"] for d, _ in pairs} == {"vendor-2.pdf"}
+        assert [score for _, score in pairs] == sorted(score for _, score in pairs)
+
+    def test_live_selection_is_cached_per_index(self, store):
+        metadata = MetadataIndex.from_store(FIELDS, store)
+        pruned = metadata.without(metadata.select({"page": 0}), [{"page": 0}])
+
+        live = pruned.selection({})
+
+        assert pruned.selection({}) is live
+        assert live.bitmap() is live.bitmap()
+        assert pruned.deleted_positions().tolist() == [0]
@@ -0,0 +1,78 @@
+import time
+import pytest
+
+from docqa.metrics import Counter, Histogram, collect_timings, render_values, stage, timed_iter
+
+
+@pytest.mark.unit
+class TestTimings:
+    """Unit tests for per-request stage timers."""
+
+    def test_nested_stages_are_exclusive(self):
+        with collect_timings() as timings:
+            with stage("outer"):
+                time.sleep(0.02)
+                with stage("inner"):
+                    time.sleep(0.03)
+
+        assert timings.stages["inner"] >= 0.03
+        assert 0.02 <= timings.stages["outer"] < 0.03
+        assert timings.stages["outer"] + timings.stages["inner"] <= timings.total()
+        assert set(timings.as_dict()) == {"outer_ms", "inner_ms", "total_ms"}
+
+    def test_repeated_stages_add_up(self):
+        with collect_timings() as timings:
+            for _ in timed_iter("parse", [1, 2, 3]):
+                with stage("embed"):
+                    pass
+
+        assert set(timings.stages) == {"parse", "embed"}
+
+    def test_snapshot_is_a_copy(self):
+        with collect_timings() as timings:
+            with stage("embed"):
+                pass
+            snapshot = timings.snapshot()
+            with stage("llm"):
+                pass
+
+        assert set(snapshot) == {"embed"}
+        assert set(timings.snapshot()) == {"embed", "llm"}
+
+    def test_stages_outside_collection_are_ignored(self):
+        with stage("orphan"):
+            pass
+        with collect_timings() as timings:
+            pass
+
+        assert timings.stages == {}
+
+
+@pytest.mark.unit
+class TestPrometheusRendering:
+    """Unit tests for the text exposition format."""
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("docqa_test_seconds", "Test latency", (0.1, 1.0), ("stage",))
+        histogram.observe(0.05, stage="llm")
+        histogram.observe(0.5, stage="llm")
+        histogram.observe(5.0, stage="llm")
+
+        assert histogram.render() == [
+            "# HELP docqa_test_seconds Test latency",
+            "# TYPE docqa_test_seconds histogram",
+            'docqa_test_seconds_bucket{stage="llm",le="0.1"} 1',
+            'docqa_test_seconds_bucket{stage="llm",le="1.0"} 2',
+            'docqa_test_seconds_bucket{stage="llm",le="+Inf"} 3',
+            'docqa_test_seconds_sum{stage="llm"} 5.55',
+            'docqa_test_seconds_count{stage="llm"} 3',
+        ]
+
+    def test_counter_and_values_escape_labels(self):
+        counter = Counter("docqa_test_total", "Test count", ("outcome",))
+        counter.inc(outcome='a "b"')
+
+        assert counter.render()[-1] == 'docqa_test_total{outcome="a \\"b\\""} 1.0'
+        assert render_values("docqa_ratio", "Ratio", {("x",): 0.5, ("y",): None}, ("cache",))[2:] == [
+            'docqa_ratio{cache="x"} 0.5',
+        ]
@@ -0,0 +1,232 @@
+import asyncio
+
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding, Embeddings
+
+from docqa.config import Settings
+from docqa.llm.fake import FakeChatModel, FakeEmbeddings, fake_answer
+from docqa.llm.prompts import build_grounded_prompt
+from docqa.pipeline.engine import QAEngine
+from docqa.llm.providers import (
+    BatchingEmbeddings,
+    TokenBucket,
+    is_retryable,
+    make_embeddings,
+    make_llm,
+)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class FlakyEmbeddings(Embeddings):
+    """Fake embeddings recording request sizes and failing the first `failures` requests."""
+
+    def __init__(self, failures=0, error=None):
+        self.fake = DeterministicFakeEmbedding(size=8)
+        self.batches = []
+        self.failures = failures
+        self.error = error or ConnectionError("connection reset")
+
+    def embed_documents(self, texts):
+        self.batches.append(len(texts))
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        return self.fake.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return self.embed_documents(texts)
+
+
+def texts(n):
+    return [f"chunk {i}" for i in range(n)]
+
+
+@pytest.mark.unit
+class TestBatchingEmbeddings:
+    """Unit tests for the batching, retrying embeddings client."""
+
+    def test_batches_keep_input_order(self):
+        inner = FlakyEmbeddings()
+        client = BatchingEmbeddings(inner, batch_size=3, max_concurrency=4)
+
+        vectors = client.embed_documents(texts(10))
+
+        assert sorted(inner.batches) == [1, 3, 3, 3]
+        assert vectors == DeterministicFakeEmbedding(size=8).embed_documents(texts(10))
+        assert client.stats()["requests"] == 4
+        assert client.stats()["texts"] == 10
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        inner = FlakyEmbeddings(failures=2)
+        sleeps = []
+        client = BatchingEmbeddings(
+            inner, batch_size=4, max_concurrency=1, backoff_s=0.5, sleep=sleeps.append)
+
+        vectors = client.embed_documents(texts(4))
+
+        assert len(vectors) == 4
+        assert len(sleeps) == 2
+        assert 0.25 <= sleeps[0] <= 0.5 and 0.5 <= sleeps[1] <= 1.0
+        assert client.stats()["retries"] == 2
+        assert client.stats()["failures"] == 0
+
+    def test_permanent_errors_are_raised_at_once(self):
+        inner = FlakyEmbeddings(failures=1, error=StatusError(400))
+        client = BatchingEmbeddings(inner, sleep=lambda s: None)
+
+        with pytest.raises(StatusError):
+            client.embed_documents(texts(2))
+        assert inner.batches == [2]
+        assert client.stats()["failures"] == 1
+
+    def test_gives_up_after_max_retries(self):
+        inner = FlakyEmbeddings(failures=10, error=StatusError(503))
+        client = BatchingEmbeddings(inner, max_retries=2, sleep=lambda s: None)
+
+        with pytest.raises(StatusError):
+            client.embed_documents(texts(2))
+        assert len(inner.batches) == 3
+
+    async def test_async_batches_and_retries(self, monkeypatch):
+        async def no_sleep(seconds):
+            return None
+
+        monkeypatch.setattr("docqa.llm.providers.asyncio.sleep", no_sleep)
+        inner = FlakyEmbeddings(failures=1)
+        client = BatchingEmbeddings(inner, batch_size=2, max_concurrency=2)
+
+        vectors = await client.aembed_documents(texts(5))
+
+        assert vectors == DeterministicFakeEmbedding(size=8).embed_documents(texts(5))
+        assert client.stats()["retries"] == 1
+
+    async def test_async_concurrency_is_bounded_across_calls(self):
+        """Concurrent aembed_documents / aembed_query calls share one max_concurrency bound."""
+        class SlowEmbeddings(FlakyEmbeddings):
+            in_flight = peak = 0
+
+            async def aembed_documents(self, texts):
+                SlowEmbeddings.in_flight += 1
+                SlowEmbeddings.peak = max(SlowEmbeddings.peak, SlowEmbeddings.in_flight)
+                await asyncio.sleep(0.01)
+                SlowEmbeddings.in_flight -= 1
+                return self.embed_documents(texts)
+
+            async def aembed_query(self, text):
+                return (await self.aembed_documents([text]))[0]
+
+        client = BatchingEmbeddings(SlowEmbeddings(), batch_size=1, max_concurrency=2)
+
+        await asyncio.gather(
+            client.aembed_documents(texts(4)),
+            client.aembed_documents(texts(4)),
+            *(client.aembed_query(t) for t in texts(4)),
+        )
+
+        assert SlowEmbeddings.peak == 2
+
+    def test_retryable_errors(self):
+        assert is_retryable(TimeoutError())
+        assert is_retryable(StatusError(429))
+        assert is_retryable(StatusError(502))
+        assert not is_retryable(StatusError(401))
+        assert not is_retryable(ValueError("bad input"))
+
+    def test_token_bucket_paces_requests(self):
+        bucket = TokenBucket(rate=10.0, capacity=2.0)
+
+        assert bucket.reserve(2) == 0.0
+        assert bucket.reserve(1) == pytest.approx(0.1, abs=0.01)
+
+    def test_settings_reject_invalid_limits(self):
+        with pytest.raises(ValueError, match="embed_batch_size"):
+            Settings(embed_batch_size=0).validate()
+        with pytest.raises(ValueError, match="embed_requests_per_minute"):
+            Settings(embed_tokens_per_minute=-1).validate()
+
+
+@pytest.mark.unit
+class TestProviderClients:
+    """Unit tests for the provider clients' shared HTTP connection pools."""
+
+    def test_ollama_llm_and_embeddings_share_connection_pools(self):
+        settings = Settings(http_keepalive_expiry_s=30.0, http_timeout_s=120.0)
+        llm = make_llm(settings)
+        embeddings = make_embeddings(settings).underlying
+
+        assert llm._client._client._transport is embeddings._client._client._transport
+        assert llm._async_client._client._transport is embeddings._async_client._client._transport
+        assert llm._client._client.timeout.read == 120.0
+        assert llm._client._client._transport is not make_llm(Settings())._client._client._transport
+
+    def test_openai_clients_share_connection_pools(self, monkeypatch):
+        monkeypatch.delenv("OPENAI_API_KEY", raising=False)  # restored after make_* set it
+        settings = Settings(llm_provider="openai", embed_provider="openai", openai_api_key="sk-test")
+        llm = make_llm(settings)
+        embeddings = make_embeddings(settings).underlying
+
+        assert llm.http_client._transport is embeddings.http_client._transport
+        assert llm.http_async_client._transport is embeddings.http_async_client._transport
+
+    def test_async_connection_pools_are_per_event_loop(self, monkeypatch):
+        """Async requests reuse one pool on a loop but never share it with another loop."""
+        import httpx
+
+        loops = []
+
+        def transport(limits):
+            loops.append(asyncio.get_running_loop())
+            return httpx.MockTransport(lambda request: httpx.Response(200))
+        monkeypatch.setattr(httpx, "AsyncHTTPTransport", transport)
+        client = make_llm(Settings(http_timeout_s=7.0))._async_client._client
+
+        async def send_twice():
+            for _ in range(2):
+                assert (await client.get("http://ollama.test/api/tags")).status_code == 200
+
+        asyncio.run(send_twice())
+        asyncio.run(send_twice())
+
+        assert len(loops) == 2
+        assert loops[0] is not loops[1]
+
+
+@pytest.mark.unit
+class TestFakeProviders:
+    """Unit tests for the offline stand-in providers."""
+
+    def test_fake_embeddings_are_deterministic_and_lexical(self):
+        embeddings = FakeEmbeddings(dim=64)
+        a, b, c = embeddings.embed_documents(
+            ["AES-256 encryption at rest", "encryption at rest with AES-256", "quarterly access reviews"])
+
+        assert embeddings.embed_query("AES-256 encryption at rest") == a
+        assert len(a) == 64
+        assert sum(x * y for x, y in zip(a, b)) > sum(x * y for x, y in zip(a, c))
+
+    def test_fake_llm_answers_from_first_passage(self):
+        context = "[1] (no-meta, score=0.9)\nData is hosted on AWS. Backups run daily.\n\n[2] (no-meta, score=0.5)\nOther."
+        prompt = build_grounded_prompt(context=context, question="Where is data hosted?")
+
+        assert fake_answer(prompt) == "Data is hosted on AWS."
+        assert FakeChatModel().invoke(prompt).content == "Data is hosted on AWS."
+        assert "".join(c.content for c in FakeChatModel().stream(prompt)) == "Data is hosted on AWS."
+        assert fake_answer(build_grounded_prompt(context="", question="?")) == "Answer not found"
+
+    def test_engine_runs_offline_on_fake_providers(self, test_settings, sample_json_file):
+        settings = test_settings.model_copy(update={"llm_provider": "fake", "embed_provider": "fake"})
+        engine = QAEngine(settings=settings)
+        engine.ingest_json(sample_json_file)
+
+        result = engine.answer("Which cloud provider is used?")
+
+        assert result["sources"]
+        assert result["answer"] and result["model"] == "fake"
@@ -1,5 +1,11 @@
+import asyncio
+import threading
+from pathlib import Path
+
 import pytest
-from docqa.pipeline.engine import QAEngine
+from docqa.pipeline import engine as engine_module
+from docqa.pipeline.engine import DocumentNotFound, QAEngine
+from docqa.indexing import index_type_of
 from langchain_core.documents import Document
 
 
@@ -49,4 +55,475 @@ class TestQAEngine:
         ]
         
         result = qa_engine.ingest_documents(docs)
-        assert result["chunks_added"] == 1
\ No newline at end of file
+        assert result["chunks_added"] == 1
+
+    def test_repeated_question_served_from_answer_cache(self, fake_engine, sample_json_file):
+        """A repeated question against an unchanged index should not reach the LLM."""
+        fake_engine.ingest_json(sample_json_file)
+
+        first = fake_engine.answer("Which cloud provider is used?")
+        second = fake_engine.answer("Which cloud provider is used?")
+
+        assert first["cached"] is False
+        assert second["cached"] is True
+        assert second["answer"] == first["answer"]
+
+    def test_ingest_invalidates_answer_cache(self, fake_engine, sample_json_file):
+        """Ingesting bumps the index version so earlier answers are not reused."""
+        fake_engine.ingest_json(sample_json_file)
+        version = fake_engine.index_version
+        fake_engine.answer("Which cloud provider is used?")
+
+        fake_engine.ingest_documents([Document(page_content="New policy text.", metadata={})])
+
+        assert fake_engine.index_version != version
+        assert fake_engine.answer("Which cloud provider is used?")["cached"] is False
+
+    def test_answer_reports_stage_timings_and_metrics(self, fake_engine, sample_json_file):
+        """Answers carry per-stage timings, which also feed the engine's histograms."""
+        ingest = fake_engine.ingest_json(sample_json_file)
+        result = fake_engine.answer("Which cloud provider is used?")
+
+        assert {"parse_ms", "embed_ms", "index_ms", "total_ms"} <= set(ingest["timings"])
+        assert {"embed_query_ms", "search_ms", "context_ms", "llm_ms", "total_ms"} <= set(result["timings"])
+        assert sum(v for k, v in result["timings"].items() if k != "total_ms") <= result["timings"]["total_ms"]
+        assert fake_engine.answer("Which cloud provider is used?")["cached"] is True
+
+        text = fake_engine.render_metrics()
+        assert 'docqa_stage_seconds_count{operation="answer",stage="llm"} 1' in text
+        assert 'docqa_answers_total{outcome="cached"} 1.0' in text
+        assert "docqa_prompt_context_tokens_bucket" in text
+        assert 'docqa_cache_hits_total{cache="answer"} 1' in text
+        assert "docqa_ingested_chunks_total" in text
+
+    def test_answer_many_keeps_input_order(self, fake_engine, sample_json_file):
+        """Batch results come back in the order the questions were given."""
+        fake_engine.ingest_json(sample_json_file)
+        questions = ["What is the company name?", "Which cloud provider is used?", "Is MFA used?"]
+
+        results = fake_engine.answer_many(questions, max_concurrency=3)
+
+        assert [r["question"] for r in results] == questions
+        assert all(r["answer"] == "AWS" for r in results)
+
+    def test_answer_many_embeds_questions_in_one_request(self, fake_engine, sample_json_file, monkeypatch):
+        """Batch questions are embedded together, not one request per question."""
+        fake_engine.ingest_json(sample_json_file)
+        calls = []
+        monkeypatch.setattr(fake_engine.embeddings, "embed_query", lambda text: calls.append(text))
+        questions = ["What is the company name?", "Which cloud provider is used?", "What is the main product?"]
+
+        results = fake_engine.answer_many(questions)
+
+        assert calls == []
+        assert all(r["sources"] for r in results)
+        assert [r["sources"][0]["text_snippet"] for r in results] == [
+            fake_engine.answer(q)["sources"][0]["text_snippet"] for q in questions]
+
+    def test_answer_many_isolates_failures(self, fake_engine, sample_json_file, monkeypatch):
+        """One failing question should not fail the rest of the batch."""
+        fake_engine.ingest_json(sample_json_file)
+        real_retrieve = engine_module.retrieve
+
+        def flaky_retrieve(store, query, settings, **kwargs):
+            if query == "boom":
+                raise RuntimeError("retrieval failed")
+            return real_retrieve(store, query, settings, **kwargs)
+
+        def failing_batch(*args, **kwargs):
+            raise RuntimeError("batch retrieval failed")
+
+        monkeypatch.setattr(engine_module, "retrieve", flaky_retrieve)
+        monkeypatch.setattr(engine_module, "retrieve_many", failing_batch)
+        results = fake_engine.answer_many(["Which cloud provider is used?", "boom"])
+
+        assert results[0]["answer"] == "AWS"
+        assert results[1]["answer"] is None
+        assert "retrieval failed" in results[1]["error"]
+
+    async def test_concurrent_identical_questions_share_one_llm_call(self, fake_engine, sample_json_file, monkeypatch):
+        """Identical in-flight questions are answered once; each caller keeps its own wording."""
+        await fake_engine.aingest_json(sample_json_file)
+        fake_engine.answer_cache = None
+        calls = []
+        real_ainvoke = fake_engine.llm.ainvoke
+
+        async def slow_ainvoke(prompt, *args, **kwargs):
+            calls.append(prompt)
+            await asyncio.sleep(0.05)
+            return await real_ainvoke(prompt, *args, **kwargs)
+
+        monkeypatch.setattr(type(fake_engine.llm), "ainvoke", lambda self, p, *a, **k: slow_ainvoke(p, *a, **k))
+        questions = ["Which cloud provider is used?", " Which  cloud provider is used?", "What is the company name?"]
+
+        results = await asyncio.gather(*(fake_engine.aanswer(q) for q in questions))
+
+        assert len(calls) == 2
+        assert [r["question"] for r in results] == questions
+        assert results[0]["answer"] == results[1]["answer"] == "AWS"
+        assert fake_engine.inflight.stats()["shared"] == 1
+
+    def test_ingest_publishes_new_snapshot_without_mutating_old(self, fake_engine, sample_json_file):
+        """Readers holding the previous snapshot keep a consistent view during ingestion."""
+        fake_engine.ingest_json(sample_json_file)
+        before = fake_engine.vector_store
+        size_before = before.index.ntotal
+
+        fake_engine.ingest_documents([Document(page_content="New policy text.", metadata={})])
+
+        assert before.index.ntotal == size_before
+        assert fake_engine.vector_store is not before
+        # The new chunks are a segment of their own; the published index isn't copied.
+        assert fake_engine.vector_store.index.segments[0] is before.index
+        assert fake_engine.vector_store.index.ntotal == size_before + 1
+
+    def test_ingest_streams_documents_in_batches(self, fake_engine):
+        """A lazy document stream is embedded batch by batch with global chunk numbering."""
+        fake_engine.settings.ingest_batch_size = 2
+        docs = (Document(page_content=f"Policy section {i}.", metadata={"page": i}) for i in range(5))
+        updates = []
+
+        result = fake_engine.ingest_documents(docs, progress=updates.append)
+
+        assert result["ingested_pages"] == 5
+        assert result["chunks_added"] == 5
+        assert [u["chunks_embedded"] for u in updates if "chunks_embedded" in u] == [2, 4, 5]
+        stored = fake_engine.vector_store.docstore._dict.values()
+        assert sorted(d.metadata["chunk_index"] for d in stored) == [0, 1, 2, 3, 4]
+
+    def test_large_ingest_spills_to_unpublished_segments(self, fake_engine, monkeypatch):
+        """The in-memory delta stays below the spill size; nothing is visible before the publish."""
+        fake_engine.settings.ingest_batch_size = 2
+        fake_engine.settings.ingest_spill_chunks = 3
+        spill = fake_engine._spill
+        pending = []
+
+        def checked_spill(delta):
+            pending.append(delta.index.ntotal)
+            assert fake_engine.vector_store is None
+            return spill(delta)
+
+        monkeypatch.setattr(fake_engine, "_spill", checked_spill)
+        docs = (Document(page_content=f"Policy section {i}.", metadata={"page": i}) for i in range(11))
+
+        result = fake_engine.ingest_documents(docs)
+
+        assert pending == [4, 4, 3]
+        assert result["chunks_added"] == 11
+        reloaded = QAEngine(settings=fake_engine.settings)
+        stored = reloaded.vector_store.docstore._dict.values()
+        assert sorted(d.metadata["chunk_index"] for d in stored) == list(range(11))
+        assert reloaded.answer("Which cloud provider is used?")["answer"] == "AWS"
+
+    def test_failed_ingest_discards_spilled_segments(self, fake_engine):
+        fake_engine.settings.ingest_batch_size = 2
+        fake_engine.settings.ingest_spill_chunks = 2
+
+        def docs():
+            for i in range(5):
+                yield Document(page_content=f"Policy section {i}.", metadata={})
+            raise RuntimeError("parser crashed")
+
+        with pytest.raises(RuntimeError):
+            fake_engine.ingest_documents(docs())
+
+        assert fake_engine.vector_store is None
+        assert not list((Path(fake_engine.settings.faiss_index_dir) / "segments").iterdir())
+
+    def test_ingest_reports_its_own_embed_cache_counts(self, fake_engine):
+        """Cache hits and misses are counted per ingest, not since the process started."""
+        first = fake_engine.ingest_documents([Document(page_content="First policy.", metadata={})])
+        second = fake_engine.ingest_documents([Document(page_content="Second policy.", metadata={})])
+
+        assert first["embed_cache"]["misses"] == second["embed_cache"]["misses"] == 1
+        assert second["embed_cache"]["hits"] == 0
+        assert fake_engine.embeddings.stats()["misses"] == 2
+
+    def test_reingest_skips_duplicate_chunks(self, fake_engine, sample_json_file):
+        """Re-ingesting a file adds nothing; repeated boilerplate is kept once."""
+        first = fake_engine.ingest_json(sample_json_file)
+        version = fake_engine.index_version
+
+        again = QAEngine(settings=fake_engine.settings).ingest_json(sample_json_file)
+        assert QAEngine(settings=fake_engine.settings).index_version == version
+
+        fake_engine.settings.dedup_simhash_distance = 8
+        engine = QAEngine(settings=fake_engine.settings)
+        boilerplate = "All data is handled according to the vendor security policy and reviewed yearly."
+        repeated = engine.ingest_documents([
+            Document(page_content=boilerplate, metadata={"page": 1}),
+            Document(page_content=boilerplate.upper(), metadata={"page": 2}),
+            Document(page_content=boilerplate.replace("yearly", "annually"), metadata={"page": 3}),
+        ])
+
+        assert again["chunks_added"] == 0
+        assert again["duplicates_skipped"] == first["chunks_added"]
+        assert repeated["chunks_added"] == 1
+        assert repeated["duplicates_skipped"] == 1
+        assert repeated["near_duplicates_skipped"] == 1
+
+    def test_context_fits_model_window(self, fake_engine, sample_json_file):
+        """Only the chunks that fit llm_num_ctx reach the prompt; sources match them."""
+        fake_engine.ingest_json(sample_json_file)
+        fake_engine.settings.llm_num_ctx = 300
+        fake_engine.settings.context_answer_tokens = 100
+
+        result = fake_engine.answer("Which cloud provider is used?")
+
+        context = result["context"]
+        assert context["chunks_retrieved"] == 3
+        assert 0 < context["chunks_used"] < 3
+        assert context["tokens"] <= context["budget"] < 100
+        assert len(result["sources"]) == context["chunks_used"]
+
+    def test_delete_document_hides_chunks_until_compaction(self, fake_engine, sample_json_file):
+        """Deleted chunks are tombstoned across restarts and purged by compaction."""
+        fake_engine.settings.faiss_max_deleted_fraction = 1.0
+        fake_engine.settings.retrieval_k = 10
+        fake_engine.ingest_json(sample_json_file)
+        fake_engine.ingest_documents(
+            [Document(page_content="Vendor B hosts on GCP.", metadata={"source": "vendor-b.pdf"})],
+            document_id="vendor-b",
+        )
+
+        deleted = fake_engine.delete_document("vendor-b")
+        result = fake_engine.answer("Which cloud provider is used?")
+
+        assert deleted["chunks_deleted"] == 1
+        assert "Vendor B hosts on GCP." not in [s["text_snippet"] for s in result["sources"]]
+        assert [d["document_id"] for d in fake_engine.list_documents()] == [sample_json_file]
+        with pytest.raises(DocumentNotFound):
+            fake_engine.delete_document("vendor-b")
+
+        reloaded = QAEngine(settings=fake_engine.settings)
+        assert reloaded._snapshot.metadata.deleted_count == 1
+        assert [d["chunks"] for d in reloaded.list_documents()] == [3]
+
+        reloaded.compact()
+        assert reloaded.vector_store.index.ntotal == 3
+        assert QAEngine(settings=fake_engine.settings)._snapshot.metadata.deleted_count == 0
+
+    def test_upsert_document_embeds_only_changed_chunks(self, fake_engine, monkeypatch):
+        """Upserting replaces a document's chunks and reuses vectors of unchanged ones."""
+        fake_engine.settings.faiss_max_deleted_fraction = 1.0
+        fake_engine.settings.retrieval_k = 10
+        embedded = []
+        real_embed = engine_module.embed_documents
+        monkeypatch.setattr(
+            engine_module,
+            "embed_documents",
+            lambda docs, embeddings: embedded.extend(d.page_content for d in docs) or real_embed(docs, embeddings),
+        )
+        v1 = [
+            Document(page_content="Backups run nightly.", metadata={"source": "policy.pdf", "page": 1}),
+            Document(page_content="Data is stored in eu-west-1.", metadata={"source": "policy.pdf", "page": 2}),
+        ]
+        v2 = [v1[0].model_copy(deep=True), Document(
+            page_content="Data is stored in eu-central-1.", metadata={"source": "policy.pdf", "page": 2})]
+
+        fake_engine.upsert_document("policy", v1)
+        embedded.clear()
+        result = fake_engine.upsert_document("policy", v2)
+
+        assert embedded == ["Data is stored in eu-central-1."]
+        assert result["chunks_replaced"] == 2
+        assert result["chunks_reused"] == 1
+        assert result["chunks_added"] == 2
+        assert fake_engine.list_documents() == [
+            {"document_id": "policy", "chunks": 2, "source": "policy.pdf", "source_type": None}]
+        sources = fake_engine.answer("Where is data stored?")["sources"]
+        assert "Data is stored in eu-west-1." not in [s["text_snippet"] for s in sources]
+
+    def test_ingest_pdf_with_parse_workers(self, fake_engine, sample_pdf_file):
+        """PDFs parsed by a process pool are ingested page by page."""
+        fake_engine.settings.pdf_parse_workers = 2
+        fake_engine.settings.pdf_pages_per_task = 2
+
+        result = fake_engine.ingest_pdf(sample_pdf_file)
+
+        assert result["ingested_pages"] == 5
+        pages = {d.metadata["page"] for d in fake_engine.vector_store.docstore._dict.values()}
+        assert pages == {0, 1, 2, 3, 4}
+
+    def test_ingests_append_segments_and_compact(self, fake_engine):
+        """Each ingest adds one segment; a restarted engine sees the same index after compaction."""
+        fake_engine.settings.faiss_max_segments = 0
+        for text in ("First policy.", "Second policy.", "Third policy."):
+            fake_engine.ingest_documents([Document(page_content=text, metadata={})])
+
+        assert fake_engine.compact()["segments_merged"] == 3
+
+        reloaded = QAEngine(settings=fake_engine.settings)
+        assert reloaded.vector_store.index.ntotal == 3
+        assert reloaded.index_version == fake_engine.index_version
+
+    def test_concurrent_publishes_start_one_compaction(self, fake_engine, monkeypatch):
+        fake_engine.settings.faiss_max_segments = 0
+        for text in ("First policy.", "Second policy."):
+            fake_engine.ingest_documents([Document(page_content=text, metadata={})])
+        fake_engine.settings.faiss_max_segments = 1
+        release, started = threading.Event(), []
+
+        def slow_compact():
+            started.append(True)
+            release.wait(5)
+
+        monkeypatch.setattr(fake_engine, "compact", slow_compact)
+        threads = [threading.Thread(target=fake_engine._maybe_compact) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert not fake_engine._compact_lock.acquire(blocking=False)
+        release.set()
+
+        # Released once the compaction finishes.
+        assert fake_engine._compact_lock.acquire(timeout=5)
+        assert len(started) == 1
+
+    def test_configured_index_type_is_persisted_and_rebuilt(self, fake_engine, sample_json_file):
+        """New indexes use faiss_index_type; rebuild_index converts an existing one in place."""
+        fake_engine.settings.faiss_index_type = "hnsw"
+        fake_engine.ingest_json(sample_json_file)
+        fake_engine.ingest_documents([Document(page_content="New policy text.", metadata={})])
+        assert index_type_of(QAEngine(settings=fake_engine.settings).vector_store.index) == "hnsw"
+
+        fake_engine.settings.faiss_index_type = "ivf"
+        fake_engine.settings.faiss_ivf_nlist = 2
+        fake_engine.settings.faiss_min_points_per_centroid = 1
+        result = fake_engine.rebuild_index()
+
+        assert result["index_type"] == "ivf"
+        reloaded = QAEngine(settings=fake_engine.settings)
+        assert index_type_of(reloaded.vector_store.index) == "ivf"
+        assert reloaded.answer("Which cloud provider is used?")["answer"] == "AWS"
+
+    def test_ivf_is_trained_once_enough_vectors_are_indexed(self, fake_engine, sample_json_file):
+        """Small segments stay flat; compaction trains IVF once the whole index is large enough."""
+        fake_engine.settings.faiss_index_type = "ivf"
+        fake_engine.settings.faiss_ivf_nlist = 2
+        fake_engine.settings.faiss_min_points_per_centroid = 2
+        fake_engine.ingest_json(sample_json_file)
+        assert index_type_of(fake_engine.vector_store.index) == "flat"
+
+        fake_engine.ingest_documents([Document(page_content="New policy text.", metadata={})])
+        version = fake_engine.index_version
+        fake_engine.compact()
+
+        assert index_type_of(fake_engine.vector_store.index) == "ivf"
+        assert fake_engine.index_version != version
+        assert fake_engine.answer("Which cloud provider is used?")["answer"] == "AWS"
+
+    def test_compressed_index_with_exact_rerank(self, fake_engine, sample_json_file, temp_dir):
+        """SQ8 storage shrinks vectors 4x; re-ranking keeps answers working."""
+        fake_engine.settings.faiss_compression = "sq8"
+        fake_engine.settings.faiss_rerank = True
+        fake_engine.settings.faiss_full_vectors_path = f"{temp_dir}/full_vectors.sqlite"
+        engine = QAEngine(settings=fake_engine.settings)
+
+        result = engine.ingest_json(sample_json_file)
+
+        assert result["bytes_per_vector"] == 32
+        assert len(engine.full_vectors) == result["chunks_added"]
+        assert engine.answer("Which cloud provider is used?")["sources"]
+
+    def test_hybrid_retrieval_uses_persisted_lexical_index(self, fake_engine, sample_json_file):
+        """The BM25 index is saved with each segment and reloaded on restart."""
+        fake_engine.ingest_json(sample_json_file)
+        fake_engine.ingest_documents([Document(page_content="Backups use AES-256.", metadata={})])
+        fake_engine.settings.retrieval_type = "hybrid"
+        fake_engine.settings.retrieval_k = 1
+
+        reloaded = QAEngine(settings=fake_engine.settings)
+
+        assert len(reloaded._snapshot.lexical) == reloaded.vector_store.index.ntotal
+        result = reloaded.answer("Which cipher protects backups, AES-256?")
+        assert result["sources"][0]["text_snippet"] == "Backups use AES-256."
+
+    def test_filters_scope_answers_to_one_document(self, fake_engine, sample_json_file):
+        """Filtered questions only see matching chunks and are cached separately."""
+        fake_engine.ingest_json(sample_json_file)
+        fake_engine.ingest_documents(
+            [Document(page_content="Vendor B hosts on GCP.", metadata={"source": "vendor-b.pdf", "page": 3})])
+
+        result = fake_engine.answer(
+            "Which cloud provider is used?", filters={"source": "vendor-b.pdf", "page": {"gte": 1}})
+        unfiltered = fake_engine.answer("Which cloud provider is used?")
+
+        assert [s["text_snippet"] for s in result["sources"]] == ["Vendor B hosts on GCP."]
+        assert not unfiltered.get("cached")
+        reloaded = QAEngine(settings=fake_engine.settings)
+        assert len(reloaded._snapshot.metadata) == reloaded.vector_store.index.ntotal
+        with pytest.raises(ValueError, match="Cannot filter"):
+            fake_engine.answer("Which cloud provider is used?", filters={"author": "x"})
+
+    async def test_async_ingest_and_answer(self, fake_engine, sample_json_file):
+        """The async API should ingest and answer like the sync one."""
+        result = await fake_engine.aingest_json(sample_json_file)
+        assert result["chunks_added"] > 0
+
+        answer = await fake_engine.aanswer("Which cloud provider is used?")
+        assert answer["answer"] == "AWS"
+        assert answer["sources"]
+
+    async def test_async_answers_use_the_answer_cache_off_the_event_loop(self, fake_engine, sample_json_file, monkeypatch):
+        fake_engine.ingest_json(sample_json_file)
+        cache, threads = fake_engine.answer_cache, []
+        for name in ("get", "put"):
+            def record(*args, _call=getattr(cache, name)):
+                threads.append(threading.current_thread())
+                return _call(*args)
+            monkeypatch.setattr(cache, name, record)
+
+        await fake_engine.aanswer("Which cloud provider is used?")
+        cached = await fake_engine.aanswer("Which cloud provider is used?")
+        await fake_engine.aanswer_many(["What is the company name?"])
+
+        assert cached["cached"] is True
+        assert len(threads) == 5
+        assert threading.main_thread() not in threads
+
+    async def test_async_ingest_dedups_and_reuses_vectors_off_the_event_loop(self, fake_engine, sample_json_file, monkeypatch):
+        threads = []
+        for name in ("_unique", "_reusable"):
+            def record(*args, _call=getattr(fake_engine, name)):
+                threads.append(threading.current_thread())
+                return _call(*args)
+            monkeypatch.setattr(fake_engine, name, record)
+
+        await fake_engine.aingest_json(sample_json_file)
+
+        assert len(threads) == 2
+        assert threading.main_thread() not in threads
+
+    async def test_aanswer_many_keeps_input_order(self, fake_engine, sample_json_file):
+        """Async batch results come back in input order."""
+        await fake_engine.aingest_json(sample_json_file)
+        questions = ["What is the company name?", "Which cloud provider is used?"]
+
+        results = await fake_engine.aanswer_many(questions, max_concurrency=2)
+
+        assert [r["question"] for r in results] == questions
+
+    def test_stream_answer_sends_sources_tokens_then_done(self, fake_engine, sample_json_file):
+        """Streaming yields sources before any tokens and finishes with timings."""
+        fake_engine.ingest_json(sample_json_file)
+
+        events = list(fake_engine.stream_answer("Which cloud provider is used?"))
+
+        assert events[0]["event"] == "sources"
+        assert events[0]["data"]["sources"]
+        assert events[-1]["event"] == "done"
+        assert events[-1]["data"]["answer"] == "AWS"
+        assert "first_token_ms" in events[-1]["data"]["timings"]
+        tokens = [e["data"] for e in events if e["event"] == "token"]
+        assert "".join(tokens) == "AWS"
+
+    async def test_astream_answer_populates_answer_cache(self, fake_engine, sample_json_file):
+        """A streamed answer is cached for later non-streaming calls."""
+        await fake_engine.aingest_json(sample_json_file)
+
+        events = [e async for e in fake_engine.astream_answer("Which cloud provider is used?")]
+
+        assert events[-1]["data"]["answer"] == "AWS"
+        assert fake_engine.answer("Which cloud provider is used?")["cached"] is True
@@ -1,5 +1,41 @@
+import numpy as np
 import pytest
-from docqa.retrieval.retriever import _distance_to_relevance
+from pathlib import Path
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from docqa.cache import QueryEmbeddingCache
+from docqa.config import Settings
+from docqa.indexing import BM25Index, FullVectorStore, MetadataIndex, rebuild_faiss
+from docqa.indexing.ann import index_vectors
+from docqa.retrieval.retriever import (
+    _distance_to_relevance,
+    mmr_select,
+    reciprocal_rank_fusion,
+    retrieve,
+    retrieve_many,
+)
+
+
+class CountingQueryEmbeddings(DeterministicFakeEmbedding):
+    """Deterministic fake embeddings that count query embedding calls."""
+
+    query_calls: int = 0
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return super().embed_query(text)
+
+
+@pytest.fixture
+def fake_store():
+    texts = [
+        "The company uses AWS as its primary cloud provider.",
+        "Customer data is encrypted at rest with AES-256.",
+        "Access reviews are performed quarterly.",
+    ]
+    metadatas = [{"source": f"doc-{i}.pdf"} for i in range(len(texts))]
+    return FAISS.from_texts(texts, CountingQueryEmbeddings(size=16), metadatas=metadatas)
 
 
 @pytest.mark.unit
@@ -32,4 +68,118 @@ class TestRetriever:
         """Test that relevance is always in (0, 1]."""
         for distance in [0.0, 0.1, 0.5, 1.0, 5.0, 10.0]:
             relevance = _distance_to_relevance(distance)
-            assert 0 < relevance <= 1.0
\ No newline at end of file
+            assert 0 < relevance <= 1.0
+
+    @pytest.mark.parametrize("retrieval_type", ["similarity", "mmr", "similarity_score_threshold"])
+    def test_retrieve_reuses_cached_query_vector(self, fake_store, retrieval_type):
+        """Every retrieval mode should embed a repeated query only once."""
+        settings = Settings(retrieval_type=retrieval_type, retrieval_k=2, retrieval_fetch_k=3)
+        cache = QueryEmbeddingCache(fake_store.embeddings, namespace="fake:test")
+
+        first, _ = retrieve(fake_store, "Which cloud provider?", settings, query_cache=cache)
+        second, _ = retrieve(fake_store, "Which cloud provider?", settings, query_cache=cache)
+
+        assert fake_store.embeddings.query_calls == 1
+        assert [d.page_content for d in first] == [d.page_content for d in second]
+
+    @pytest.mark.parametrize("retrieval_type", ["similarity", "mmr", "similarity_score_threshold", "hybrid"])
+    @pytest.mark.parametrize("filters", [None, {"source": ["doc-0.pdf", "doc-1.pdf"]}])
+    def test_retrieve_many_matches_retrieve(self, fake_store, retrieval_type, filters):
+        """The batched path returns what per-question retrieval returns, in input order."""
+        settings = Settings(retrieval_type=retrieval_type, retrieval_k=2, retrieval_fetch_k=3)
+        options = {
+            "lexical": BM25Index.from_store(fake_store),
+            "metadata": MetadataIndex.from_store(["source"], fake_store),
+            "filters": filters,
+        }
+        queries = ["Which cloud provider?", "AES-256 encryption", "Which cloud provider?"]
+
+        batch = retrieve_many(fake_store, queries, settings, **options)
+
+        for query, (docs, scores) in zip(queries, batch):
+            single_docs, single_scores = retrieve(fake_store, query, settings, **options)
+            assert [d.page_content for d in docs] == [d.page_content for d in single_docs]
+            assert scores == pytest.approx(single_scores)
+
+    def test_rerank_restores_exact_order(self, fake_store, temp_dir):
+        """Candidates from a coarse PQ index are re-scored against full vectors."""
+        # PQ trains 256 centroids per sub-quantizer: pad the index with distant noise.
+        noise = np.random.default_rng(0).standard_normal((300, 16)) * 10
+        fake_store.add_embeddings(zip([f"noise {i}" for i in range(300)], noise.tolist()))
+        full = FullVectorStore(Path(temp_dir) / "full.sqlite")
+        ids = [fake_store.index_to_docstore_id[i] for i in range(fake_store.index.ntotal)]
+        full.put_many(ids, index_vectors(fake_store.index))
+        compressed = rebuild_faiss(fake_store, "flat", compression="pq", pq_m=2, min_points_per_centroid=1)
+        settings = Settings(retrieval_k=2, faiss_rerank_factor=2)
+        query = "Access reviews are performed quarterly."
+
+        exact, exact_scores = retrieve(fake_store, query, settings)
+        reranked, reranked_scores = retrieve(compressed, query, settings, full_vectors=full)
+        full.close()
+
+        assert [d.page_content for d in reranked] == [d.page_content for d in exact]
+        assert reranked_scores == pytest.approx(exact_scores)
+
+    def test_mmr_select_skips_near_duplicates(self):
+        vectors = np.array([[1.0, 0.0], [0.99, 0.01], [0.6, 0.8]], dtype=np.float32)
+
+        assert mmr_select(np.array([1.0, 0.0]), vectors, k=2, lambda_mult=0.3) == [0, 2]
+        assert mmr_select(np.array([1.0, 0.0]), vectors, k=2, lambda_mult=1.0) == [0, 1]
+        assert mmr_select(np.array([1.0, 0.0]), vectors, k=5, lambda_mult=0.3) == [0, 2, 1]
+
+    def test_mmr_returns_scores_and_k_docs(self, fake_store):
+        """MMR scores match similarity scores."""
+        query = "Access reviews are performed quarterly."
+        settings = Settings(retrieval_type="mmr", retrieval_k=3, retrieval_fetch_k=3)
+
+        docs, scores = retrieve(fake_store, query, settings)
+        similar, similar_scores = retrieve(fake_store, query, Settings(retrieval_k=3))
+
+        assert len(docs) == 3
+        assert docs[0].page_content == query
+        assert dict(zip([d.page_content for d in docs], scores)) == pytest.approx(
+            dict(zip([d.page_content for d in similar], similar_scores)))
+
+    def test_reciprocal_rank_fusion_rewards_agreement(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "b"]], k=2, rrf_k=60)
+
+        assert [doc_id for doc_id, _ in fused] == ["c", "b"]
+
+    def test_hybrid_finds_exact_terms(self, fake_store):
+        """Lexical matches are fused in even when the dense ranking misses them."""
+        settings = Settings(retrieval_type="hybrid", retrieval_k=1, retrieval_fetch_k=3)
+        lexical = BM25Index.from_store(fake_store)
+
+        docs, scores = retrieve(fake_store, "AES-256", settings, lexical=lexical)
+
+        assert docs[0].page_content == "Customer data is encrypted at rest with AES-256."
+        assert len(scores) == 1
+
+    def test_hybrid_requires_lexical_index(self, fake_store):
+        with pytest.raises(ValueError, match="lexical index"):
+            retrieve(fake_store, "AES-256", Settings(retrieval_type="hybrid"))
+
+    @pytest.mark.parametrize("retrieval_type", ["similarity", "mmr", "hybrid"])
+    def test_filters_restrict_every_mode(self, fake_store, retrieval_type):
+        settings = Settings(retrieval_type=retrieval_type, retrieval_k=2, retrieval_fetch_k=3)
+        metadata = MetadataIndex.from_store(["source"], fake_store)
+
+        docs, _ = retrieve(
+            fake_store,
+            "AES-256",
+            settings,
+            lexical=BM25Index.from_store(fake_store),
+            metadata=metadata,
+            filters={"source": ["doc-0.pdf", "doc-2.pdf"]},
+        )
+
+        assert docs
+        assert {d.metadata["source"] for d in docs} <= {"doc-0.pdf", "doc-2.pdf"}
+
+    def test_filters_matching_nothing_return_no_docs(self, fake_store):
+        metadata = MetadataIndex.from_store(["source"], fake_store)
+
+        docs, scores = retrieve(
+            fake_store, "AWS", Settings(), metadata=metadata, filters={"source": "other.pdf"})
+
+        assert docs == [] and scores == []
@@ -54,6 +54,14 @@ class TestSettings:
         with pytest.raises(ValueError, match="retrieval_k must be > 0"):
             settings.validate()
 
+    def test_settings_validate_fetch_k_below_retrieval_k(self):
+        """Test validation fails when MMR / hybrid would fetch fewer candidates than they return."""
+        assert Settings().retrieval_fetch_k > Settings().retrieval_k
+        settings = Settings(retrieval_k=10, retrieval_fetch_k=5)
+
+        with pytest.raises(ValueError, match="retrieval_fetch_k must be >= retrieval_k"):
+            settings.validate()
+
     def test_settings_validate_invalid_chunk_size(self):
         """Test validation fails with invalid chunk_size."""
         settings = Settings(chunk_size=0)